@@ -0,0 +1,130 @@
+"""
+Rows/sec of the row-wise vs Arrow-batch QUARTER/ORIGIN filter behind /api/download.
+
+    cd azure_func
+    python -m benchmarks.bench_download_filter --rows 400000
+    python -m benchmarks.bench_download_filter --csv out/t100/year=2024/updated/T_..._with_metrics.csv
+
+Builds a synthetic full-year curated file (or uses --csv), feeds it to both
+readers in blob-sized chunks, and checks that the CSV each one writes is
+byte-identical for a quarter filter and for a single-origin filter.
+"""
+import argparse, csv, io, tempfile, time
+from pathlib import Path
+from typing import Iterable, Iterator, Set
+
+from benchmarks.bench_t100_transform import make_csv
+from pipeline import row_filter
+from pipeline.t100.transform_helper import add_columns
+
+# StorageStreamDownloader's default chunk size
+CHUNK = 4 << 20
+
+
+def _chunks(data: bytes):
+    for i in range(0, len(data), CHUNK):
+        yield data[i:i + CHUNK]
+
+
+# ---------- Row-wise reference (the download path before Arrow batches) ----------
+
+def iter_lines_rowwise(chunks: Iterable[bytes], encoding: str = "utf-8") -> Iterator[str]:
+    """Original download_t100._stream_blob_lines body (buf += chunk, re-split)."""
+    buf = b""
+    for chunk in chunks:
+        buf += chunk
+        parts = buf.split(b"\n")
+        for line in parts[:-1]:
+            yield line.decode(encoding, errors="replace")
+        buf = parts[-1]
+    if buf:
+        yield buf.decode(encoding, errors="replace")
+
+def iter_dictrows_rowwise(lines: Iterable[str]) -> Iterator[dict]:
+    """Original download_t100._iter_csv_dictrows body."""
+    line_iter = iter(lines)
+    try:
+        header_line = next(line_iter)
+    except StopIteration:
+        return
+    headers = next(csv.reader([header_line]))
+    for line in line_iter:
+        for row_values in csv.reader([line]):
+            if len(row_values) != len(headers):
+                row_values = (row_values + [""] * len(headers))[:len(headers)]
+            yield dict(zip(headers, row_values))
+
+def filter_rows_rowwise(rows: Iterable[dict], quarters: Set[str], origin: str) -> Iterator[dict]:
+    """Original QUARTER/ORIGIN filter from download_t100.download."""
+    for row in rows:
+        qcol = "QUARTER" if "QUARTER" in row else ("Quarter" if "Quarter" in row else None)
+        if qcol and str(row.get(qcol, "")).strip() not in quarters:
+            continue
+        if origin != "ALL":
+            ocol = "ORIGIN" if "ORIGIN" in row else ("Origin" if "Origin" in row else None)
+            if ocol and row.get(ocol, "").upper() != origin:
+                continue
+        yield row
+
+
+def rowwise(data: bytes, quarters: set, origin: str) -> bytes:
+    out = io.StringIO()
+    writer = None
+    lines = iter_lines_rowwise(_chunks(data))
+    for row in filter_rows_rowwise(iter_dictrows_rowwise(lines), quarters, origin):
+        if writer is None:
+            writer = csv.DictWriter(out, fieldnames=list(row.keys()), lineterminator="\n",
+                                    extrasaction="ignore")
+            writer.writeheader()
+        writer.writerow(row)
+    return out.getvalue().encode("utf-8")
+
+
+def columnar(data: bytes, quarters: set, origin: str) -> bytes:
+    out = io.BytesIO()
+    writer = row_filter.CsvBatchWriter(out)
+    source = row_filter.ChunkReader(_chunks(data))
+    for columns, arrays in row_filter.filter_csv_batches(source, quarters=quarters, origin=origin):
+        writer.write(columns, arrays)
+    return out.getvalue()
+
+
+def _time(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return time.perf_counter() - t0, out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--rows", type=int, default=400_000)
+    ap.add_argument("--csv", type=Path, default=None, help="use a real curated CSV instead")
+    ap.add_argument("--origin", default="ATL")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as td:
+        td = Path(td)
+        if args.csv is None:
+            make_csv(td / "raw.csv", args.rows)
+            add_columns(td / "raw.csv", td / "curated.csv")
+            path = td / "curated.csv"
+        else:
+            path = args.csv
+        data = path.read_bytes()
+        rows = data.count(b"\n") - 1
+        print(f"rows            {rows:,}  ({len(data) / 1e6:.0f} MB)")
+
+        for label, quarters, origin in (("Q1, all origins", {"1"}, "ALL"),
+                                         (f"Q1-4, {args.origin}", {"1", "2", "3", "4"}, args.origin)):
+            old_s, old = _time(rowwise, data, quarters, origin)
+            new_s, new = _time(columnar, data, quarters, origin)
+            out_rows = old.count(b"\n") - 1
+            print(f"-- {label}: {out_rows:,} rows out")
+            print(f"row-wise        {old_s:8.2f}s  {rows / old_s:12,.0f} rows/s")
+            print(f"arrow batches   {new_s:8.2f}s  {rows / new_s:12,.0f} rows/s")
+            print(f"speedup         {old_s / new_s:8.2f}x")
+            print(f"identical       {old == new}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Per-year airport x quarter counting time, nested dicts vs dense arrays.
+
+    cd azure_func
+    python -m benchmarks.bench_manifest_counts --rows 450000 --files 4
+    python -m benchmarks.bench_manifest_counts --csv out/t100/year=2024/updated/T_..._with_metrics.csv
+
+Builds a synthetic year (`--files` curated CSVs over `--airports` origin
+codes, or uses --csv files), then counts and merges it the way the manifest
+build used to (groupby + Python dict updates per chunk and per file) and the
+way it does now (dictionary codes, bincount, one to_dict() per year), and
+checks that both give the same year entry.
+"""
+import argparse, io, tempfile, time
+from pathlib import Path
+from typing import Sequence
+
+import pandas as pd
+
+import benchmarks.bench_t100_transform as t100
+from pipeline import airport_counts
+from pipeline.airport_counts import AIRPORT_COL, QUARTER_COL, QUARTERS, AirportQuarterCounts
+
+# rows per pandas chunk in the row-wise reference
+CSV_CHUNK_ROWS = 200_000
+
+
+# ---------- Row-wise reference (the manifest count before dense arrays) ----------
+
+def count_csv_rowwise(csv_bytes: bytes) -> dict:
+    """Original nested-dict counter (groupby + Python loop per chunk)."""
+    acc: dict[str, dict] = {}
+    for chunk in pd.read_csv(io.BytesIO(csv_bytes), usecols=[AIRPORT_COL, QUARTER_COL],
+                             chunksize=CSV_CHUNK_ROWS, dtype={QUARTER_COL: "Int64"}):
+        chunk = chunk.dropna(subset=[AIRPORT_COL, QUARTER_COL])
+        chunk[QUARTER_COL] = chunk[QUARTER_COL].astype("int64").astype(str)
+        gb = chunk.groupby([AIRPORT_COL, QUARTER_COL]).size()
+        for (airport, q), cnt in gb.items():
+            if airport not in acc:
+                acc[airport] = {"total": 0, "quarters": {"1": 0, "2": 0, "3": 0, "4": 0}}
+            acc[airport]["quarters"][q] += int(cnt)
+            acc[airport]["total"] += int(cnt)
+    return acc
+
+def merge_rowwise(per_file: Sequence[dict]) -> dict:
+    """Original per-year merge of nested-dict counts."""
+    year_map: dict[str, dict] = {}
+    for per_blob in per_file:
+        for airport, vals in per_blob.items():
+            if airport not in year_map:
+                year_map[airport] = {"total": 0, "quarters": {"1": 0, "2": 0, "3": 0, "4": 0}}
+            year_map[airport]["total"] += vals["total"]
+            for q in QUARTERS:
+                year_map[airport]["quarters"][q] += vals["quarters"].get(q, 0)
+    return year_map
+
+
+def nested(files: list) -> dict:
+    return merge_rowwise([count_csv_rowwise(data) for data in files])
+
+
+def dense(files: list) -> dict:
+    year = AirportQuarterCounts()
+    for data in files:
+        year.merge(airport_counts.count_csv(io.BytesIO(data)))
+    return year.to_dict()
+
+
+def _time(fn, *args):
+    best, out = None, None
+    for _ in range(3):
+        t0 = time.perf_counter()
+        out = fn(*args)
+        took = time.perf_counter() - t0
+        best = took if best is None else min(best, took)
+    return best, out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--rows", type=int, default=450_000, help="rows per synthetic file")
+    ap.add_argument("--files", type=int, default=4)
+    ap.add_argument("--airports", type=int, default=1300, help="distinct ORIGIN codes")
+    ap.add_argument("--csv", type=Path, nargs="*", default=None, help="use real curated CSVs instead")
+    args = ap.parse_args()
+
+    if args.csv:
+        files = [p.read_bytes() for p in args.csv]
+    else:
+        # T-100 years carry ~1,300 origins; make_csv picks from its AIRPORTS list
+        t100.AIRPORTS = [f"{chr(65 + i // 676)}{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}"
+                         for i in range(args.airports)]
+        files = []
+        with tempfile.TemporaryDirectory() as td:
+            for i in range(args.files):
+                path = Path(td) / f"f{i}.csv"
+                t100.make_csv(path, args.rows, seed=i)
+                files.append(path.read_bytes())
+
+    rows = sum(data.count(b"\n") - 1 for data in files)
+    print(f"year            {len(files)} file(s), {rows:,} rows ({sum(map(len, files)) / 1e6:.0f} MB)")
+    old_s, old = _time(nested, files)
+    new_s, new = _time(dense, files)
+    print(f"nested dicts    {old_s:8.2f}s  {rows / old_s:12,.0f} rows/s")
+    print(f"dense arrays    {new_s:8.2f}s  {rows / new_s:12,.0f} rows/s")
+    print(f"speedup         {old_s / new_s:8.2f}x")
+    print(f"identical       {old == new}  ({len(new)} airports)")
+
+
+if __name__ == "__main__":
+    main()
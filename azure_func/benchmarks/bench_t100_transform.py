@@ -0,0 +1,110 @@
+"""
+Rows/sec of the row-wise vs columnar T-100 ASM/RPM transform.
+
+    cd azure_func
+    python -m benchmarks.bench_t100_transform --rows 500000
+
+Generates a synthetic T-100 segment CSV (all FIELDS, quoted city names,
+thousands separators and blanks), runs both implementations on it and checks
+that they produce byte-identical output.
+"""
+import argparse, csv, random, tempfile, time
+from pathlib import Path
+
+from pipeline.t100.fetch import FIELDS
+from pipeline.t100.transform_helper import add_columns
+
+AIRPORTS = ["ATL", "DFW", "DEN", "ORD", "LAX", "JFK", "SEA", "ANC", "HNL", "BOS"]
+
+
+def add_columns_rowwise(source_path: Path, new_path: Path) -> None:
+    """The original DictReader/DictWriter transform, the reference add_columns() must match."""
+    new_path.parent.mkdir(parents=True, exist_ok=True)
+    with source_path.open("r", newline='', encoding="utf-8") as source_file, \
+        new_path.open("w", newline= '', encoding="utf-8") as new_file:
+        reader = csv.DictReader(source_file)
+        existing_columns = list(reader.fieldnames or [])
+        for newcol in ("ASM", "RPM"):
+            if newcol not in existing_columns:
+                existing_columns.append(newcol)
+        writer = csv.DictWriter(new_file, fieldnames=existing_columns)
+        writer.writeheader()
+
+        for row in reader:
+            # robust parse: handles "0.00", "1,234", blanks
+            def num(s):
+                if s is None: return 0.0
+                s = s.strip().replace(",", "")
+                if s == "": return 0.0
+                try:
+                    return float(s)
+                except ValueError:
+                    return 0.0
+
+            seats = num(row.get("SEATS"))
+            pax   = num(row.get("PASSENGERS"))
+            dist  = num(row.get("DISTANCE"))
+
+            asm = seats * dist
+            rpm = pax * dist
+            row["ASM"] = str(int(round(asm)))
+            row["RPM"] = str(int(round(rpm)))
+
+            writer.writerow(row)
+
+
+def make_csv(path: Path, rows: int, seed: int = 7) -> None:
+    rnd = random.Random(seed)
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(FIELDS)
+        for _ in range(rows):
+            # every column populated, like a real segment file
+            row = {k: str(rnd.randint(0, 99999)) for k in FIELDS}
+            row["DATA_SOURCE"] = ""
+            row["SEATS"] = rnd.choice(["", "0.00", f"{rnd.randint(0, 9000):,}", str(rnd.randint(0, 400))])
+            row["PASSENGERS"] = f"{rnd.uniform(0, 5000):.2f}"
+            row["DISTANCE"] = rnd.choice([" 1,024.00", "733.00", str(rnd.randint(1, 5000)), ""])
+            row["ORIGIN"] = rnd.choice(AIRPORTS)
+            row["DEST"] = rnd.choice(AIRPORTS)
+            row["ORIGIN_CITY_NAME"] = "Dallas/Fort Worth, TX"
+            row["CARRIER"] = rnd.choice(["AA", "DL", "UA", "WN"])
+            row["YEAR"] = "2024"
+            row["MONTH"] = str(rnd.randint(1, 12))
+            row["QUARTER"] = str((int(row["MONTH"]) - 1) // 3 + 1)
+            w.writerow([row[k] for k in FIELDS])
+
+
+def _time(fn, src: Path, dst: Path) -> float:
+    t0 = time.perf_counter()
+    fn(src, dst)
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--csv", type=Path, default=None, help="use a real curated/raw CSV instead")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as td:
+        td = Path(td)
+        src = args.csv or td / "src.csv"
+        if args.csv is None:
+            make_csv(src, args.rows)
+        with src.open("rb") as f:
+            rows = sum(1 for _ in f) - 1
+
+        old_s = _time(add_columns_rowwise, src, td / "rowwise.csv")
+        new_s = _time(add_columns, src, td / "columnar.csv")
+
+        same = (td / "rowwise.csv").read_bytes() == (td / "columnar.csv").read_bytes()
+        print(f"rows            {rows:,}")
+        print(f"row-wise        {old_s:8.2f}s  {rows / old_s:12,.0f} rows/s")
+        print(f"columnar        {new_s:8.2f}s  {rows / new_s:12,.0f} rows/s")
+        print(f"speedup         {old_s / new_s:8.2f}x")
+        print(f"identical       {same}")
+
+
+if __name__ == "__main__":
+    main()
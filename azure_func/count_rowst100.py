@@ -1,83 +1,156 @@
 # azure_func/row_count.py
 import io
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
-import pandas as pd
+from itertools import chain
+from typing import BinaryIO
 from .function_app import app
+from .pipeline import airport_counts, metric_cube
+from .pipeline.airport_counts import AirportQuarterCounts
+from .pipeline.row_filter import ChunkReader
 
 
-AIRPORT_COL = "ORIGIN"
-QUARTER_COL = "QUARTER"  # values 1..4
+AIRPORT_COL = airport_counts.AIRPORT_COL
+QUARTER_COL = airport_counts.QUARTER_COL  # values 1..4
+
+def _counts_from_bytes(data: bytes, *, source_name: str) -> AirportQuarterCounts:
+    if data[:4] == b"PAR1":
+        # Parquet tier: read just the two columns
+        return airport_counts.count_parquet(data)
+    return airport_counts.count_csv(io.BytesIO(data), source_name=source_name)
+
+def _counts_from_stream(stream: BinaryIO, *, source_name: str) -> AirportQuarterCounts:
+    head = stream.read(4)
+    if head == b"PAR1":
+        return airport_counts.count_parquet(head + stream.read())
+    # put the sniffed bytes back in front of the rest for the CSV reader
+    rest = iter(lambda: stream.read(1 << 20), b"")
+    return airport_counts.count_csv(io.BufferedReader(ChunkReader(chain([head], rest))),
+                                    source_name=source_name)
 
 def airport_quarter_counts_from_bytes(csv_bytes: bytes, *, source_name: str = "<memory>") -> dict:
     """
     Returns a dict of counts like:
       { "JFK": {"total": 123, "quarters": {"1": 30, "2": 31, "3": 29, "4": 33}}, ... }
+    Accepts a curated CSV or a Parquet-tier file (detected by its PAR1 magic).
     """
-    acc: dict[str, dict] = {}
-
-    for chunk in pd.read_csv(
-        io.BytesIO(csv_bytes),
-        usecols=[AIRPORT_COL, QUARTER_COL],
-        chunksize=200_000,
-        dtype={QUARTER_COL: "Int64"},
-    ):
-        if AIRPORT_COL not in chunk.columns or QUARTER_COL not in chunk.columns:
-            raise ValueError(f"Missing '{AIRPORT_COL}' or '{QUARTER_COL}' in {source_name}")
+    return _counts_from_bytes(csv_bytes, source_name=source_name).to_dict()
 
-        chunk = chunk.dropna(subset=[AIRPORT_COL, QUARTER_COL])
-        chunk[QUARTER_COL] = chunk[QUARTER_COL].astype("int64").astype(str)
-
-        gb = chunk.groupby([AIRPORT_COL, QUARTER_COL]).size()
-        for (airport, q), cnt in gb.items():
-            if airport not in acc:
-                acc[airport] = {"total": 0, "quarters": {"1": 0, "2": 0, "3": 0, "4": 0}}
-            acc[airport]["quarters"][q] += int(cnt)
-            acc[airport]["total"] += int(cnt)
-
-    return acc
+def airport_quarter_counts_from_stream(stream: BinaryIO, *, source_name: str = "<stream>") -> dict:
+    """
+    airport_quarter_counts_from_bytes() over a readable binary stream. CSVs
+    are counted chunk by chunk as they are read, so only one chunk is held;
+    Parquet needs random access and is read whole.
+    """
+    return _counts_from_stream(stream, source_name=source_name).to_dict()
 
 
 def build_manifest_from_provider(
     years: list[int],
     list_files_for_year,     # callable: (year) -> list[str]
     load_file_bytes,         # callable: (name) -> bytes
+    file_version=None,       # optional callable: (name) -> str, e.g. the blob's ETag
+    count_cache: dict | None = None,   # {name: {"version": str, "counts": compact counts}}, updated in place
+    precounted=None,         # optional callable: (name) -> counts dict or None, e.g. an ingest sidecar
+    open_file=None,          # optional callable: (name) -> readable binary stream, used instead of load_file_bytes
+    workers: int = 1,
 ) -> dict:
     """
     Build the manifest using storage-agnostic callbacks.
-    list_files_for_year(year) should return CSV keys/paths.
+    list_files_for_year(year) should return CSV or Parquet-tier keys/paths.
     load_file_bytes(name) should return the file contents as bytes.
-    """
-    manifest = {"generated_at": date.today().isoformat(), "key": AIRPORT_COL, "years": []}
 
-    for y in years:
-        files = list_files_for_year(y)
-        if not files:
-            continue
+    With file_version and count_cache, a file whose version matches its
+    cache entry is not loaded again; its cached counts are merged instead.
+    Recounted files get their entry replaced (AirportQuarterCounts.to_compact()).
+    Entries for files that were not listed are left alone (see prune_count_cache).
 
-        year_map: dict[str, dict] = {}
-        year_total = 0
+    precounted(name) is asked before a file is loaded; a dict it returns is
+    used as the file's counts (and cached like a recount).
 
-        for name in files:
-            data = load_file_bytes(name)
-            per_blob = airport_quarter_counts_from_bytes(data, source_name=name)
+    Files are counted by up to `workers` threads; with open_file each one
+    streams its file through the chunked counter instead of loading it.
+    Per-file counts stay dense arrays and are merged per year once all files
+    are done; the nested JSON shape is only built for the manifest.
+    """
+    manifest = {"generated_at": date.today().isoformat(), "key": AIRPORT_COL, "years": []}
 
-            for airport, vals in per_blob.items():
-                if airport not in year_map:
-                    year_map[airport] = {"total": 0, "quarters": {"1": 0, "2": 0, "3": 0, "4": 0}}
-                year_map[airport]["total"] += vals["total"]
-                for q in ("1", "2", "3", "4"):
-                    year_map[airport]["quarters"][q] += vals["quarters"].get(q, 0)
-                year_total += vals["total"]
+    def counts_for(name: str) -> AirportQuarterCounts:
+        version = file_version(name) if file_version else None
+        cached = count_cache.get(name) if (count_cache is not None and version) else None
+        if cached and cached.get("version") == version:
+            return AirportQuarterCounts.from_compact(cached["counts"])
+        per_blob = precounted(name) if precounted else None
+        if per_blob is not None:
+            counts = AirportQuarterCounts.from_dict(per_blob)
+        elif open_file is not None:
+            with open_file(name) as stream:
+                counts = _counts_from_stream(stream, source_name=name)
+        else:
+            counts = _counts_from_bytes(load_file_bytes(name), source_name=name)
+        if count_cache is not None and version:
+            count_cache[name] = {"version": version, "counts": counts.to_compact()}
+        return counts
+
+    listed = [(y, files) for y in years if (files := list_files_for_year(y))]
+    names = [name for _, files in listed for name in files]
+    if workers > 1 and len(names) > 1:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="manifest-count") as ex:
+            counts = dict(zip(names, ex.map(counts_for, names)))
+    else:
+        counts = {name: counts_for(name) for name in names}
+
+    for y, files in listed:
+        year = AirportQuarterCounts()
+        for name in files:
+            year.merge(counts[name])
 
         manifest["years"].append({
             "year": y,
-            "total_rows": year_total,
-            "airports": year_map,
+            "total_rows": year.total,
+            "airports": year.to_dict(),
         })
     return manifest
 
 
+def build_cubes_from_provider(
+    years: list[int],
+    list_files_for_year,     # callable: (year) -> list[str]; empty = nothing to (re)build
+    cube_for_file,           # callable: (name) -> metric cube table of that file
+    write_cube,              # callable: (year, table) -> None
+    workers: int = 1,
+) -> list[int]:
+    """
+    Year metric cubes (metric_cube.py) using storage-agnostic callbacks, the
+    way build_manifest_from_provider counts: each listed year's file cubes are
+    combined and handed to write_cube. Up to `workers` years are built at once,
+    so at most that many years of file cubes are held. Returns the years written.
+    """
+    def build(y: int) -> int | None:
+        files = list_files_for_year(y)
+        if not files:
+            return None
+        write_cube(y, metric_cube.combine(cube_for_file(name) for name in files))
+        return y
+
+    if workers > 1 and len(years) > 1:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="manifest-cube") as ex:
+            built = list(ex.map(build, years))
+    else:
+        built = [build(y) for y in years]
+    return [y for y in built if y is not None]
+
+
+def prune_count_cache(count_cache: dict, names) -> int:
+    """Drop entries for files not in `names` (deleted/replaced blobs); returns how many."""
+    keep = set(names)
+    gone = [n for n in count_cache if n not in keep]
+    for n in gone:
+        del count_cache[n]
+    return len(gone)
+
+
 def manifest_to_bytes(manifest: dict) -> bytes:
     """Serialize manifest to JSON bytes for uploading/writing."""
     return json.dumps(manifest, indent=2).encode("utf-8")
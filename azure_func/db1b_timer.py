@@ -2,18 +2,16 @@
 import os, logging
 from datetime import date, timedelta
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient, ContentSettings
+from azure.storage.blob import ContentSettings
 from .function_app import app
-from pipeline.db1bmarket.fetch import handle_year
+from pipeline import blob_clients
+from pipeline.db1bmarket.fetch import handle_year, run_quarters
 
 # ----- helpers --------------------------------
 #-------------------------------
 
 def _get_blob_service():
-    conn = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-    if not conn:
-        raise RuntimeError("AZURE_STORAGE_CONNECTION_STRING is not set")
-    return BlobServiceClient.from_connection_string(conn)
+    return blob_clients.service()
 
 
 def _ensure_container(container: str):
@@ -25,8 +23,7 @@ def _ensure_container(container: str):
 
 
 def _blob_exists(container: str, name: str) -> bool:
-    bsc = _get_blob_service()
-    bc = bsc.get_container_client(container)
+    bc = blob_clients.container(container)
     try:
         bc.get_blob_client(name).get_blob_properties()
         return True
@@ -35,8 +32,7 @@ def _blob_exists(container: str, name: str) -> bool:
 
 def _touch_blob(container: str, name: str):
     _ensure_container(container)
-    bsc = _get_blob_service()
-    bc = bsc.get_container_client(container)
+    bc = blob_clients.container(container)
     bc.upload_blob(name, b"", overwrite=True, content_settings=ContentSettings(content_type="application/octet-stream"))
 
 # ...imports as you have...
@@ -79,18 +75,18 @@ def Db1bMarketTimer(mytimer: func.TimerRequest) -> None:
         if not _blob_exists(container, marker_blob):
             logging.info("Starting one-time DB1B backfill for all years (resume-safe)...")
             _ensure_container(container)
-            bsc = _get_blob_service()
-            bc = bsc.get_container_client(container)
 
             start_year = 1993
             end_year = date.today().year
 
-            for y in range(start_year, end_year + 1):
-
-                handle_year(str(y), geography=geo, quarter="All")
+            # one pipeline across all years so downloads never wait on a year boundary
+            run_quarters(
+                [(y, q) for y in range(start_year, end_year + 1) for q in (1, 2, 3, 4)],
+                geography=geo,
+            )
 
             _touch_blob(container, marker_blob)
-            logger.info("🚀 %s: running handle_year for ALL quarters (geo=%s)", y, geo)
+            logger.info("🚀 backfilled %s-%s, all quarters (geo=%s)", start_year, end_year, geo)
             logging.info("Backfill complete; marker written. Future runs will skip backfill.")
         else:
             logging.info("Backfill marker found; skipping one-time backfill.")
@@ -1,69 +1,79 @@
 # download_t100.py
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio, random
 import azure.functions as func
-import os, io, csv, json, uuid, datetime, logging
-from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
+import os, io, json, datetime, logging
+from azure.core import MatchConditions
+from azure.storage.blob import generate_blob_sas, BlobSasPermissions
 from .function_app import app
+from .pipeline import aio_blobs, blob_clients, manifest_store, range_index, result_cache, row_filter
+from .pipeline.aio_blobs import AsyncBlockBlobWriter
+from .pipeline.t100.fetch import parse_columns
 
 EXCEL_MAX_ROWS = 1_000_000
 CONTAINER = os.getenv("BTS_CONTAINER", "bts-t100")
 
-MANIFEST_BLOB = "manifests/index.json"
-COUNTS_MANIFEST_BLOB = MANIFEST_BLOB
+MANIFEST_BLOB = manifest_store.MANIFEST_BLOB
 
-TMP_PREFIX = "tmp-downloads"
+# files read at once; their parsed batches wait in a queue of as many until written
+READ_WORKERS = int(os.getenv("DOWNLOAD_READ_WORKERS", "8"))
 
-# ---------- Blob clients ----------
-def _bsc():
-    conn = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-    if not conn:
-        raise RuntimeError("AZURE_STORAGE_CONNECTION_STRING is not set")
-    return BlobServiceClient.from_connection_string(conn)
 
+class _RowLimitExceeded(Exception):
+    pass
+
+# ---------- Blob clients ----------
 def _bc():
-    return _bsc().get_container_client(CONTAINER)
+    return blob_clients.container(CONTAINER)
 
-def _download_small(name: str) -> bytes:
-    return _bc().get_blob_client(name).download_blob().readall()
+def _abc():
+    # HTTP handlers run on the worker's event loop
+    return blob_clients.aio_container(CONTAINER)
 
-# ---------- Streaming CSV from blobs ----------
-def _stream_blob_lines(blob_name: str, *, encoding="utf-8", max_retries=3):
-    blob = _bc().get_blob_client(blob_name)
+# ---------- Filtered Arrow batches from blobs ----------
+async def _csv_blob_batches(blob_name: str, etag: str, quarters: set, origin: str, columns=None, *, max_retries=3):
+    """Matching rows of a curated CSV, parsed (in a thread) from the download chunks in Arrow batches."""
+    emitted = 0
     attempt = 0
-    while attempt < max_retries:
+    while True:
+        # a retry after rows went out resumes past them, so it must read the same version
+        kw = {"etag": etag, "match_condition": MatchConditions.IfNotModified} if emitted else {}
+        chunks = aio_blobs.iter_chunks(_abc(), blob_name, **kw)
         try:
-            downloader = blob.download_blob(max_concurrency=4)
-            buf = b""
-            for chunk in downloader.chunks():
-                buf += chunk
-                parts = buf.split(b"\n")
-                for line in parts[:-1]:
-                    yield line.decode(encoding, errors="replace")
-                buf = parts[-1]
-            if buf:
-                yield buf.decode(encoding, errors="replace")
+            source = row_filter.ChunkReader(aio_blobs.sync_chunks(chunks, asyncio.get_running_loop()))
+            batches = row_filter.filter_csv_batches(source, quarters=quarters, origin=origin, columns=columns)
+            # batch bounds follow the download chunks, so resume by rows, not batches
+            skip = emitted
+            async for names, arrays in aio_blobs.iter_in_thread(batches):
+                if skip >= len(arrays[0]):
+                    skip -= len(arrays[0])
+                    continue
+                if skip:
+                    arrays = [a.slice(skip) for a in arrays]
+                    skip = 0
+                emitted += len(arrays[0])
+                yield names, arrays
             return
         except Exception as e:
             attempt += 1
-            logging.warning(f"[stream_blob_lines] attempt {attempt}/{max_retries} failed for {blob_name}: {e}")
+            logging.warning(f"[csv_blob_batches] attempt {attempt}/{max_retries} failed for {blob_name}: {e}")
             if attempt >= max_retries:
-                logging.error(f"[stream_blob_lines] giving up after {max_retries} attempts on {blob_name}")
+                logging.error(f"[csv_blob_batches] giving up after {max_retries} attempts on {blob_name}")
                 raise
-            import time, random
-            time.sleep(random.uniform(2, 5))
-
-def _iter_csv_dictrows(blob_name: str):
-    line_iter = _stream_blob_lines(blob_name)
-    try:
-        header_line = next(line_iter)
-    except StopIteration:
+        finally:
+            await chunks.aclose()
+        await asyncio.sleep(random.uniform(2, 5))
+
+async def _ranged_batches(blob_name: str, etag: str, quarters: set, origin: str, columns=None):
+    """Rows of a sorted curated CSV read through its range index, or of the whole file if the index is unusable."""
+    data = await range_index.fetch_async(_abc(), blob_name, [origin], quarters, etag=etag)
+    if data is None:
+        async for batch in _csv_blob_batches(blob_name, etag, quarters, origin, columns):
+            yield batch
         return
-    headers = next(csv.reader([header_line]))
-    for line in line_iter:
-        for row_values in csv.reader([line]):
-            if len(row_values) != len(headers):
-                row_values = (row_values + [""] * len(headers))[:len(headers)]
-            yield dict(zip(headers, row_values))
+    # the ranges are exactly this origin's wanted quarters
+    batches = row_filter.filter_csv_batches(io.BytesIO(data), quarters=None, columns=columns)
+    async for batch in aio_blobs.iter_in_thread(batches):
+        yield batch
 
 # ---------- Inputs & preflight ----------
 def _parse_quarters(qstr: str):
@@ -72,52 +82,35 @@ def _parse_quarters(qstr: str):
     return {q.strip() for q in qstr.split(",") if q.strip() in {"1","2","3","4"}}
 
 def _sas_url(blob_name: str, hours=24):
-    bc = _bc()
+    bc = _abc()
     expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=hours)
     sas = generate_blob_sas(
         account_name=bc.account_name,
         container_name=bc.container_name,
         blob_name=blob_name,
-        account_key=_bsc().credential.account_key,
+        account_key=blob_clients.aio_service().credential.account_key,
         permission=BlobSasPermissions(read=True),
         expiry=expiry
     )
     return f"https://{bc.account_name}.blob.core.windows.net/{bc.container_name}/{blob_name}?{sas}"
 
-def _load_counts_manifest():
+async def _load_counts_manifest():
     try:
-        raw = _download_small(COUNTS_MANIFEST_BLOB)
-        return json.loads(raw.decode("utf-8"))
+        return await manifest_store.load(_abc())
     except Exception:
         return None
 
 def _estimate_rows(counts_manifest, year_from: int, year_to: int, quarters_set: set[str], origin: str):
     if not counts_manifest:
         return None
-    by_year = { yrec["year"]: yrec for yrec in counts_manifest.get("years", []) }
-    total = 0
-    want_all = (origin == "ALL")
-    for y in range(year_from, year_to + 1):
-        yrec = by_year.get(y)
-        if not yrec:
-            continue
-        airports = yrec.get("airports", {})
-        if want_all:
-            for a in airports.values():
-                for q in quarters_set:
-                    total += int(a["quarters"].get(q, 0))
-        else:
-            a = airports.get(origin.upper())
-            if not a:
-                continue
-            for q in quarters_set:
-                total += int(a["quarters"].get(q, 0))
+    airports = None if origin == "ALL" else [origin]
+    total, _ = counts_manifest.rows(range(year_from, year_to + 1), airports, quarters_set)
     return total
 
 # ---------- HTTP function ----------
 @app.function_name(name="DownloadT100")
 @app.route(route="download", auth_level=func.AuthLevel.FUNCTION)
-def download(req: func.HttpRequest) -> func.HttpResponse:
+async def download(req: func.HttpRequest) -> func.HttpResponse:
     # parse inputs
     try:
         yf = int(req.params.get("year_from"))
@@ -127,25 +120,35 @@ def download(req: func.HttpRequest) -> func.HttpResponse:
 
     quarters = _parse_quarters(req.params.get("quarters") or "ALL")
     origin = (req.params.get("origin") or "ALL").upper()
-    cache_name = f"prebuilt/{yf}_{yt}_{origin}_{quarters}.csv"
-
     try:
-        if _bc().get_blob_client(cache_name).exists():
+        columns = parse_columns(req.params.get("columns"))
+    except ValueError as e:
+        return func.HttpResponse(f"columns: {e}", status_code=400)
+    # one blob per canonical query, valid while the manifest (data version) is unchanged
+    query = result_cache.canonical_query(year_from=yf, year_to=yt, quarters=quarters, origin=origin,
+                                         columns=",".join(columns) if columns else "ALL")
+    cache_name = result_cache.blob_name(query)
+    try:
+        version = await result_cache.data_version_async(_abc(), MANIFEST_BLOB)
+        hit = await result_cache.lookup_async(_abc(), cache_name, version)
+        if hit is not None:
             url = _sas_url(cache_name, hours=24)
             payload = {
                 "download_url": url,
-                "rows": None,               # unknown without reading; optional
+                "rows": int(hit.get("rows", 0)),
                 "years": [yf, yt],
                 "quarters": sorted(list(quarters)),
                 "origin": origin,
+                "columns": columns or "ALL",
                 "cached": True
             }
             return func.HttpResponse(json.dumps(payload), mimetype="application/json", status_code=200)
     except Exception:
-        # If existence check fails, just fall through to build path
+        # If the cache check fails, just fall through to build path
         logging.info(f"Cache check failed for {cache_name}; building on the fly.")
+        version = None
     # guardrail via counts manifest
-    counts_manifest = _load_counts_manifest()
+    counts_manifest = await _load_counts_manifest()
     est = _estimate_rows(counts_manifest, yf, yt, quarters, origin)
     if est is not None and est > EXCEL_MAX_ROWS:
         return func.HttpResponse(
@@ -153,69 +156,60 @@ def download(req: func.HttpRequest) -> func.HttpResponse:
             status_code=400
         )
 
-    # discover CSVs
-    bc = _bc()
+    # discover files: for one airport, curated CSVs with a range index (only its byte ranges are
+    # read); otherwise the curated CSVs. The Parquet tier is not read here: its typed values
+    # would not render back to the curated text (1,234.00, leading zeros, the blank column)
+    bc = _abc()
     selected_files = []
+    indexed = set()
     for year in range(yf, yt + 1):
-        for b in bc.list_blobs(name_starts_with=f"{year}/curated/"):
-            if b.name.endswith(".csv"):
-                selected_files.append(b.name)
+        curated = None
+        if origin != "ALL":
+            curated = await aio_blobs.list_etags(bc, f"{year}/curated/")
+            ranged = [n for n in curated
+                      if n.endswith(".csv") and range_index.index_blob_name(n) in curated]
+            if ranged:
+                selected_files.extend((n, curated[n]) for n in ranged)
+                indexed.update(ranged)
+                continue
+        if curated is None:
+            curated = await aio_blobs.list_etags(bc, f"{year}/curated/")
+        selected_files.extend((n, curated[n]) for n in curated if n.endswith(".csv"))
 
     if not selected_files:
         return func.HttpResponse("No files match your filters.", status_code=404)
 
-    # compose CSV with row filtering (QUARTER, ORIGIN)
-    out = io.StringIO()
-    writer = None
-    count = 0
-
-    # local helper so we can pass only what's needed
-    def iter_filtered_rows(blob_name, quarters, origin):
-        for row in _iter_csv_dictrows(blob_name):
-            qcol = "QUARTER" if "QUARTER" in row else ("Quarter" if "Quarter" in row else None)
-            if qcol and str(row.get(qcol, "")).strip() not in quarters:
-                continue
-            if origin != "ALL":
-                ocol = "ORIGIN" if "ORIGIN" in row else ("Origin" if "Origin" in row else None)
-                if ocol and row.get(ocol, "").upper() != origin:
-                    continue
-            yield row
+    def filtered_batches(file):
+        blob_name, etag = file
+        read = _ranged_batches if blob_name in indexed else _csv_blob_batches
+        return read(blob_name, etag, quarters, origin, columns)
 
-    # 🚀 Parallelize blob reading (results merged on main thread)
-    try:
-        with ThreadPoolExecutor(max_workers=8) as ex:
-            futures = [
-                ex.submit(lambda b=b: list(iter_filtered_rows(b, quarters, origin)))
-                for b in selected_files
-            ]
-            for fut in as_completed(futures):
-                rows = fut.result()
-                for row in rows:
-                    if writer is None:
-                        writer = csv.DictWriter(out, fieldnames=list(row.keys()), lineterminator="\n")
-                        writer.writeheader()
-                    writer.writerow(row)
-                    count += 1
-                    if count > EXCEL_MAX_ROWS:
-                        return func.HttpResponse(
-                            "Selection exceeds Excel's row limit; narrow filters.",
-                            status_code=400
-                        )
-    except Exception:
-        logging.exception("Failed while processing blobs")
-        return func.HttpResponse("Failed to read data", status_code=502)
-
-    # upload composed CSV & return SAS link
-    tmp_name = f"{TMP_PREFIX}/{uuid.uuid4()}.csv"
-    try:
-        _bc().upload_blob(tmp_name, out.getvalue().encode("utf-8"), overwrite=True)
-    except Exception:
-        logging.exception("Failed to upload composed CSV")
-        return func.HttpResponse("Failed to upload composed CSV.", status_code=502)
+    # filter batch by batch and stage the CSV straight into the result blob (one block in memory);
+    # nothing is committed unless every file was read and the row limit held
     try:
-        _bc().upload_blob(cache_name, out.getvalue().encode("utf-8"), overwrite=True)
+        async with AsyncBlockBlobWriter(bc.get_blob_client(cache_name), block_size=blob_clients.BLOCK_SIZE,
+                                        content_type="text/csv") as sink:
+            # with columns= only those are written, in the order asked for
+            writer = row_filter.CsvBatchWriter(sink, columns=columns)
+            limit = blob_clients.pool_workers(READ_WORKERS)
+            # batches are written as the files produce them, interleaved across files
+            async for names, arrays in aio_blobs.merge_bounded(filtered_batches, selected_files, limit):
+                # the header comes from the first batch and later batches are matched to it by name
+                writer.write(names, arrays)
+                if writer.rows > EXCEL_MAX_ROWS:
+                    raise _RowLimitExceeded()
+                await sink.drain()
+            if version is not None:
+                sink.metadata = result_cache.entry_metadata(query, version, writer.rows)
+    except _RowLimitExceeded:
+        return func.HttpResponse(
+            "Selection exceeds Excel's row limit; narrow filters.",
+            status_code=400
+        )
     except Exception:
-        logging.warning(f"Could not write cache blob {cache_name}; continuing without cache.")
+        logging.exception(f"Failed to build {cache_name}")
+        return func.HttpResponse("Failed to build the download.", status_code=502)
+    count = writer.rows
 
     url = _sas_url(cache_name, hours=24)
     payload = {
@@ -224,6 +218,19 @@ def download(req: func.HttpRequest) -> func.HttpResponse:
         "years": [yf, yt],
         "quarters": sorted(list(quarters)),
         "origin": origin,
+        "columns": columns or "ALL",
         "cached": False
     }
     return func.HttpResponse(json.dumps(payload), mimetype="application/json", status_code=200)
+
+
+@app.function_name(name="ResultCacheGcTimer")
+@app.schedule(
+    schedule="0 20 * * * *",   # hourly at :20
+    arg_name="myTimer",
+    run_on_startup=False,
+    use_monitor=True
+)
+def ResultCacheGcTimer(myTimer: func.TimerRequest):
+    bc = _bc()
+    result_cache.gc(bc, result_cache.data_version(bc, MANIFEST_BLOB))
@@ -10,4 +10,5 @@ import count_rowst100
 import manifest_t100
 import download_t100
 import list_t100
+import summary_t100
 import pipeline_t100
\ No newline at end of file
@@ -1,12 +1,22 @@
-import os, io, json, math, zipfile
-from datetime import datetime
+import asyncio, contextlib, gzip, os, io, json, math
+from datetime import datetime, timedelta
 from typing import Iterable, List, Dict, Tuple
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import BlobSasPermissions, BlobServiceClient, generate_blob_sas
 
 from function_app import app
+from pipeline.parquet_tier import parquet_prefix, typed_column
+from pipeline import aio_blobs, blob_clients, manifest_store, range_index, result_cache, zip_members
+from pipeline.aio_blobs import AsyncBlockBlobWriter
+from pipeline.row_filter import ChunkReader, parquet_columns
+from pipeline.t100.fetch import parse_columns
+from pipeline.t100.transform_helper import PARQUET_TYPES
 
 # ----- Config -----
 AIRPORT_COL = "ORIGIN"
@@ -14,128 +24,292 @@ QUARTER_COL = "QUARTER"
 EXCEL_ROW_LIMIT = 1_048_576
 
 CONTAINER = os.getenv("BTS_CONTAINER", "bts-t100")
-CONN_STR = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+MANIFEST_BLOB = manifest_store.MANIFEST_BLOB
+# pandas chunk for the streamed CSV filter; bounds the rows held per request
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "100000"))
+# split-ZIP members built at once (each in its own worker thread while it parses/deflates)
+MEMBER_FANOUT = int(os.getenv("EXPORT_MEMBER_FANOUT", str(os.cpu_count() or 4)))
+SAS_HOURS = 24
+
+# format= -> (file extension, content type). Only csv is cut into Excel-sized ZIP members;
+# the machine formats are always one file.
+FORMATS = {
+    "csv": (".csv", "text/csv"),
+    "csv.gz": (".csv.gz", "application/gzip"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrows", "application/vnd.apache.arrow.stream"),
+}
 
 # curated CSV name pattern (you already use this)
 def curated_name_for_year(y: int) -> str:
     return f"{y}/curated/T_T100_SEGMENT_ALL_CARRIER__{y}__with_metrics.csv"
 
 def _bsc() -> BlobServiceClient:
-    if not CONN_STR:
-        raise RuntimeError("AZURE_STORAGE_CONNECTION_STRING is not set")
-    return BlobServiceClient.from_connection_string(CONN_STR)
+    return blob_clients.service()
+
+def _abc():
+    # the HTTP handler runs on the worker's event loop
+    return blob_clients.aio_container(CONTAINER)
 
 # ----- Manifest helpers -----
-def _load_manifest() -> dict:
-    bc = _bsc().get_container_client(CONTAINER)
+async def _load_manifest():
+    """The row-count manifest (worker-cached, see manifest_store), or None if there is none yet."""
     try:
-        data = bc.get_blob_client("manifests/index.json").download_blob().readall()
-        return json.loads(data.decode("utf-8"))
+        return await manifest_store.load(_abc())
     except Exception:
-        # No manifest yet
-        return {"years": []}
+        return None
 
-def _estimate_rows(manifest: dict, years: Iterable[int],
+def _estimate_rows(manifest, years: Iterable[int],
                    airports: List[str] | None,
                    quarters: List[str] | None) -> Tuple[int, Dict[int, int]]:
     """
     Returns (total_rows, per_year_rows) based on manifest.
     """
-    airports_set = set(a.upper() for a in airports) if airports else None
-    quarters_set = set(quarters) if quarters else None
-
-    per_year: Dict[int, int] = {}
-    total = 0
-
-    years_set = set(years)
-    for yinfo in manifest.get("years", []):
-        y = int(yinfo.get("year"))
-        if y not in years_set:
-            continue
-        if not airports_set and not quarters_set:
-            # whole year
-            cnt = int(yinfo.get("total_rows", 0))
-            per_year[y] = cnt
-            total += cnt
-            continue
-
-        # filter by airport and quarters
-        airports_map = yinfo.get("airports", {})
-        ysum = 0
-        for a, vals in airports_map.items():
-            if airports_set and a.upper() not in airports_set:
-                continue
-            if not quarters_set:
-                ysum += int(vals.get("total", 0))
-            else:
-                qmap = vals.get("quarters", {})
-                ysum += sum(int(qmap.get(q, 0)) for q in quarters_set)
-        per_year[y] = ysum
-        total += ysum
-
-    return total, per_year
+    if manifest is None:
+        return 0, {}
+    return manifest.rows(years, airports, quarters)
 
 # ----- CSV building -----
-def _iter_filtered_chunks(csv_bytes: bytes,
+def _iter_filtered_chunks(source,
                           airports: List[str] | None,
-                          quarters: List[str] | None) -> Iterable[pd.DataFrame]:
+                          quarters: List[str] | None,
+                          columns: List[str] | None = None) -> Iterable[pd.DataFrame]:
+    """Filtered DataFrame chunks of a curated CSV given as bytes or a binary stream,
+    projected to `columns` (in that order) when given."""
     # Normalize filters
     airports_set = set(a.upper() for a in airports) if airports else None
     quarters_set = set(quarters) if quarters else None
 
     usecols = None  # read all columns so the download is “full fidelity”
-    # If you prefer smaller files, set something like:
-    # usecols = [AIRPORT_COL, QUARTER_COL, "DEST", "PASSENGERS", "FREIGHT", ...]
+    if columns:
+        # columns= projection: the parser skips converting everything else
+        wanted = set(columns) | {AIRPORT_COL, QUARTER_COL}
+        usecols = lambda c: c in wanted
 
-    for chunk in pd.read_csv(io.BytesIO(csv_bytes), chunksize=200_000, dtype={QUARTER_COL: "Int64"}, usecols=usecols):
-        # Drop rows missing the filter columns (defensive)
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    # every column stays text: no per-chunk type inference, values are written back as curated
+    for chunk in pd.read_csv(source, chunksize=EXPORT_CHUNK_ROWS, dtype=str, keep_default_na=False,
+                             usecols=usecols):
         for col in (AIRPORT_COL, QUARTER_COL):
             if col not in chunk.columns:
                 raise ValueError(f"Input CSV missing '{col}'")
-        chunk = chunk.dropna(subset=[AIRPORT_COL, QUARTER_COL])
-        # Normalize types for filtering
-        chunk[QUARTER_COL] = chunk[QUARTER_COL].astype("int64").astype(str)
-        chunk[AIRPORT_COL] = chunk[AIRPORT_COL].astype(str).str.upper()
-
+        # Normalize filter keys the way row_filter does; rows missing either are dropped (defensive)
+        airport = chunk[AIRPORT_COL].str.strip().str.upper()
+        quarter = chunk[QUARTER_COL].str.strip()
+        keep = (airport != "") & (quarter != "")
         if airports_set:
-            chunk = chunk[chunk[AIRPORT_COL].isin(airports_set)]
+            keep &= airport.isin(airports_set)
         if quarters_set:
-            chunk = chunk[chunk[QUARTER_COL].isin(quarters_set)]
+            keep &= quarter.isin(quarters_set)
+        chunk = chunk[keep]
+        if columns:
+            chunk = chunk.reindex(columns=columns)
 
         if not chunk.empty:
             yield chunk
 
-def _download_year_csv(year: int) -> bytes:
-    name = curated_name_for_year(year)
-    bc = _bsc().get_container_client(CONTAINER)
-    return bc.get_blob_client(name).download_blob().readall()
+async def _list_year_parquet(year: int, quarters: List[str] | None) -> List[str]:
+    """Parquet-tier parts for the year, one prefix per wanted quarter."""
+    wanted = quarters or [None]
+    return [n
+            for q in wanted
+            for n in await aio_blobs.list_sizes(_abc(), parquet_prefix(year, q))
+            if n.endswith(".parquet")]
+
+def _iter_parquet_frames(data: bytes, airports: List[str] | None,
+                         columns: List[str] | None = None) -> Iterable[pd.DataFrame]:
+    # quarter is already fixed by the partition path; push the airport filter and projection into the reader
+    filters = [(AIRPORT_COL, "in", [a.upper() for a in airports])] if airports else None
+    table = pq.read_table(pa.BufferReader(data), filters=filters, columns=parquet_columns(data, columns))
+    for batch in table.to_batches(max_chunksize=EXPORT_CHUNK_ROWS):
+        if batch.num_rows:
+            df = batch.to_pandas()
+            yield df.reindex(columns=columns) if columns else df
+
+# ----- Streaming export -----
+class _CsvOut:
+    """
+    CSV text written to a byte sink. The header comes from the first
+    chunk; later chunks are aligned to it by column name. With
+    `compress`, the text is gzipped on the way.
+    """
+
+    def __init__(self, out, compress: bool = False):
+        self._gz = gzip.GzipFile(fileobj=out, mode="wb", mtime=0) if compress else None
+        self._out = self._gz or out
+        self._columns: List[str] | None = None
+        self.rows = 0
+
+    def write_frame(self, df: pd.DataFrame) -> int:
+        header = self._columns is None
+        if header:
+            self._columns = list(df.columns)
+        else:
+            df = df.reindex(columns=self._columns)
+        self._out.write(df.to_csv(index=False, header=header).encode("utf-8"))
+        self.rows += len(df)
+        return len(df)
+
+    def close(self) -> None:
+        if self._gz is not None:
+            self._gz.close()
+
+def _cast(col, t: pa.DataType):
+    # CSV chunks arrive as text and are typed like the Parquet tier; Parquet frames are just cast
+    if pa.types.is_string(col.type) or pa.types.is_large_string(col.type):
+        return typed_column(pc.cast(col.combine_chunks(), pa.string()), t)
+    if pa.types.is_dictionary(t):
+        return pc.cast(col, t.value_type).dictionary_encode()
+    return pc.cast(col, t)
+
+class _ArrowOut:
+    """
+    Frames as one Parquet file or Arrow IPC stream. The schema is fixed by
+    the first chunk's columns, typed like the Parquet tier (PARQUET_TYPES,
+    text otherwise); pandas' "Unnamed: N" column for BTS's trailing comma is dropped.
+    """
+
+    def __init__(self, out, fmt: str, columns: List[str] | None = None):
+        self._out = out
+        self._fmt = fmt
+        self._columns = columns
+        self._writer = None
+        self.schema: pa.Schema | None = None
+        self.rows = 0
 
-def _build_single_csv(years: List[int], airports: List[str] | None, quarters: List[str] | None) -> bytes:
-    frames = []
+    def _open(self, columns: List[str]) -> None:
+        self.schema = pa.schema([(c, PARQUET_TYPES.get(c, pa.string())) for c in columns
+                                 if not c.startswith("Unnamed:")])
+        if self._fmt == "parquet":
+            self._writer = pq.ParquetWriter(self._out, self.schema, compression="zstd")
+        else:
+            self._writer = pa.ipc.new_stream(self._out, self.schema,
+                                             options=pa.ipc.IpcWriteOptions(compression="zstd"))
+
+    def write_frame(self, df: pd.DataFrame) -> int:
+        if self._writer is None:
+            self._open(list(df.columns))
+        df = df.reindex(columns=self.schema.names)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = pa.table([_cast(table.column(f.name), f.type) for f in self.schema], schema=self.schema)
+        self._writer.write_table(table)
+        self.rows += len(df)
+        return len(df)
+
+    def close(self) -> None:
+        if self._writer is None:
+            # nothing matched: still a valid, empty file
+            self._open(self._columns or [])
+        self._writer.close()
+
+def _written(writer, frames: Iterable[pd.DataFrame]):
+    # runs in a worker thread, one filtered chunk per step
+    for df in frames:
+        yield writer.write_frame(df)
+
+async def _year_frames(y: int, airports: List[str] | None, quarters: List[str] | None,
+                       columns: List[str] | None, typed: bool = False):
+    """
+    Filtered-frame iterators for one year (consumed in worker threads): the
+    range-indexed bytes, each Parquet part (`typed` output only: its values
+    don't render back to the curated CSV text), or the curated CSV streamed
+    from its download chunks.
+    """
+    if airports:
+        # sorted curated CSV + range index: fetch just these airports' byte ranges
+        data = await range_index.fetch_async(_abc(), curated_name_for_year(y), airports, quarters)
+        if data is not None:
+            yield _iter_filtered_chunks(data, airports, quarters, columns)
+            return
+    names = await _list_year_parquet(y, quarters) if typed else []
+    if names:
+        for name in names:
+            yield _iter_parquet_frames(await aio_blobs.read_all(_abc(), name), airports, columns)
+        return
+    chunks = aio_blobs.iter_chunks(_abc(), curated_name_for_year(y))
+    try:
+        source = io.BufferedReader(ChunkReader(aio_blobs.sync_chunks(chunks, asyncio.get_running_loop())))
+        yield _iter_filtered_chunks(source, airports, quarters, columns)
+    finally:
+        await chunks.aclose()
+
+async def _stream_frames(writer, sink, years: List[int], airports: List[str] | None,
+                         quarters: List[str] | None, columns: List[str] | None) -> None:
+    """Append the filtered rows of `years` to `writer`, staging blocks as they fill."""
+    typed = isinstance(writer, _ArrowOut)
     for y in years:
         try:
-            data = _download_year_csv(y)
-        except Exception:
-            continue
-        for chunk in _iter_filtered_chunks(data, airports, quarters):
-            frames.append(chunk)
-    if not frames:
-        return b""
-    out = pd.concat(frames, ignore_index=True)
-    buf = io.StringIO()
-    out.to_csv(buf, index=False)
-    return buf.getvalue().encode("utf-8")
-
-def _build_split_zip(plan: List[List[int]], airports: List[str] | None, quarters: List[str] | None,
-                     start_year: int, end_year: int, airports_slug: str, quarters_slug: str) -> bytes:
-    mem = io.BytesIO()
-    with zipfile.ZipFile(mem, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for i, chunk_years in enumerate(plan, start=1):
-            csv_bytes = _build_single_csv(chunk_years, airports, quarters)
-            fname = f"t100_{airports_slug}_{quarters_slug}_{min(chunk_years)}-{max(chunk_years)}.csv"
-            zf.writestr(fname, csv_bytes)
-    mem.seek(0)
-    return mem.read()
+            async with contextlib.aclosing(_year_frames(y, airports, quarters, columns, typed)) as sources:
+                async for frames in sources:
+                    async for _ in aio_blobs.iter_in_thread(_written(writer, frames)):
+                        await sink.drain()
+        except ResourceNotFoundError:
+            continue  # year not ingested
+
+async def _export_single(sink: AsyncBlockBlobWriter, fmt: str, years: List[int], airports: List[str] | None,
+                         quarters: List[str] | None, columns: List[str] | None) -> int:
+    if fmt in ("parquet", "arrow"):
+        writer = _ArrowOut(sink, fmt, columns)
+    else:
+        writer = _CsvOut(sink, compress=(fmt == "csv.gz"))
+    await _stream_frames(writer, sink, years, airports, quarters, columns)
+    # footer / final deflate block
+    await asyncio.to_thread(writer.close)
+    return writer.rows
+
+async def _export_split_zip(sink: AsyncBlockBlobWriter, plan: List[List[int]], airports: List[str] | None,
+                            quarters: List[str] | None, columns: List[str] | None,
+                            airports_slug: str, quarters_slug: str) -> int:
+    """
+    One ZIP member per plan group, built concurrently: every member is its
+    own deflate stream staged into a reserved segment of the blob, so the
+    groups parse and compress in parallel threads and the archive is just
+    the segments in plan order plus a central directory. The groups are
+    disjoint, so each year is fetched exactly once.
+    """
+    segments = [await sink.segment() for _ in plan]
+
+    async def member(i: int):
+        years = plan[i]
+        seg = segments[i]
+        zm = zip_members.MemberWriter(
+            f"t100_{airports_slug}_{quarters_slug}_{min(years)}-{max(years)}.csv", seg)
+        writer = _CsvOut(zm)
+        await _stream_frames(writer, seg, years, airports, quarters, columns)
+        await asyncio.to_thread(zm.close)
+        await seg.close()
+        return zm, writer.rows
+
+    done = await aio_blobs.gather_bounded(member, range(len(plan)), limit=MEMBER_FANOUT)
+    sink.write(zip_members.central_directory([zm for zm, _ in done]))
+    return sum(rows for _, rows in done)
+
+def _sas_url(blob_name: str, filename: str, hours: int = SAS_HOURS) -> str:
+    bc = _abc()
+    sas = generate_blob_sas(
+        account_name=bc.account_name,
+        container_name=bc.container_name,
+        blob_name=blob_name,
+        account_key=blob_clients.aio_service().credential.account_key,
+        permission=BlobSasPermissions(read=True),
+        expiry=datetime.utcnow() + timedelta(hours=hours),
+        # the browser still saves it under the export's name
+        content_disposition=f'attachment; filename="{filename}"',
+    )
+    return f"https://{bc.account_name}.blob.core.windows.net/{bc.container_name}/{blob_name}?{sas}"
+
+async def _export_to_blob(query: str, fname: str, ext: str, content_type: str, build) -> func.HttpResponse:
+    """Serve `query` from the result cache, or stream build(sink) into a new entry; redirect to it."""
+    cc = _abc()
+    version = await result_cache.data_version_async(cc, MANIFEST_BLOB)
+    blob_name = result_cache.blob_name(query, ext=ext)
+    if await result_cache.lookup_async(cc, blob_name, version) is None:
+        async with AsyncBlockBlobWriter(cc.get_blob_client(blob_name), block_size=blob_clients.BLOCK_SIZE,
+                                        content_type=content_type) as sink:
+            rows = await build(sink)
+            sink.metadata = result_cache.entry_metadata(query, version, rows)
+    return func.HttpResponse(status_code=302, headers={"Location": _sas_url(blob_name, fname)})
 
 def _compute_split(per_year_rows: Dict[int, int], limit: int) -> List[List[int]]:
     """
@@ -170,7 +344,7 @@ def _compute_split(per_year_rows: Dict[int, int], limit: int) -> List[List[int]]
 
 # ----- HTTP endpoint -----
 @app.route(route="export", methods=["GET"])
-def export(req: func.HttpRequest) -> func.HttpResponse:
+async def export(req: func.HttpRequest) -> func.HttpResponse:
     try:
         # Parse inputs
         airports = req.params.get("airports")  # comma sep
@@ -189,18 +363,30 @@ def export(req: func.HttpRequest) -> func.HttpResponse:
         if end_year < start_year:
             return func.HttpResponse("end_year must be >= start_year", status_code=400)
 
+        try:
+            columns_list = parse_columns(req.params.get("columns"))
+        except ValueError as e:
+            return func.HttpResponse(f"columns: {e}", status_code=400)
+
+        fmt = (req.params.get("format") or "csv").strip().lower()
+        if fmt not in FORMATS:
+            return func.HttpResponse(f"format must be one of {', '.join(FORMATS)}", status_code=400)
+        ext, content_type = FORMATS[fmt]
+
         years = list(range(start_year, end_year + 1))
         dry_run = (req.params.get("dry_run", "false").lower() in ("1", "true", "yes"))
 
-        manifest = _load_manifest()
+        manifest = await _load_manifest()
         total_est, per_year = _estimate_rows(manifest, years, airports_list, quarters_list)
 
         # For UI/dry-run inspection
         if dry_run:
-            plan = _compute_split(per_year, EXCEL_ROW_LIMIT)
+            plan = _compute_split(per_year, EXCEL_ROW_LIMIT) if fmt == "csv" else [years]
             body = {
                 "airports": airports_list or "ALL",
                 "quarters": quarters_list or ["1","2","3","4"],
+                "columns": columns_list or "ALL",
+                "format": fmt,
                 "start_year": start_year,
                 "end_year": end_year,
                 "estimate_rows": total_est,
@@ -213,14 +399,26 @@ def export(req: func.HttpRequest) -> func.HttpResponse:
         airports_slug = (",".join(airports_list) if airports_list else "ALL")
         quarters_slug = (",".join(quarters_list) if quarters_list else "Q1-4")
 
+        # the file is streamed block by block into a result-cache blob and the client is
+        # redirected to it, so memory stays at a chunk no matter how big the export is
+        query = result_cache.canonical_query(kind="export", airports=airports_list or [],
+                                             quarters=quarters_list or [],
+                                             start_year=start_year, end_year=end_year,
+                                             columns=",".join(columns_list) if columns_list else "ALL",
+                                             format=fmt)
+        fname = f't100_{airports_slug}_{quarters_slug}_{start_year}-{end_year}{ext}'
+        if fmt != "csv":
+            # machine formats: no Excel limit, always a single file
+            if total_est == 0:
+                return func.HttpResponse("No matching rows for the selection.", status_code=404)
+            return await _export_to_blob(
+                query, fname, ext, content_type,
+                lambda sink: _export_single(sink, fmt, years, airports_list, quarters_list, columns_list))
+
         if total_est <= EXCEL_ROW_LIMIT and total_est > 0:
-            csv_bytes = _build_single_csv(years, airports_list, quarters_list)
-            fname = f't100_{airports_slug}_{quarters_slug}_{start_year}-{end_year}.csv'
-            return func.HttpResponse(
-                csv_bytes,
-                mimetype="text/csv",
-                headers={"Content-Disposition": f'attachment; filename="{fname}"'}
-            )
+            return await _export_to_blob(
+                query, fname, ext, content_type,
+                lambda sink: _export_single(sink, fmt, years, airports_list, quarters_list, columns_list))
 
         # Need to split to stay Excel-friendly
         plan = _compute_split(per_year, EXCEL_ROW_LIMIT)
@@ -228,13 +426,10 @@ def export(req: func.HttpRequest) -> func.HttpResponse:
             # Nothing to export
             return func.HttpResponse("No matching rows for the selection.", status_code=404)
 
-        zip_bytes = _build_split_zip(plan, airports_list, quarters_list,
-                                     start_year, end_year, airports_slug, quarters_slug)
         zip_name = f't100_{airports_slug}_{quarters_slug}_{start_year}-{end_year}.zip'
-        return func.HttpResponse(
-            zip_bytes,
-            mimetype="application/zip",
-            headers={"Content-Disposition": f'attachment; filename="{zip_name}"'}
-        )
+        return await _export_to_blob(
+            query, zip_name, ".zip", "application/zip",
+            lambda sink: _export_split_zip(sink, plan, airports_list, quarters_list, columns_list,
+                                           airports_slug, quarters_slug))
     except Exception as e:
         return func.HttpResponse(f"Error: {e}", status_code=500)
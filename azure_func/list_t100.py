@@ -1,31 +1,26 @@
 import azure.functions as func
 import json, os
-from azure.storage.blob import BlobServiceClient
 from .function_app import app
+from .pipeline import blob_clients, manifest_store
 
 CONTAINER = os.getenv("BTS_CONTAINER", "bts-t100")
-MANIFEST_BLOB = "manifests/index.json"
 
 
-def _bc():
-    conn = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-    bsc = BlobServiceClient.from_connection_string(conn)
-    return bsc.get_container_client(CONTAINER)
+def _abc():
+    return blob_clients.aio_container(CONTAINER)
 
 @app.function_name(name="ListT100")
 @app.route(route="list", auth_level=func.AuthLevel.FUNCTION)
-def list_t100(req: func.HttpRequest) -> func.HttpResponse:
-    # 1. Download manifest
-    blob_client = _bc().get_blob_client(MANIFEST_BLOB)
-    raw = blob_client.download_blob().readall()
-    manifest = json.loads(raw.decode("utf-8"))
+async def list_t100(req: func.HttpRequest) -> func.HttpResponse:
+    # 1. Manifest (kept in worker memory, revalidated by ETag)
+    manifest = await manifest_store.load(_abc())
+    if manifest is None:
+        return func.HttpResponse("Manifest not built yet", status_code=503)
 
-
-    years = [entry["year"] for entry in manifest["years"]]
+    years = manifest.years()
 
     origins = {"ALL"}
-    for entry in manifest["years"]:
-        origins.update(entry.get("airports", {}).keys())
+    origins.update(manifest.origins())
 
 
     quarters = ["1", "2", "3", "4"]
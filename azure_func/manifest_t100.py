@@ -1,25 +1,80 @@
 # azure_func/build_manifest_timer.py
+import io
 import os
+import json
 import logging
 from datetime import date
 
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceModifiedError, ResourceNotFoundError
+from azure.storage.blob import ContentSettings
 from .function_app import app
+from .pipeline import blob_clients
 from . import count_rowst100
+from .pipeline.parquet_tier import parquet_prefix
+from .pipeline import ingest_state
+from .pipeline import file_stats, manifest_store, metric_cube
+from .pipeline.row_filter import ChunkReader
 
-def _get_blob_service():
-    conn = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-    if not conn:
-        raise RuntimeError("AZURE_STORAGE_CONNECTION_STRING is not set")
-    return BlobServiceClient.from_connection_string(conn)
+MANIFEST_BLOB = manifest_store.MANIFEST_BLOB
+# per-blob airport x quarter counts, keyed by blob name and ETag
+COUNT_CACHE_BLOB = "manifests/counts_cache.json"
+# 2: counts stored dense (AirportQuarterCounts.to_compact()); older caches are dropped and rebuilt
+COUNT_CACHE_FORMAT = 2
+# data files downloaded and counted at once (each holds one download chunk + one pandas chunk)
+COUNT_WORKERS = int(os.getenv("MANIFEST_COUNT_WORKERS", str(min(8, (os.cpu_count() or 1) * 2))))
+# years whose metric cube is built at once (each holds its files' cubes until they are combined)
+CUBE_WORKERS = int(os.getenv("MANIFEST_CUBE_WORKERS", "2"))
 
-def _list_curated_csvs_for_year(bc, year: int) -> list[str]:
-    return [
-        b.name
+def _list_curated_csvs_for_year(bc, year: int) -> dict[str, str]:
+    return {
+        b.name: b.etag.strip('"')
         for b in bc.list_blobs(name_starts_with=f"{year}/curated/")
         if b.name.endswith(".csv")
-    ]
+    }
+
+def _list_curated_parquet_for_year(bc, year: int) -> dict[str, str]:
+    return {
+        b.name: b.etag.strip('"')
+        for b in bc.list_blobs(name_starts_with=parquet_prefix(year))
+        if b.name.endswith(".parquet")
+    }
+
+def _list_curated_with_stats_for_year(bc, year: int) -> dict[str, str]:
+    """{name: etag} of the year's curated CSVs if every one has an ingest stats sidecar, else {}."""
+    csvs, stats = {}, set()
+    for b in bc.list_blobs(name_starts_with=f"{year}/curated/"):
+        if b.name.endswith(".csv"):
+            csvs[b.name] = b.etag.strip('"')
+        elif b.name.endswith(file_stats.SUFFIX):
+            stats.add(b.name[:-len(file_stats.SUFFIX)])
+    return csvs if csvs and stats.issuperset(csvs) else {}
+
+def _list_curated_for_year(bc, year: int) -> dict[str, str]:
+    """{name: etag} of the year's curated files."""
+    # Parquet tier is a fraction of the bytes and only two columns get read
+    return _list_curated_parquet_for_year(bc, year) or _list_curated_csvs_for_year(bc, year)
+
+# ------------------------------- Count cache -------------------------------
+
+def _load_count_cache(bc) -> dict:
+    """{name: {"version": etag, "counts": compact counts}} from the sidecar; {} if missing, unreadable or old."""
+    try:
+        doc = json.loads(bc.get_blob_client(COUNT_CACHE_BLOB).download_blob().readall())
+    except ResourceNotFoundError:
+        return {}
+    except ValueError as e:
+        logging.warning("Count cache %s unreadable (%s); recounting everything.", COUNT_CACHE_BLOB, e)
+        return {}
+    if doc.get("format") != COUNT_CACHE_FORMAT:
+        return {}
+    return doc.get("blobs", {})
+
+def _save_count_cache(bc, cache: dict) -> None:
+    doc = {"format": COUNT_CACHE_FORMAT, "blobs": cache}
+    bc.upload_blob(COUNT_CACHE_BLOB, json.dumps(doc, separators=(",", ":")).encode("utf-8"),
+                   overwrite=True)
 
 # manifest_t100.py  (your _loader)
 def _loader(bc):
@@ -29,6 +84,73 @@ def _loader(bc):
         return blob.download_blob().readall()
     return _load
 
+def _opener(bc):
+    def _open(name: str):
+        # download chunks are consumed as the counter reads; nothing buffers the whole blob
+        return io.BufferedReader(ChunkReader(bc.get_blob_client(name).download_blob().chunks()))
+    return _open
+
+# ------------------------------- Metric cubes -------------------------------
+
+def _cube_sources(bc) -> dict[int, str]:
+    """{year: sources fingerprint} of the year cubes already built."""
+    out = {}
+    for b in bc.list_blobs(name_starts_with=f"{metric_cube.PREFIX}/", include=["metadata"]):
+        y = b.name[len(metric_cube.PREFIX) + 1:].removeprefix("YEAR=").removesuffix(".arrow")
+        if y.isdigit():
+            out[int(y)] = (b.metadata or {}).get("sources", "")
+    return out
+
+def _build_cubes(bc, years: list[int]) -> list[int]:
+    """
+    (Re)build cube/YEAR={y}.arrow for the years whose curated CSVs changed
+    since their cube was written. Files merge their ingest cube sidecar;
+    files ingested before those existed are streamed once and get one.
+    """
+    built_from = _cube_sources(bc)
+    versions: dict[str, str] = {}
+    fingerprints: dict[int, str] = {}
+    present: set[int] = set()
+
+    def list_year(y: int) -> list[str]:
+        csvs = _list_curated_csvs_for_year(bc, y)
+        if csvs:
+            present.add(y)
+        fp = metric_cube.sources_fingerprint(csvs)
+        if not csvs or built_from.get(y) == fp:
+            return []
+        fingerprints[y] = fp
+        versions.update(csvs)
+        return sorted(csvs)
+
+    def cube_for_file(name: str):
+        etag = versions[name]
+        table = metric_cube.load_sidecar(bc, name, etag)
+        if table is None:
+            # read the listed version only: a blob replaced since then raises and the
+            # build is retried on the next run (the ingest marks the manifest dirty)
+            download = bc.get_blob_client(name).download_blob(
+                etag=f'"{etag}"', match_condition=MatchConditions.IfNotModified)
+            with io.BufferedReader(ChunkReader(download.chunks())) as stream:
+                table = metric_cube.cube_csv(stream)
+            bc.upload_blob(metric_cube.sidecar_blob_name(name),
+                           metric_cube.to_bytes(table, etag=etag), overwrite=True,
+                           content_settings=ContentSettings(content_type=metric_cube.CONTENT_TYPE))
+        return table
+
+    def write_cube(y: int, table) -> None:
+        fp = fingerprints[y]
+        bc.upload_blob(metric_cube.year_blob_name(y), metric_cube.to_bytes(table, sources=fp),
+                       overwrite=True, metadata={"sources": fp},
+                       content_settings=ContentSettings(content_type=metric_cube.CONTENT_TYPE))
+
+    built = count_rowst100.build_cubes_from_provider(years, list_year, cube_for_file, write_cube,
+                                                     workers=CUBE_WORKERS)
+    # years whose curated data is gone
+    for y in set(built_from) - present:
+        bc.delete_blob(metric_cube.year_blob_name(y))
+    return built
+
 
 @app.function_name(name="BuildManifestTimer")
 @app.schedule(
@@ -42,19 +164,84 @@ def BuildManifestTimer(myTimer: func.TimerRequest):
     start_year = int(os.getenv("BTS_START_YEAR", "1990"))
     end_year = date.today().year
 
-    bsc = _get_blob_service()
-    bc = bsc.get_container_client(container)
+    bc = blob_clients.container(container)
+
+    # the ingest flags the manifest dirty only when a year's content actually changed
+    dirty = bc.get_blob_client(ingest_state.MANIFEST_DIRTY)
+    try:
+        # the mark this build answers; an ingest that re-marks it meanwhile changes the ETag
+        dirty_etag = dirty.get_blob_properties().etag
+    except ResourceNotFoundError:
+        dirty_etag = None   # first build / detection disabled
+    if (ingest_state.ENABLED and dirty_etag is None
+            and bc.get_blob_client(MANIFEST_BLOB).exists()
+            and (not metric_cube.ENABLED or _cube_sources(bc))):
+        logging.info("No curated data changed since the last manifest; skipping rebuild.")
+        return
 
     years = list(range(start_year, end_year + 1))
+    versions: dict[str, str] = {}
+    with_stats: set[str] = set()        # curated CSVs whose counts come from their stats sidecar
+    recounted: list[str] = []
+
+    def list_year(y: int) -> list[str]:
+        found = _list_curated_with_stats_for_year(bc, y)
+        if found:
+            with_stats.update(found)
+        else:
+            # years ingested before the sidecars existed are counted from the data
+            found = _list_curated_for_year(bc, y)
+        versions.update(found)
+        return list(found)
+
+    def from_sidecar(name: str):
+        return file_stats.load(bc, name, versions[name]) if name in with_stats else None
+
+    open_blob = _opener(bc)
+
+    def open_counted(name: str):
+        recounted.append(name)
+        return open_blob(name)
+
+    # blobs whose ETag is unchanged since the last build reuse their cached counts;
+    # the rest merge their ingest sidecar, or are streamed and counted if they have none
+    cache = _load_count_cache(bc)
     manifest = count_rowst100.build_manifest_from_provider(
         years=years,
-        list_files_for_year=lambda y: _list_curated_csvs_for_year(bc, y),
+        list_files_for_year=list_year,
         load_file_bytes=_loader(bc),
+        file_version=versions.get,
+        count_cache=cache,
+        precounted=from_sidecar,
+        open_file=open_counted,
+        workers=COUNT_WORKERS,
     )
+    dropped = count_rowst100.prune_count_cache(cache, versions)
 
     bc.upload_blob(
-        "manifests/index.json",
+        MANIFEST_BLOB,
         count_rowst100.manifest_to_bytes(manifest),
         overwrite=True,
     )
-    logging.info("Manifest written to manifests/index.json")
+    # what the HTTP handlers load (manifest_store); index.json stays the source of truth
+    bc.upload_blob(
+        manifest_store.COMPACT_BLOB,
+        manifest_store.compact_bytes(manifest),
+        overwrite=True,
+        content_settings=ContentSettings(content_type=manifest_store.COMPACT_CONTENT_TYPE),
+    )
+    # after the manifest: a lost cache write only costs a full recount next time
+    _save_count_cache(bc, cache)
+    logging.info("Manifest written to %s (%d files, %d recounted, %d cache entries dropped)",
+                 MANIFEST_BLOB, len(versions), len(recounted), dropped)
+    if metric_cube.ENABLED:
+        # before the dirty marker goes, so a failed cube build is retried on the next run
+        built = _build_cubes(bc, years)
+        logging.info("Metric cubes rebuilt for %d year(s): %s", len(built), built)
+    if dirty_etag is not None:
+        try:
+            dirty.delete_blob(etag=dirty_etag, match_condition=MatchConditions.IfNotModified)
+        except ResourceModifiedError:
+            logging.info("Manifest marked dirty again during the rebuild; keeping the marker for the next run.")
+        except ResourceNotFoundError:
+            pass
@@ -0,0 +1,228 @@
+# azure_func/pipeline/aio_blobs.py
+"""
+asyncio helpers for the HTTP handlers (azure.storage.blob.aio clients from
+blob_clients.aio_container()).
+
+Blob I/O stays on the event loop. CSV/Arrow work runs in worker threads
+that pull download chunks back from the loop (sync_chunks, iter_in_thread),
+so a request only holds a thread while it is actually parsing, never while
+it waits on storage. Fan-out across files is capped by a semaphore
+(merge_bounded, gather_bounded).
+"""
+import asyncio
+import base64
+import logging
+import os
+import time
+import uuid
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+from azure.storage.blob import BlobBlock, ContentSettings
+
+logger = logging.getLogger("bts.aio_blobs")
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# blob reads in flight per request
+FANOUT = int(os.getenv("HTTP_BLOB_FANOUT", "8"))
+
+
+# ------------------------------- Reads -------------------------------
+
+async def read_all(cc, name: str) -> bytes:
+    downloader = await cc.get_blob_client(name).download_blob()
+    return await downloader.readall()
+
+async def iter_chunks(cc, name: str, **kw) -> AsyncIterator[bytes]:
+    """The blob as its download chunks (one chunk in memory at a time); `kw` go to download_blob."""
+    downloader = await cc.get_blob_client(name).download_blob(**kw)
+    async for chunk in downloader.chunks():
+        yield chunk
+
+async def list_sizes(cc, prefix: str) -> Dict[str, int]:
+    """{name: size} of the blobs under `prefix`."""
+    return {b.name: b.size async for b in cc.list_blobs(name_starts_with=prefix)}
+
+async def list_etags(cc, prefix: str) -> Dict[str, str]:
+    """{name: etag} of the blobs under `prefix`."""
+    return {b.name: b.etag async for b in cc.list_blobs(name_starts_with=prefix)}
+
+def sync_chunks(chunks: AsyncIterator[bytes], loop: asyncio.AbstractEventLoop) -> Iterator[bytes]:
+    """Blocking iterator over async `chunks` for worker threads; each next() is awaited on `loop`."""
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(chunks.__anext__(), loop).result()
+        except StopAsyncIteration:
+            return
+
+_DONE = object()
+
+async def iter_in_thread(items: Iterator[T]) -> AsyncIterator[T]:
+    """Items of a blocking iterator, each next() run in a worker thread."""
+    while True:
+        item = await asyncio.to_thread(next, items, _DONE)
+        if item is _DONE:
+            return
+        yield item
+
+# ------------------------------- Fan-out -------------------------------
+
+async def merge_bounded(fn: Callable[[T], AsyncIterator[R]], items: Iterable[T],
+                        limit: int = FANOUT) -> AsyncIterator[R]:
+    """
+    Everything the async iterators fn(item) yield, interleaved as it is
+    produced, at most `limit` iterators running at once. Producers wait while
+    `limit` results are queued, so memory follows `limit`, not the item sizes.
+    """
+    sem = asyncio.Semaphore(max(1, limit))
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, limit))
+
+    async def pump(item):
+        async with sem:
+            async for result in fn(item):
+                await queue.put(result)
+
+    running = {asyncio.ensure_future(pump(it)) for it in items}
+    get = None
+    try:
+        while running or not queue.empty():
+            if get is None:
+                get = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(running | {get}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done & running:
+                task.result()   # a failed producer fails the merge
+            running -= done
+            if get.done():
+                result, get = get.result(), None
+                yield result
+    finally:
+        if get is not None:
+            get.cancel()
+        for task in running:
+            task.cancel()
+
+async def gather_bounded(fn: Callable[[T], Awaitable[R]], items: Iterable[T],
+                         limit: int = FANOUT) -> List[R]:
+    """fn(item) for every item, at most `limit` at once, results in input order."""
+    sem = asyncio.Semaphore(max(1, limit))
+
+    async def guarded(item):
+        async with sem:
+            return await fn(item)
+
+    return list(await asyncio.gather(*(guarded(it) for it in items)))
+
+# ------------------------------- Writes -------------------------------
+
+class _BlockBuffer:
+    """Buffered bytes staged as blocks of one blob, under ids from that blob's writer."""
+
+    def __init__(self, root: "AsyncBlockBlobWriter"):
+        self._root = root
+        self._buf = bytearray()
+        self._blocks: List[BlobBlock] = []
+        self.bytes_written = 0
+
+    def write(self, b) -> int:
+        self._buf += b
+        self.bytes_written += len(b)
+        return len(b)
+
+    # file-object protocol for zipfile/gzip/pyarrow writers; blocks go out in drain()
+    closed = False
+
+    def flush(self) -> None:
+        pass
+
+    def tell(self) -> int:
+        return self.bytes_written
+
+    async def _stage(self, data) -> None:
+        block_id = self._root._next_block_id()
+        await self._root._blob.stage_block(block_id=block_id, data=bytes(data))
+        self._blocks.append(BlobBlock(block_id=block_id))
+
+    async def drain(self) -> None:
+        while len(self._buf) >= self._root._block_size:
+            await self._stage(self._buf[:self._root._block_size])
+            del self._buf[:self._root._block_size]
+
+    async def close(self) -> None:
+        """Stage what is left, short last block included."""
+        await self.drain()
+        if self._buf:
+            await self._stage(self._buf)
+            self._buf.clear()
+
+
+class AsyncBlockBlobWriter(_BlockBuffer):
+    """
+    aio counterpart of storage_helper.BlockBlobWriter. write() only buffers
+    (so sync serializers can write to it); `await drain()` stages every full
+    block. The block list is committed when the `async with` body succeeds;
+    if it raises, nothing is committed.
+
+    `await segment()` reserves the next stretch of the blob for a separate
+    writer, so independent parts (e.g. ZIP members) can be staged
+    concurrently and still land in order.
+    """
+
+    def __init__(self, blob_client, *, block_size: int,
+                 content_type: Optional[str] = None, metadata: Optional[dict] = None):
+        super().__init__(self)
+        self._blob = blob_client
+        self._block_size = block_size
+        self._cs = ContentSettings(content_type=content_type) if content_type else None
+        self.metadata = dict(metadata or {})
+        self._tag = uuid.uuid4().hex[:8]
+        self._ids = 0
+        self._layout: list = []        # BlobBlocks and segments, in blob order
+        self._started = time.perf_counter()
+
+    def _next_block_id(self) -> str:
+        self._ids += 1
+        return base64.b64encode(f"{self._tag}{self._ids - 1:08d}".encode()).decode()
+
+    async def _stage(self, data) -> None:
+        await super()._stage(data)
+        self._layout.append(self._blocks.pop())
+
+    async def segment(self) -> _BlockBuffer:
+        """A writer for the bytes that follow everything written so far; close() it before commit."""
+        await _BlockBuffer.close(self)
+        seg = _BlockBuffer(self)
+        self._layout.append(seg)
+        return seg
+
+    async def commit(self) -> None:
+        await _BlockBuffer.close(self)
+        blocks, size = [], self.bytes_written
+        for item in self._layout:
+            if isinstance(item, _BlockBuffer):
+                if item._buf:
+                    raise RuntimeError("segment not closed before commit")
+                blocks.extend(item._blocks)
+                size += item.bytes_written
+            else:
+                blocks.append(item)
+        extra = {"content_settings": self._cs} if self._cs else {}
+        if self.metadata:
+            extra["metadata"] = self.metadata
+        await self._blob.commit_block_list(blocks, **extra)
+        elapsed = max(time.perf_counter() - self._started, 1e-6)
+        logger.info("[aio_writer] ✅ committed %s/%s blocks=%d %.1f MB (%.1f MB/s)",
+                    self._blob.container_name, self._blob.blob_name, len(blocks),
+                    size / 1e6, size / 1e6 / elapsed)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.commit()
+        else:
+            logger.warning("[aio_writer] aborting %s/%s after %s; nothing committed",
+                           self._blob.container_name, self._blob.blob_name, exc_type.__name__)
+            self._buf.clear()
+        return False
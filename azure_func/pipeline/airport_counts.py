@@ -0,0 +1,140 @@
+# azure_func/pipeline/airport_counts.py
+"""
+Airport x quarter row counts for the manifest, kept dense:
+
+    names   airport codes, one per row of `grid`
+    grid    int64 [len(names), 4]; grid[i, q - 1] = rows of names[i] in quarter q
+
+CSVs are read with the shared Arrow reader (columnar.iter_batches, only the
+two key columns converted). Each batch's dictionary-encoded ORIGIN is folded
+in with one np.bincount over airport_id * 4 + quarter - 1, and files and
+years merge with np.add.at, so per-row and per-airport work stays in numpy.
+The nested {"ATL": {"total": .., "quarters": {"1": ..}}} shape of the
+manifest and the ingest sidecars is only built by to_dict(). Rows with no
+airport or a quarter outside 1..4 are not counted.
+"""
+from typing import BinaryIO, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .columnar import BLOCK_BYTES, col_index, iter_batches, read_header
+
+AIRPORT_COL = "ORIGIN"
+QUARTER_COL = "QUARTER"
+QUARTERS = ("1", "2", "3", "4")
+
+class AirportQuarterCounts:
+    """Dense airport x quarter counts; see the module docstring."""
+
+    def __init__(self):
+        self._ids: dict = {}
+        self.names: list = []
+        self.grid = np.zeros((0, 4), dtype=np.int64)
+
+    def _lookup(self, airports: Sequence[str]) -> np.ndarray:
+        """Row ids of `airports`, adding rows for codes not seen yet."""
+        ids = np.empty(len(airports), dtype=np.int64)
+        for i, airport in enumerate(airports):
+            j = self._ids.get(airport)
+            if j is None:
+                j = self._ids[airport] = len(self.names)
+                self.names.append(airport)
+            ids[i] = j
+        if len(self.names) > len(self.grid):
+            grown = np.zeros((len(self.names), 4), dtype=np.int64)
+            grown[:len(self.grid)] = self.grid
+            self.grid = grown
+        return ids
+
+    def add_codes(self, categories: Sequence[str], codes, quarters) -> None:
+        """
+        Count rows given as indices into `categories` (-1 = missing) and
+        integer quarters. `categories` may repeat or hold blanks.
+        """
+        if not len(categories):
+            return
+        codes = np.asarray(codes, dtype=np.int64)
+        quarters = np.asarray(quarters, dtype=np.int64)
+        # code -1 lands on the trailing False
+        named = np.array([bool(c) for c in categories] + [False])
+        ok = named[codes] & (quarters >= 1) & (quarters <= 4)
+        cells = np.bincount(codes[ok] * 4 + (quarters[ok] - 1), minlength=len(categories) * 4)
+        ids = self._lookup(categories)      # may grow self.grid
+        np.add.at(self.grid, ids, cells.reshape(-1, 4))
+
+    def merge(self, other: "AirportQuarterCounts") -> None:
+        if other.names:
+            ids = self._lookup(other.names)
+            np.add.at(self.grid, ids, other.grid)
+
+    @property
+    def total(self) -> int:
+        return int(self.grid.sum())
+
+    # ---------- conversions ----------
+
+    def to_dict(self) -> dict:
+        """{"ATL": {"total": n, "quarters": {"1": n1, ..., "4": n4}}, ...} for airports with rows."""
+        totals = self.grid.sum(axis=1).tolist()
+        return {name: {"total": t, "quarters": dict(zip(QUARTERS, row))}
+                for name, t, row in zip(self.names, totals, self.grid.tolist()) if t}
+
+    @classmethod
+    def from_dict(cls, counts: dict) -> "AirportQuarterCounts":
+        acc = cls()
+        if counts:
+            acc._lookup(list(counts))
+            acc.grid[:] = [[v["quarters"].get(q, 0) for q in QUARTERS] for v in counts.values()]
+        return acc
+
+    def to_compact(self) -> dict:
+        """JSON-friendly {"airports": [...], "counts": [[q1, q2, q3, q4], ...]}."""
+        return {"airports": list(self.names), "counts": self.grid.tolist()}
+
+    @classmethod
+    def from_compact(cls, doc: dict) -> "AirportQuarterCounts":
+        acc = cls()
+        if doc["airports"]:
+            acc._lookup(doc["airports"])
+            acc.grid[:] = np.asarray(doc["counts"], dtype=np.int64).reshape(-1, 4)
+        return acc
+
+
+# ------------------------------- Counting -------------------------------
+
+def count_csv(source: BinaryIO, *, source_name: str = "<stream>",
+              block_bytes: int = BLOCK_BYTES) -> AirportQuarterCounts:
+    """Counts of a CSV stream, read one Arrow batch at a time; only ORIGIN and QUARTER are converted."""
+    columns = read_header(source)
+    ia, iq = col_index(columns, AIRPORT_COL), col_index(columns, QUARTER_COL)
+    if ia is None or iq is None:
+        raise ValueError(f"Missing '{AIRPORT_COL}' or '{QUARTER_COL}' in {source_name}")
+    acc = AirportQuarterCounts()
+    for batch in iter_batches(source, columns, block_bytes=block_bytes, positions=[ia, iq]):
+        count_text(batch.column(0), batch.column(1), acc)
+    return acc
+
+def count_text(origin: pa.Array, quarter: pa.Array, acc: AirportQuarterCounts) -> None:
+    """count_arrow() for CSV text columns; a quarter that isn't an integer is not counted."""
+    quarter = pc.utf8_trim_whitespace(quarter)
+    quarter = pc.if_else(pc.match_substring_regex(quarter, r"^[+-]?\d+$"), quarter, "0")
+    count_arrow(origin, pc.cast(quarter, pa.int64()), acc)
+
+def count_arrow(origin: pa.Array, quarter: pa.Array, acc: AirportQuarterCounts) -> None:
+    """Add one batch's ORIGIN (string or dictionary) and integer QUARTER columns to `acc`."""
+    if not pa.types.is_dictionary(origin.type):
+        origin = pc.dictionary_encode(origin)
+    acc.add_codes(origin.dictionary.cast(pa.string()).to_pylist(),
+                  origin.indices.fill_null(-1).to_numpy(zero_copy_only=False),
+                  quarter.cast(pa.int64()).fill_null(0).to_numpy(zero_copy_only=False))
+
+def count_parquet(data: bytes) -> AirportQuarterCounts:
+    """Counts of a Parquet-tier file; only the two key columns are read."""
+    acc = AirportQuarterCounts()
+    table = pq.read_table(pa.BufferReader(data), columns=[AIRPORT_COL, QUARTER_COL])
+    for batch in table.to_batches():
+        count_arrow(batch.column(0), batch.column(1), acc)
+    return acc
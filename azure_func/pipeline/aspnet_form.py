@@ -0,0 +1,134 @@
+# azure_func/pipeline/aspnet_form.py
+"""
+ASP.NET form state for the BTS DL_SelectFields pages.
+
+Both fetchers need the same three hidden inputs (and DB1B the year/period
+options) from a ~100 KB page. Instead of a full BeautifulSoup build per
+quarter, pull them out with targeted regexes and keep the result, plus the
+session cookies it belongs to, in a per-page cache with a TTL that every
+run()/year/quarter in the process shares. Callers invalidate() it when BTS
+answers a POST with the form again (stale __VIEWSTATE/__EVENTVALIDATION).
+"""
+import html as _html
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional, Set, TypeVar
+
+import requests
+
+logger = logging.getLogger("bts.form")
+
+TTL_S = float(os.getenv("BTS_FORM_CACHE_TTL_S", "900"))
+
+TOKEN_FIELDS = ("__VIEWSTATE", "__VIEWSTATEGENERATOR", "__EVENTVALIDATION")
+
+T = TypeVar("T")
+
+
+class FormRejected(RuntimeError):
+    """BTS answered a form POST with HTML instead of the ZIP (stale/invalid form state)."""
+
+_ATTR_RE = re.compile(r"""([\w:.-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+_OPTION_RE = re.compile(r"<option\b([^>]*)>", re.I)
+
+
+def _attrs(tag: str) -> Dict[str, str]:
+    return {m.group(1).lower(): _html.unescape(m.group(2) or m.group(3) or m.group(4) or "")
+            for m in _ATTR_RE.finditer(tag)}
+
+def _tag_by_name(page: str, tag: str, name: str) -> Optional[re.Match]:
+    pat = rf"""<{tag}\b[^>]*\bname\s*=\s*["']?{re.escape(name)}["'\s>/][^>]*>"""
+    return re.search(pat, page, re.I)
+
+def hidden_fields(page: str, names=TOKEN_FIELDS) -> Dict[str, str]:
+    """Values of the named <input>s; KeyError if one is missing (same as the soup version)."""
+    out = {}
+    for name in names:
+        m = _tag_by_name(page, "input", name)
+        if not m:
+            raise KeyError(f"Missing hidden field: {name}")
+        out[name] = _attrs(m.group(0)).get("value", "")
+    return out
+
+def select_options(page: str, name: str) -> Set[str]:
+    """Non-empty option values of <select name=...>, stripped."""
+    m = _tag_by_name(page, "select", name)
+    if not m:
+        return set()
+    end = page.find("</select", m.end())
+    body = page[m.end(): end if end != -1 else len(page)]
+    values = (_attrs(o.group(1)).get("value", "").strip() for o in _OPTION_RE.finditer(body))
+    return {v for v in values if v}
+
+def looks_like_form(page: str) -> bool:
+    return "__VIEWSTATE" in page and "__EVENTVALIDATION" in page
+
+
+class FormState:
+    """Tokens + year/period options parsed from one GET of the form page."""
+
+    def __init__(self, page: str, cookies: Dict[str, str]):
+        self.tokens = hidden_fields(page)
+        self.years = {y for y in select_options(page, "cboYear") if y.isdigit()}
+        self.periods = {p for p in select_options(page, "cboPeriod") if p.isdigit()}
+        self.cookies = cookies
+        self.fetched_at = time.monotonic()
+
+    def fresh(self) -> bool:
+        return (time.monotonic() - self.fetched_at) < TTL_S
+
+
+_CACHE: Dict[str, FormState] = {}
+_LOCKS: Dict[str, threading.Lock] = {}
+_LOCKS_GUARD = threading.Lock()
+
+def _lock_for(url: str) -> threading.Lock:
+    with _LOCKS_GUARD:
+        return _LOCKS.setdefault(url, threading.Lock())
+
+def get_form_state(url: str, session: requests.Session,
+                   fetch_page: Callable[[requests.Session], str]) -> FormState:
+    """
+    Cached FormState for `url`. On a miss (or expiry) `fetch_page(session)` does
+    the GET; on a hit the cached cookies are copied into `session` so the POST
+    carries the cookies the tokens were issued with. Concurrent callers for the
+    same page wait for a single fetch.
+    """
+    with _lock_for(url):
+        state = _CACHE.get(url)
+        if state is not None and state.fresh():
+            session.cookies.update(state.cookies)
+            logger.debug("[form] cache hit for %s (age %.0fs)", url, time.monotonic() - state.fetched_at)
+            return state
+        page = fetch_page(session)
+        state = FormState(page, requests.utils.dict_from_cookiejar(session.cookies))
+        _CACHE[url] = state
+        logger.debug("[form] cached form state for %s", url)
+        return state
+
+def invalidate(url: str) -> None:
+    """Drop the cached state for `url` (BTS rejected a POST made with it)."""
+    with _lock_for(url):
+        if _CACHE.pop(url, None) is not None:
+            logger.info("[form] invalidated cached form state for %s", url)
+
+def post_with_form_state(url: str, session: requests.Session,
+                         fetch_page: Callable[[requests.Session], str],
+                         post: Callable[[FormState], T]) -> T:
+    """
+    post(state) with the cached form state; if BTS rejects it (FormRejected, or
+    a 5xx such as an invalid-viewstate error), refetch the form once and retry.
+    """
+    state = get_form_state(url, session, fetch_page)
+    try:
+        return post(state)
+    except (FormRejected, requests.HTTPError) as e:
+        if isinstance(e, requests.HTTPError) and not (
+                e.response is not None and 500 <= e.response.status_code < 600):
+            raise
+        logger.warning("[form] POST rejected (%s); refetching form state and retrying once", e)
+        invalidate(url)
+        return post(get_form_state(url, session, fetch_page))
@@ -0,0 +1,116 @@
+# azure_func/pipeline/blob_clients.py
+"""
+Process-wide Azure Blob clients.
+
+Every module used to build its own BlobServiceClient from the connection
+string, often per call (or per blob), which re-parses the string and opens a
+fresh HTTP pool + TLS handshake each time. Everything now goes through one
+service client whose requests.Session has a connection pool sized for the
+thread pools that share it, and container clients are cached by name.
+
+The async HTTP handlers get the same thing on azure.storage.blob.aio: one
+service client per event loop (its aiohttp session belongs to that loop).
+"""
+import asyncio
+import os
+import threading
+import weakref
+from typing import Dict, Optional
+
+import requests
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient, ContainerClient
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# keep-alive connections per host; must cover the widest thread pool using blobs
+POOL_MAXSIZE = int(os.getenv("BLOB_POOL_MAXSIZE", "32"))
+CONNECT_TIMEOUT = int(os.getenv("BLOB_CONNECT_TIMEOUT", "20"))
+READ_TIMEOUT = int(os.getenv("BLOB_READ_TIMEOUT", "120"))
+# upload_blob() splits anything above SINGLE_PUT_SIZE into BLOCK_SIZE blocks
+BLOCK_SIZE = int(os.getenv("BLOB_BLOCK_SIZE", str(8 << 20)))
+SINGLE_PUT_SIZE = int(os.getenv("BLOB_SINGLE_PUT_SIZE", str(16 << 20)))
+
+_LOCK = threading.Lock()
+_SVC: Optional[BlobServiceClient] = None
+_CONTAINERS: Dict[str, ContainerClient] = {}
+_AIO: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+
+def _conn_str() -> str:
+    conn = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+    if not conn:
+        raise RuntimeError("AZURE_STORAGE_CONNECTION_STRING is not set")
+    return conn
+
+def _session() -> requests.Session:
+    s = requests.Session()
+    # the SDK has its own retry policy; urllib3 retries stay off (same as azure-core's default adapter)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE,
+                          max_retries=Retry(total=False, redirect=False, raise_on_status=False))
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+def service() -> BlobServiceClient:
+    """The shared BlobServiceClient (created on first use)."""
+    global _SVC
+    if _SVC is None:
+        with _LOCK:
+            if _SVC is None:
+                transport = RequestsTransport(session=_session(), session_owner=False,
+                                              connection_timeout=CONNECT_TIMEOUT,
+                                              read_timeout=READ_TIMEOUT)
+                _SVC = BlobServiceClient.from_connection_string(
+                    _conn_str(), transport=transport,
+                    max_block_size=BLOCK_SIZE, max_single_put_size=SINGLE_PUT_SIZE)
+    return _SVC
+
+def container(name: str) -> ContainerClient:
+    """Cached ContainerClient for `name` on the shared pipeline (no existence check)."""
+    cc = _CONTAINERS.get(name)
+    if cc is None:
+        svc = service()
+        with _LOCK:
+            cc = _CONTAINERS.setdefault(name, svc.get_container_client(name))
+    return cc
+
+def etag_key(etag) -> str:
+    """ETag without the quotes the SDK keeps on some responses, for comparing ('' if None)."""
+    return str(etag or "").strip('"')
+
+def pool_workers(requested: int) -> int:
+    """Clamp a thread-pool size to the connection pool, so workers never queue for a socket."""
+    return max(1, min(int(requested), POOL_MAXSIZE))
+
+# ------------------------------- asyncio -------------------------------
+
+def aio_service():
+    """The shared azure.storage.blob.aio BlobServiceClient for the running event loop."""
+    # imported here so the sync functions don't need aiohttp loaded
+    import aiohttp
+    from azure.core.pipeline.transport import AioHttpTransport
+    from azure.storage.blob.aio import BlobServiceClient as AioBlobServiceClient
+
+    loop = asyncio.get_running_loop()
+    clients = _AIO.get(loop)
+    if clients is None:
+        # same knobs azure-core's own session uses, with the pool capped like the sync one
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=POOL_MAXSIZE),
+                                        trust_env=True, auto_decompress=False)
+        transport = AioHttpTransport(session=session, session_owner=False,
+                                     connection_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT)
+        svc = AioBlobServiceClient.from_connection_string(
+            _conn_str(), transport=transport,
+            max_block_size=BLOCK_SIZE, max_single_put_size=SINGLE_PUT_SIZE)
+        clients = _AIO.setdefault(loop, {"service": svc, "containers": {}})
+    return clients["service"]
+
+def aio_container(name: str):
+    """Cached aio ContainerClient for `name` on the running loop's pipeline."""
+    svc = aio_service()
+    containers = _AIO[asyncio.get_running_loop()]["containers"]
+    cc = containers.get(name)
+    if cc is None:
+        cc = containers[name] = svc.get_container_client(name)
+    return cc
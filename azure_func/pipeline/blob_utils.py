@@ -1,20 +1,20 @@
 # azure_func/pipeline/blob_utils.py
 import os
+import re
+import threading
+from typing import Iterable, Tuple
 from azure.storage.blob import BlobServiceClient
 from azure.core.exceptions import ResourceNotFoundError
+from . import blob_clients
 
 DB1B_CONTAINER = os.getenv("DB1B_CONTAINER", "bts-db1b")
 
 def _get_blob_service() -> BlobServiceClient:
-    conn = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-    if not conn:
-        raise RuntimeError("AZURE_STORAGE_CONNECTION_STRING is not set")
-    return BlobServiceClient.from_connection_string(conn)
+    return blob_clients.service()
 
 def _blob_curated_exists(year: int, q: int) -> bool:
     """True if any curated blob exists at {year}/Q{q}/curated/..."""
-    bsc = _get_blob_service()
-    cc = bsc.get_container_client(DB1B_CONTAINER)
+    cc = blob_clients.container(DB1B_CONTAINER)
     try:
         for _ in cc.list_blobs(name_starts_with=f"{year}/Q{q}/curated/"):
             return True
@@ -24,8 +24,7 @@ def _blob_curated_exists(year: int, q: int) -> bool:
 
 def _blob_marker_exists(year: int, q: int) -> bool:
     """True if markers/{year}-Q{q}.done exists."""
-    bsc = _get_blob_service()
-    cc = bsc.get_container_client(DB1B_CONTAINER)
+    cc = blob_clients.container(DB1B_CONTAINER)
     name = f"markers/{year}-Q{q}.done"
     try:
         cc.get_blob_client(name).get_blob_properties()
@@ -33,6 +32,51 @@ def _blob_marker_exists(year: int, q: int) -> bool:
     except Exception:
         return False
 
+_MARKER_RE = re.compile(r"^markers/(\d{4})-Q([1-4])\.done$")
+
+class CompletionIndex:
+    """
+    In-memory view of which DB1B quarters of a plan are done in Blob (marker or
+    any curated blob): one listing of markers/, then one curated-prefix probe per
+    planned quarter without a marker, so a range plan answers every
+    _blob_curated_exists/_blob_marker_exists question without a round trip.
+    mark_done() keeps it current as quarters finish.
+    """
+
+    def __init__(self, done=()):
+        self._done = set(done)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, quarters: Iterable[Tuple[int, int]],
+             container: str = DB1B_CONTAINER) -> "CompletionIndex":
+        """Completion of the (year, quarter) pairs in `quarters`; others read as not done."""
+        cc = blob_clients.container(container)
+        done = set()
+        try:
+            for name in cc.list_blob_names(name_starts_with="markers/"):
+                m = _MARKER_RE.match(name)
+                if m:
+                    done.add((int(m.group(1)), int(m.group(2))))
+            # only the planned quarters' curated prefixes, so the cost follows the plan
+            for y, q in sorted({(int(y), int(q)) for y, q in quarters} - done):
+                names = cc.list_blob_names(name_starts_with=f"{y}/Q{q}/curated/", results_per_page=1)
+                if next(iter(names), None) is not None:
+                    done.add((y, q))
+        except ResourceNotFoundError:
+            pass  # no container yet: nothing done
+        return cls(done)
+
+    def is_done(self, year: int, q: int) -> bool:
+        return (int(year), int(q)) in self._done
+
+    def mark_done(self, year: int, q: int) -> None:
+        with self._lock:
+            self._done.add((int(year), int(q)))
+
+    def __len__(self) -> int:
+        return len(self._done)
+
 # Optional generic helpers that you already had in db1b_timer:
 def _ensure_container(container: str):
     bsc = _get_blob_service()
@@ -42,7 +86,6 @@ def _ensure_container(container: str):
         pass
 
 def blob_exists(container: str, name: str) -> bool:
-    bsc = _get_blob_service()
-    bc = bsc.get_container_client(container)
+    bc = blob_clients.container(container)
     # fast HEAD; no 404 exceptions when using .exists()
     return bc.get_blob_client(name).exists()
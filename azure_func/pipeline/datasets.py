@@ -6,7 +6,7 @@ DATASETS = {
     "db1bmarket": "bts-db1b",
 }
 
-from .storage_helper import upload_file, upload_bytes
+from .storage_helper import upload_file, upload_bytes, open_blob_writer
 
 logger = logging.getLogger("db1b.datasets")
 logger.setLevel(logging.DEBUG)
@@ -25,4 +25,10 @@ def ds_upload_bytes(dataset: str, tier: str, content: bytes, blob_path: str, **k
     logger.debug("[ds_upload_bytes] dataset=%s tier=%s bytes=len(%s) -> %s/%s overwrite=%s",
                  dataset, tier, len(content), container, blob_path, kw.get("overwrite", True))
     logger.info(f"Uploading {tier} bytes to {container}/{blob_path}")
-    return upload_bytes(content, blob_path=blob_path, container=container, **kw)
\ No newline at end of file
+    return upload_bytes(content, blob_path=blob_path, container=container, **kw)
+
+def ds_open_writer(dataset: str, tier: str, blob_path: str, **kw):
+    """Streaming writer for `blob_path` in the dataset's container (see open_blob_writer)."""
+    container = DATASETS[dataset]
+    logger.info(f"Streaming {tier} blob to {container}/{blob_path}")
+    return open_blob_writer(container=container, blob_path=blob_path, **kw)
@@ -1,19 +1,22 @@
 import io, zipfile, argparse, requests, os, logging, time, random, shutil
-from bs4 import BeautifulSoup
 from pathlib import Path
 from datetime import date
 from ..paths import dataset_out
 from typing import Optional, Tuple, Iterable
-from .transform_helper import add_columns
+from .transform_helper import add_columns, transform_stream, PARQUET_TYPES
 from ..datasets import ds_upload
+from ..storage_helper import UploadQueue
+from ..stream_ingest import ingest_zip_stream
+from .. import parquet_tier
+from ..aspnet_form import FormRejected, FormState, get_form_state, post_with_form_state
 from urllib.parse import urlencode
 import logging
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import threading, time, random
+import queue, threading, time, random
 import shutil 
 from requests.adapters import HTTPAdapter, Retry
 from http.client import RemoteDisconnected
-from pipeline.blob_utils import _blob_curated_exists, _blob_marker_exists
+from pipeline.blob_utils import CompletionIndex, _blob_curated_exists, _blob_marker_exists
 
 
 logger = logging.getLogger("db1b.fetch")
@@ -41,6 +44,12 @@ MAX_Q_PER_INVOC = int(os.getenv("DB1B_MAX_Q_PER_INVOC", "1"))
 
 KEEP_LOCAL = os.getenv("DB1B_KEEP_LOCAL", "0").lower() not in {"0", "false", "no"}
 
+# Quarters buffered between download -> transform -> upload stages
+PIPELINE_DEPTH = int(os.getenv("DB1B_PIPELINE_DEPTH", "1"))
+
+# Unzip/transform/upload straight from the POST body (no local files, bounded memory)
+STREAM_INGEST = os.getenv("DB1B_STREAM_INGEST", "0").lower() not in {"0", "false", "no"}
+
 def _jitter(a: float, b: float) -> None:
     time.sleep(random.uniform(a, b))
 
@@ -92,18 +101,8 @@ def make_session() -> requests.Session:
     s.headers.update(HEADERS)
     return s
 
-def _available_years_periods(html: str):
-    soup = BeautifulSoup(html, "html.parser")
-    def opts(name):
-        sel = soup.find("select", {"name": name})
-        if not sel:
-            return set()
-        return {o.get("value", "").strip() for o in sel.find_all("option") if o.get("value")}
-    years = {y for y in opts("cboYear") if y.isdigit()}
-    periods = {p for p in opts("cboPeriod") if p.isdigit()}
-    return years, periods
-
-def get_tokens(session: requests.Session) -> dict:
+def _fetch_form_page(session: requests.Session) -> str:
+    """GET the download form (with retry/backoff); returns the page HTML."""
     attempts = MAX_RETRIES
     last_exc = None
     for attempt in range(1, attempts + 1):
@@ -121,19 +120,7 @@ def get_tokens(session: requests.Session) -> dict:
                 Path("page_debug.html").write_text(r.text, encoding="utf-8")
                 raise RuntimeError("Did not receive ASP.NET form. Saved to page_debug.html")
 
-            soup = BeautifulSoup(r.text, "html.parser")
-            def val(name):
-                tag = soup.find("input", {"name": name})
-                if not tag:
-                    raise KeyError(f"Missing hidden field: {name}")
-                return tag["value"]
-
-            return {
-                "__VIEWSTATE": val("__VIEWSTATE"),
-                "__VIEWSTATEGENERATOR": val("__VIEWSTATEGENERATOR"),
-                "__EVENTVALIDATION": val("__EVENTVALIDATION"),
-                "_HTML": r.text,
-            }
+            return r.text
 
         except (requests.ReadTimeout, requests.ConnectTimeout, requests.ConnectionError, RemoteDisconnected) as e:
             last_exc = e
@@ -156,6 +143,13 @@ def get_tokens(session: requests.Session) -> dict:
             raise
     raise RuntimeError(f"GET form failed after {attempts} attempts: {last_exc}")
 
+def get_form(session: requests.Session) -> FormState:
+    """Tokens + year/period options, shared across quarters for BTS_FORM_CACHE_TTL_S."""
+    return get_form_state(PAGE, session, _fetch_form_page)
+
+def get_tokens(session: requests.Session) -> dict:
+    return dict(get_form(session).tokens)
+
 
 
 def _local_quarter_done(year: str, q: int) -> bool:
@@ -170,13 +164,17 @@ def _write_done_marker_local(year: str, q: int) -> None:
 def _marker_exists_local(year: str, q: int) -> bool:
     return (dataset_out(DATASET, "markers") / f"{year}-Q{q}.done").exists()
 
-def _already_done_anywhere(year: int, q: int) -> bool:
+def _already_done_anywhere(year: int, q: int, index: Optional[CompletionIndex] = None) -> bool:
     """
     Unified check: local curated or marker, OR blob curated or marker.
+    With a CompletionIndex the blob half is answered from memory.
     """
     try_local = _local_quarter_done(str(year), q) or _marker_exists_local(str(year), q)
-    try_blob  = _blob_curated_exists(year, q) or _blob_marker_exists(year, q)
-    return try_local or try_blob
+    if try_local:
+        return True
+    if index is not None:
+        return index.is_done(year, q)
+    return _blob_curated_exists(year, q) or _blob_marker_exists(year, q)
 
 # ------------------------------- Core Runner ----------------------------------
 
@@ -211,7 +209,7 @@ def _post_and_get_zip(session: requests.Session, payload: dict) -> bytes:
                 ct = (dr.headers.get("Content-Type") or "").lower()
                 if ("zip" not in ct) and ("application/octet-stream" not in ct):
                     Path("error_not_zip.html").write_text(dr.text, encoding="utf-8")
-                    raise RuntimeError(f"Expected ZIP, got Content-Type={ct}")
+                    raise FormRejected(f"Expected ZIP, got Content-Type={ct}")
                 return dr.content
 
             else:
@@ -237,7 +235,7 @@ def _post_and_get_zip(session: requests.Session, payload: dict) -> bytes:
                         except Exception:
                             sample = b""
                         Path("error_not_zip.html").write_bytes(sample or b"")
-                        raise RuntimeError(f"Expected ZIP, got Content-Type={ct}")
+                        raise FormRejected(f"Expected ZIP, got Content-Type={ct}")
 
                     # Stream the body into memory with a stall watchdog
                     buf = io.BytesIO()
@@ -275,10 +273,34 @@ def _post_and_get_zip(session: requests.Session, payload: dict) -> bytes:
 
     raise RuntimeError(f"POST failed after {total_attempts} attempts: {last_exc}")
 
-def run(year="2025", geography="All", quarter="1") -> Path:
+def _check_available(form: FormState, y: str, periods: Iterable[int]) -> None:
+    avail_years, avail_periods = form.years, form.periods
+    if y not in avail_years:
+        raise RuntimeError(f"Year {y} is not available on BTS form (have e.g.: {sorted(avail_years)[:5]} …).")
+    for q in periods:
+        if str(q) not in avail_periods:
+            raise RuntimeError(f"Quarter {q} not available on BTS form (have: {sorted(avail_periods)}).")
+
+def _quarter_payload(tokens: dict, y: str, geography: str, q: int) -> dict:
+    payload = {
+        **tokens,
+        "__EVENTTARGET": "", "__EVENTARGUMENT": "", "__LASTFOCUS": "",
+        "txtSearch": "",
+        "cboGeography": geography,
+        "cboYear": y,
+        "cboPeriod": str(q),
+        "btnDownload": "Download",
+    }
+    for f in FIELDS:
+        payload[f] = "on"
+    return payload
+
+def run(year="2025", geography="All", quarter="1",
+        index: Optional[CompletionIndex] = None) -> Path:
     """
     Download one or more quarters for a given year (or All), rename CSVs, return last outdir.
-    Skips any quarter that's already done locally or in Blob (curated/marker).
+    Skips any quarter that's already done locally or in Blob (curated/marker), asking
+    `index` for the blob half (listed here for several quarters if not given).
     """
     y = str(year).strip()
     periods = [1, 2, 3, 4] if str(quarter).lower() == "all" else [int(quarter)]
@@ -286,16 +308,12 @@ def run(year="2025", geography="All", quarter="1") -> Path:
 
     last_outdir: Optional[Path] = None
     with make_session() as s:
-        tokens = get_tokens(s)
-        avail_years, avail_periods = _available_years_periods(tokens["_HTML"])
-        if y not in avail_years:
-            raise RuntimeError(f"Year {y} is not available on BTS form (have e.g.: {sorted(avail_years)[:5]} …).")
-        for q in periods:
-            if str(q) not in avail_periods:
-                raise RuntimeError(f"Quarter {q} not available on BTS form (have: {sorted(avail_periods)}).")
+        _check_available(get_form(s), y, periods)
+        if index is None and len(periods) > 1:
+            index = CompletionIndex.load((int(y), q) for q in periods)
 
         for q in periods:
-            if _already_done_anywhere(int(y), q):
+            if _already_done_anywhere(int(y), q, index):
                 logger.info("[run] ⏭️ skip year=%s Q%s (already done locally/blob)", y, q)
                 outdir = dataset_out(DATASET, f"year={y}", f"Q{q}", "download")
                 outdir.mkdir(parents=True, exist_ok=True)
@@ -307,19 +325,10 @@ def run(year="2025", geography="All", quarter="1") -> Path:
             outdir.mkdir(parents=True, exist_ok=True)
             logger.debug("[run] q=%s outdir(local)=%s", q, outdir)
 
-            payload = {
-                **tokens,
-                "__EVENTTARGET": "", "__EVENTARGUMENT": "", "__LASTFOCUS": "",
-                "txtSearch": "",
-                "cboGeography": geography,
-                "cboYear": y,
-                "cboPeriod": str(q),
-                "btnDownload": "Download",
-            }
-            for f in FIELDS:
-                payload[f] = "on"
-
-            zip_bytes = _post_and_get_zip(s, payload)
+            # cached tokens; refetched once if BTS answers with the form instead of a ZIP
+            zip_bytes = post_with_form_state(
+                PAGE, s, _fetch_form_page,
+                lambda form: _post_and_get_zip(s, _quarter_payload(form.tokens, y, geography, q)))
             with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
                 zf.extractall(outdir)
                 logger.debug("[run] extracted %d files into %s", len(zf.namelist()), outdir.resolve())
@@ -344,59 +353,260 @@ def run(year="2025", geography="All", quarter="1") -> Path:
 
     return last_outdir or dataset_out(DATASET, f"year={y}", f"Q{periods[-1]}", "download")
 
-# ------------------------------- Orchestration --------------------------------
-
-def handle_year(year: str, geography: str = "All", quarter: str = "All") -> None:
-    quarters = [1, 2, 3, 4] if str(quarter).lower() in {"all", "*"} else [int(quarter)]
-
-    for q in quarters:
-        if _already_done_anywhere(int(year), q):
-            logger.info("[handle_year] ⏭️ skipping year=%s Q%s (already done)", year, q)
-            continue
-
-        outdir = None
-        outdir_updated = None
-        logger.debug("[handle_year] ▶️ start year=%s q=%s", year, q)
-
+def _open_zip_stream(session: requests.Session, payload: dict, started: float) -> requests.Response:
+    """
+    Streaming counterpart of _post_and_get_zip: same retry/backoff and patient
+    final attempt, but returns the open response as soon as the headers say ZIP.
+    The caller owns (and must close) the response.
+    """
+    last_exc: Optional[BaseException] = None
+    total_attempts = MAX_RETRIES
+    for attempt in range(1, total_attempts + 1):
+        if time.monotonic() - started > PER_QUARTER_DEADLINE_S:
+            raise TimeoutError(f"Per-quarter deadline ({PER_QUARTER_DEADLINE_S}s) exceeded")
+        use_patient = PATIENT_MODE and attempt == total_attempts
+        timeout = (CONNECT_TO, PATIENT_READ_TO) if use_patient else TIMEOUT
         try:
-            outdir = run(year=year, geography=geography, quarter=q)
-
-            outdir_updated = dataset_out(DATASET, f"year={year}", f"Q{q}", "updated")
-            outdir_updated.mkdir(parents=True, exist_ok=True)
-
-            for initial_file in sorted(outdir.glob("*.csv")):
-                # upload RAW (optional—keep if you need audit)
-                raw_blob = f"{year}/Q{q}/raw/{initial_file.name}"
-                ds_upload(DATASET, "raw", str(initial_file), raw_blob, content_type="text/csv")
+            _jitter(0.25, 0.9)
+            resp = session.post(PAGE, data=payload, allow_redirects=True, stream=True, timeout=timeout)
+            try:
+                resp.raise_for_status()
+                ct = (resp.headers.get("Content-Type") or "").lower()
+                if ("zip" not in ct) and ("application/octet-stream" not in ct):
+                    try:
+                        sample = resp.raw.read(4096, decode_content=True)
+                    except Exception:
+                        sample = b""
+                    Path("error_not_zip.html").write_bytes(sample or b"")
+                    raise FormRejected(f"Expected ZIP, got Content-Type={ct}")
+            except BaseException:
+                resp.close()
+                raise
+            logger.debug("POST -> %s (streaming, attempt %d/%d)", resp.status_code, attempt, total_attempts)
+            return resp
 
-                # build curated
-                updated_file = outdir_updated / initial_file.name.replace(".csv", "__with_metrics.csv")
-                add_columns(initial_file, updated_file)
+        except (requests.ReadTimeout, requests.ConnectTimeout, requests.ConnectionError, RemoteDisconnected) as e:
+            last_exc = e
+            if attempt >= total_attempts:
+                break
+            backoff = min(60.0, (2 ** attempt) + random.random())
+            logger.warning("%s; retrying in %.1fs (attempt %d/%d)",
+                           type(e).__name__, backoff, attempt + 1, total_attempts)
+            time.sleep(backoff)
+        except requests.HTTPError as e:
+            if attempt < total_attempts and 500 <= e.response.status_code < 600:
+                backoff = min(60.0, (2 ** attempt) + random.random())
+                logger.warning("HTTP %d; retrying in %.1fs (attempt %d/%d)",
+                               e.response.status_code, backoff, attempt + 1, total_attempts)
+                time.sleep(backoff)
+                continue
+            raise
 
-                # upload CURATED
-                curated_blob = f"{year}/Q{q}/curated/{updated_file.name}"
-                ds_upload(DATASET, "curated", str(updated_file), curated_blob,
-                          content_type="text/csv", overwrite=False)
+    raise RuntimeError(f"POST failed after {total_attempts} attempts: {last_exc}")
 
-                if not KEEP_LOCAL:
-                    try: updated_file.unlink()
-                    except FileNotFoundError: pass
-                    try: initial_file.unlink()
-                    except FileNotFoundError: pass
+def _iter_body(resp: requests.Response, started: float) -> Iterable[bytes]:
+    """Response chunks, enforcing the stall watchdog and the per-quarter deadline."""
+    last_progress = time.monotonic()
+    for chunk in resp.iter_content(CHUNK_SIZE):
+        now = time.monotonic()
+        if chunk:
+            last_progress = now
+            yield chunk
+        if (now - last_progress) > CHUNK_STALL_SECONDS:
+            raise requests.ReadTimeout(f"No data for {CHUNK_STALL_SECONDS}s while streaming")
+        if now - started > PER_QUARTER_DEADLINE_S:
+            raise TimeoutError(f"Per-quarter deadline ({PER_QUARTER_DEADLINE_S}s) exceeded while streaming")
+
+def run_streaming(year: str, geography: str, q: int) -> list[tuple[str, int]]:
+    """
+    One quarter, POST body -> raw + curated blobs with no local files.
+    Blob names match the file-based path in handle_year. Returns
+    [(curated_blob, rows), ...]; raises on failure with nothing committed.
+    """
+    y = str(year).strip()
+    started = time.monotonic()
+    with make_session() as s:
+        _check_available(get_form(s), y, [q])
+        resp = post_with_form_state(
+            PAGE, s, _fetch_form_page,
+            lambda form: _open_zip_stream(s, _quarter_payload(form.tokens, y, geography, q), started))
+        with resp:
+            written = ingest_zip_stream(
+                _iter_body(resp, started),
+                dataset=DATASET,
+                prefix=f"{y}/Q{q}",
+                tag=f"{y}Q{q}",
+                transform=transform_stream,
+                curated_kw={"overwrite": False},
+                year=y,
+                parquet_types=PARQUET_TYPES if parquet_tier.ENABLED else None,
+            )
+    logger.debug("[run_streaming] year=%s Q%s took %.1fs", y, q, time.monotonic() - started)
+    return written
 
-            # local marker (tiny); blob curated presence already acts as a global marker
-            _write_done_marker_local(year, q)
-            logger.info("[handle_year] ✅ done year=%s Q%s (marker written)", year, q)
+# ------------------------------- Orchestration --------------------------------
 
+class _QuarterJob:
+    """One quarter moving through download -> transform -> upload."""
+
+    def __init__(self, year: str, q: int, index: Optional[CompletionIndex] = None):
+        self.year = year
+        self.q = q
+        self.index = index
+        self.started = time.monotonic()
+        self.outdir: Optional[Path] = None
+        self.outdir_updated: Optional[Path] = None
+        self.outdir_parquet: Optional[Path] = None
+        # (initial_file, updated_file, parquet_name, parquet_parts)
+        self.files: list = []
+
+def _download_quarter(job: _QuarterJob, geography: str) -> None:
+    # run() enforces PER_QUARTER_DEADLINE_S on the download
+    job.outdir = run(year=job.year, geography=geography, quarter=job.q, index=job.index)
+
+def _transform_quarter(job: _QuarterJob) -> None:
+    year, q = job.year, job.q
+    job.outdir_updated = dataset_out(DATASET, f"year={year}", f"Q{q}", "updated")
+    job.outdir_updated.mkdir(parents=True, exist_ok=True)
+    job.outdir_parquet = dataset_out(DATASET, f"year={year}", f"Q{q}", "parquet")
+
+    for initial_file in sorted(job.outdir.glob("*.csv")):
+        # build curated (+ typed Parquet copy from the same batches)
+        updated_file = job.outdir_updated / initial_file.name.replace(".csv", "__with_metrics.csv")
+        pq_name = f"{initial_file.stem}.parquet"
+        if parquet_tier.ENABLED:
+            with parquet_tier.local_writer(job.outdir_parquet, pq_name, PARQUET_TYPES) as pq_writer:
+                add_columns(initial_file, updated_file, on_batch=pq_writer)
+            pq_parts = pq_writer.rows
+        else:
+            add_columns(initial_file, updated_file)
+            pq_parts = {}
+        job.files.append((initial_file, updated_file, pq_name, pq_parts))
+
+def _upload_quarter(job: _QuarterJob) -> None:
+    year, q = job.year, job.q
+    # raw, curated and Parquet go up side by side; local files are removed once all landed
+    with UploadQueue() as uploads:
+        for initial_file, updated_file, pq_name, pq_parts in job.files:
+            # upload RAW (optional—keep if you need audit)
+            raw_blob = f"{year}/Q{q}/raw/{initial_file.name}"
+            uploads.submit(ds_upload, DATASET, "raw", str(initial_file), raw_blob, content_type="text/csv")
+
+            # upload CURATED
+            curated_blob = f"{year}/Q{q}/curated/{updated_file.name}"
+            uploads.submit(ds_upload, DATASET, "curated", str(updated_file), curated_blob,
+                           content_type="text/csv", overwrite=False)
+            uploads.submit(parquet_tier.upload_local_parts, DATASET, year, job.outdir_parquet,
+                           pq_name, pq_parts, overwrite=False)
+
+    for initial_file, updated_file, _pq_name, _pq_parts in job.files:
+        if not KEEP_LOCAL:
+            try: updated_file.unlink()
+            except FileNotFoundError: pass
+            try: initial_file.unlink()
+            except FileNotFoundError: pass
+
+    # local marker (tiny); blob curated presence already acts as a global marker
+    _write_done_marker_local(year, q)
+    if job.index is not None:
+        job.index.mark_done(int(year), q)
+    logger.info("[handle_year] ✅ done year=%s Q%s in %.1fs (marker written)",
+                year, q, time.monotonic() - job.started)
+
+def _cleanup_quarter(job: _QuarterJob) -> None:
+    if KEEP_LOCAL:
+        return
+    for d in (job.outdir, job.outdir_updated, job.outdir_parquet):
+        try: shutil.rmtree(d, ignore_errors=True)
+        except Exception: pass
+
+def _stage_worker(name: str, inbox: "queue.Queue", outbox: Optional["queue.Queue"], step) -> None:
+    """Pull jobs from inbox, run step(job), pass them on. A failed job is logged,
+    cleaned up and dropped (no marker, so the next run retries it). None = stop."""
+    while True:
+        job = inbox.get()
+        if job is None:
+            if outbox is not None:
+                outbox.put(None)
+            return
+        try:
+            step(job)
         except Exception as e:
-            logger.exception("[handle_year] ❌ failed year=%s Q%s: %s", year, q, e)
+            logger.exception("[%s] ❌ failed year=%s Q%s: %s", name, job.year, job.q, e)
+            _cleanup_quarter(job)
+            continue
+        if outbox is not None:
+            outbox.put(job)
+        else:
+            _cleanup_quarter(job)
+
+def run_quarters(year_quarters: Iterable[Tuple[int, int]], geography: str = "All",
+                 index: Optional[CompletionIndex] = None) -> None:
+    """
+    Process quarters as a three-stage pipeline: POST+extract on the calling
+    thread, transform and upload on one worker thread each, joined by queues of
+    DB1B_PIPELINE_DEPTH. Quarter N+1 downloads while quarter N is transformed
+    and uploaded; the bounded queues keep at most depth+1 quarters on local disk
+    per stage. _already_done_anywhere is checked right before each download and
+    the marker is only written after the last upload, as before. Blob
+    completion comes from `index` (listed once here if not given).
+    """
+    year_quarters = list(year_quarters)
+    if not year_quarters:
+        return
+    if index is None:
+        index = CompletionIndex.load(year_quarters)
+
+    if STREAM_INGEST:
+        # streaming fuses all three stages into one pass per quarter
+        for y, q in year_quarters:
+            year = str(y)
+            if _already_done_anywhere(int(year), q, index):
+                logger.info("[handle_year] ⏭️ skipping year=%s Q%s (already done)", year, q)
+                continue
+            try:
+                run_streaming(year, geography, q)
+                _write_done_marker_local(year, q)
+                index.mark_done(int(year), q)
+                logger.info("[handle_year] ✅ done year=%s Q%s (streamed, marker written)", year, q)
+            except Exception as e:
+                logger.exception("[handle_year] ❌ failed year=%s Q%s: %s", year, q, e)
+        return
+
+    to_transform: "queue.Queue" = queue.Queue(maxsize=PIPELINE_DEPTH)
+    to_upload: "queue.Queue" = queue.Queue(maxsize=PIPELINE_DEPTH)
+    workers = [
+        threading.Thread(target=_stage_worker, name="db1b-transform",
+                         args=("transform", to_transform, to_upload, _transform_quarter), daemon=True),
+        threading.Thread(target=_stage_worker, name="db1b-upload",
+                         args=("upload", to_upload, None, _upload_quarter), daemon=True),
+    ]
+    for t in workers:
+        t.start()
+
+    try:
+        for y, q in year_quarters:
+            year = str(y)
+            if _already_done_anywhere(int(year), q, index):
+                logger.info("[handle_year] ⏭️ skipping year=%s Q%s (already done)", year, q)
+                continue
+            job = _QuarterJob(year, q, index)
+            logger.debug("[handle_year] ▶️ start year=%s q=%s", year, q)
+            try:
+                _download_quarter(job, geography)
+            except Exception as e:
+                logger.exception("[handle_year] ❌ failed year=%s Q%s: %s", year, q, e)
+                _cleanup_quarter(job)
+                continue
+            to_transform.put(job)   # blocks while the transform stage is full
+    finally:
+        to_transform.put(None)
+        for t in workers:
+            t.join()
 
-        finally:
-            if not KEEP_LOCAL:
-                try: shutil.rmtree(outdir, ignore_errors=True)
-                except Exception: pass
-                try: shutil.rmtree(outdir_updated, ignore_errors=True)
-                except Exception: pass
+def handle_year(year: str, geography: str = "All", quarter: str = "All") -> None:
+    quarters = [1, 2, 3, 4] if str(quarter).lower() in {"all", "*"} else [int(quarter)]
+    run_quarters([(int(year), q) for q in quarters], geography=geography)
 
 # ----------------------- Range runner: “start from last missing” --------------
 
@@ -416,16 +626,22 @@ def process_next_quarters_by_cloud_progress(start_year: int,
     if max_quarters_per_invocation is None:
         max_quarters_per_invocation = MAX_Q_PER_INVOC
 
-    done_this_run = 0
+    # one markers/ listing, then a curated probe only for the unmarked quarters since start_year
+    index = CompletionIndex.load(_quarters_in_range(start_year, end_year))
+    logger.debug("[process_next_quarters_by_cloud_progress] %d quarter(s) done in blob", len(index))
+
+    todo = []
     for (y, q) in _quarters_in_range(start_year, end_year):
-        if _already_done_anywhere(y, q):
+        if _already_done_anywhere(y, q, index):
             continue
-        # Process exactly this one quarter (resume-safe)
-        handle_year(year=str(y), geography=geography, quarter=str(q))
-        done_this_run += 1
-        if done_this_run >= max_quarters_per_invocation:
+        todo.append((y, q))
+        if len(todo) >= max_quarters_per_invocation:
             break
 
+    # Pipelined: next quarter downloads while the previous one transforms/uploads (resume-safe)
+    run_quarters(todo, geography=geography, index=index)
+    done_this_run = len(todo)
+
     if done_this_run == 0:
         logger.info("[process_next_quarters_by_cloud_progress] ✅ %d-%d already complete.",
                     start_year, end_year)
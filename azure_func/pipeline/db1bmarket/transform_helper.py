@@ -1,35 +1,32 @@
-import csv
 from pathlib import Path
+from typing import BinaryIO, Optional
+
+import pyarrow as pa
+
+from ..columnar import BatchHook, add_product_columns
 
 #only RPM
-def add_columns(source_path: Path, new_path: Path) -> None:
-    new_path.parent.mkdir(parents=True, exist_ok=True)
-    with source_path.open("r", newline='', encoding="utf-8") as source_file, \
-        new_path.open("w", newline= '', encoding="utf-8") as new_file:
-        reader = csv.DictReader(source_file)
-        existing_columns = list(reader.fieldnames or [])
-        extra_cols = ["RPM"]
-        for newcol in extra_cols:
-            if newcol not in existing_columns:
-                existing_columns.append(newcol)
-        writer = csv.DictWriter(new_file, fieldnames=existing_columns)
-        writer.writeheader()
+METRICS = {
+    "RPM": ("PASSENGERS", "MARKET_DISTANCE"),
+}
 
-        for row in reader:
-            # robust parse: handles "0.00", "1,234", blanks
-            def num(s):
-                if s is None: return 0.0
-                s = s.strip().replace(",", "")
-                if s == "": return 0.0
-                try:
-                    return float(s)
-                except ValueError:
-                    return 0.0
+# Parquet tier column types; anything not listed stays a plain string
+_CODE = pa.dictionary(pa.int32(), pa.string())
+PARQUET_TYPES = {
+    "YEAR": pa.int32(), "QUARTER": pa.int32(),
+    "ORIGIN_AIRPORT_ID": pa.int32(), "ORIGIN_CITY_MARKET_ID": pa.int32(), "ORIGIN": _CODE,
+    "DEST_AIRPORT_ID": pa.int32(), "DEST_CITY_MARKET_ID": pa.int32(), "DEST": _CODE,
+    "PASSENGERS": pa.float64(), "MARKET_FARE": pa.float64(),
+    "MARKET_DISTANCE": pa.float64(), "MARKET_MILES_FLOWN": pa.float64(), "NONSTOP_MILES": pa.float64(),
+    "RPM": pa.int64(),
+}
 
-            pax   = num(row.get("PASSENGERS"))
-            dist  = num(row.get("MARKET_DISTANCE"))
-            rpm = pax * dist
-  
-            row["RPM"] = str(int(round(rpm)))
+def transform_stream(source: BinaryIO, dest: BinaryIO, on_batch: Optional[BatchHook] = None) -> int:
+    """Columnar RPM transform between two binary CSV streams. Returns row count."""
+    return add_product_columns(source, dest, METRICS, on_batch=on_batch)
 
-            writer.writerow(row)
\ No newline at end of file
+def add_columns(source_path: Path, new_path: Path, on_batch: Optional[BatchHook] = None) -> int:
+    """Write `new_path` = `source_path` plus the RPM column. Returns row count."""
+    new_path.parent.mkdir(parents=True, exist_ok=True)
+    with source_path.open("rb") as source_file, new_path.open("wb") as new_file:
+        return transform_stream(source_file, new_file, on_batch=on_batch)
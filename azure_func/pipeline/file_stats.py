@@ -0,0 +1,89 @@
+# azure_func/pipeline/file_stats.py
+"""
+Row-count sidecar written by the ingest next to every curated CSV:
+
+    {curated}.csv.stats.json
+    {"version": 2, "key": "ORIGIN", "etag": <curated ETag>, "bytes": <curated size>, "rows": N,
+     "airports": {"ATL": {"total": 123, "quarters": {"1": 30, "2": 31, "3": 29, "4": 33}}, ...}}
+
+"airports" has the shape of count_rowst100.airport_quarter_counts_from_bytes(),
+so the manifest build merges sidecars instead of reading the data files. The
+counts come from the transform's batches (StatsCounter is a BatchHook, adding
+each batch to an airport_counts grid); a sidecar is only trusted while "etag"
+is the curated blob's ETag (it is written after the blob is committed).
+"""
+import json
+import logging
+import os
+from typing import List, Optional
+
+import pyarrow as pa
+from azure.core.exceptions import ResourceNotFoundError
+
+from .airport_counts import AIRPORT_COL, QUARTER_COL, AirportQuarterCounts, count_text
+from .blob_clients import etag_key
+from .columnar import BatchHook, col_index
+
+logger = logging.getLogger("bts.file_stats")
+
+# CURATED_FILE_STATS=0: no sidecars; the manifest build counts the data files itself
+ENABLED = os.getenv("CURATED_FILE_STATS", "1").lower() not in {"0", "false", "no"}
+
+SUFFIX = ".stats.json"
+
+
+def stats_blob_name(curated_blob: str) -> str:
+    return curated_blob + SUFFIX
+
+
+class StatsCounter:
+    """
+    BatchHook counting rows per ORIGIN x QUARTER of every batch it sees, then
+    passing the batch on to `then` (e.g. the Parquet tier writer). Rows with
+    a blank origin or a quarter outside 1..4 are left out of `airports` (as
+    the manifest counter drops them) but still count in `rows`.
+    """
+
+    def __init__(self, then: Optional[BatchHook] = None):
+        self._then = then
+        self._idx = None
+        self.rows = 0
+        self.counts = AirportQuarterCounts()
+
+    def __call__(self, columns: List[str], arrays: List[pa.Array]) -> None:
+        if self._idx is None:
+            self._idx = (col_index(columns, AIRPORT_COL), col_index(columns, QUARTER_COL))
+        self.rows += len(arrays[0]) if arrays else 0
+        ia, iq = self._idx
+        if ia is not None and iq is not None and arrays:
+            count_text(arrays[ia], arrays[iq], self.counts)
+        if self._then is not None:
+            self._then(columns, arrays)
+
+    @property
+    def airports(self) -> dict:
+        return self.counts.to_dict()
+
+    def document(self, total_bytes: int, etag: Optional[str]) -> dict:
+        """The sidecar for the curated blob as committed with `etag`."""
+        return {"version": 2, "key": AIRPORT_COL, "etag": etag_key(etag), "bytes": int(total_bytes),
+                "rows": self.rows, "airports": self.airports}
+
+
+def to_bytes(doc: dict) -> bytes:
+    return json.dumps(doc, separators=(",", ":")).encode("utf-8")
+
+def load(cc, curated_blob: str, etag: str) -> Optional[dict]:
+    """The sidecar's "airports" counts for `curated_blob` (now at `etag`), or None if missing/unreadable/stale."""
+    try:
+        doc = json.loads(cc.get_blob_client(stats_blob_name(curated_blob)).download_blob().readall())
+    except ResourceNotFoundError:
+        return None
+    except ValueError:
+        logger.warning("[file_stats] unreadable sidecar for %s", curated_blob)
+        return None
+    if doc.get("version") != 2 or not doc.get("etag") or doc["etag"] != etag_key(etag):
+        logger.info("[file_stats] stale sidecar for %s (built for %s, blob is %s)",
+                    curated_blob, doc.get("etag"), etag_key(etag))
+        return None
+    return doc["airports"]
@@ -0,0 +1,110 @@
+# azure_func/pipeline/ingest_state.py
+"""
+Per-year ingest state, so a re-ingest of unchanged BTS data can stop after
+the download:
+
+    state/{year}.json   {"year", "digest", "files": {raw_name: {"sha256", "rows"}}, "ingested_at"}
+    markers/manifest.dirty   written whenever a year's content changed
+
+`digest` covers the decompressed CSVs (not the ZIP, whose member timestamps
+change on every BTS export). BuildManifestTimer only rebuilds while the dirty
+marker exists.
+"""
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from azure.core.exceptions import ResourceNotFoundError
+
+from .datasets import DATASETS, ds_upload_bytes
+from .storage_helper import download_blob, get_container_client
+
+logger = logging.getLogger("bts.ingest_state")
+
+ENABLED = os.getenv("INGEST_CHANGE_DETECTION", "1").lower() not in {"0", "false", "no"}
+
+STATE_PREFIX = "state"
+MANIFEST_DIRTY = "markers/manifest.dirty"
+
+_READ_CHUNK = 1 << 20
+
+# ------------------------------- Hashing --------------------------------------
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(_READ_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def combined_digest(file_digests: Dict[str, str]) -> str:
+    """One digest for a set of files, independent of listing order."""
+    h = hashlib.sha256()
+    for name in sorted(file_digests):
+        h.update(f"{name}:{file_digests[name]}\n".encode())
+    return h.hexdigest()
+
+# ------------------------------- State blobs ----------------------------------
+
+def state_blob_name(year) -> str:
+    return f"{STATE_PREFIX}/{int(year)}.json"
+
+def load_state(dataset: str, year) -> Optional[dict]:
+    try:
+        return json.loads(download_blob(state_blob_name(year), container=DATASETS[dataset]))
+    except ResourceNotFoundError:
+        return None
+    except ValueError:
+        logger.warning("[ingest_state] unreadable %s; treating as missing", state_blob_name(year))
+        return None
+
+def is_unchanged(dataset: str, year, file_digests: Dict[str, str],
+                 curated_blobs: list[str]) -> bool:
+    """
+    True if the downloaded files hash the same as the last recorded ingest
+    and that ingest's curated blobs are still there.
+    """
+    if not ENABLED:
+        return False
+    state = load_state(dataset, year)
+    if not state or state.get("digest") != combined_digest(file_digests):
+        return False
+    cc = get_container_client(DATASETS[dataset])
+    missing = [b for b in curated_blobs if not cc.get_blob_client(b).exists()]
+    if missing:
+        logger.info("[ingest_state] %s %s unchanged but curated blob(s) missing: %s", dataset, year, missing)
+        return False
+    return True
+
+def file_check(dataset: str, state: Optional[dict]) -> Callable[[str, str, str], bool]:
+    """
+    Per-file is_unchanged() against `state` (load_state()), for streaming
+    ingests that hash each file before transforming it:
+    check(raw name, sha256, curated_blob) -> True if it can be skipped.
+    """
+    files = (state or {}).get("files", {}) if ENABLED else {}
+    cc = get_container_client(DATASETS[dataset])
+
+    def check(raw_name: str, sha256: str, curated_blob: str) -> bool:
+        recorded = files.get(raw_name) or {}
+        return recorded.get("sha256") == sha256 and cc.get_blob_client(curated_blob).exists()
+    return check
+
+def record(dataset: str, year, file_digests: Dict[str, str], rows: Dict[str, int]) -> None:
+    """Save the state for a finished ingest and flag the manifest for rebuild."""
+    state = {
+        "year": int(year),
+        "digest": combined_digest(file_digests),
+        "files": {name: {"sha256": d, "rows": rows.get(name)} for name, d in sorted(file_digests.items())},
+        "ingested_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    ds_upload_bytes(dataset, "state", json.dumps(state, indent=2).encode("utf-8"),
+                    state_blob_name(year), overwrite=True, content_type="application/json")
+    mark_manifest_dirty(dataset)
+
+def mark_manifest_dirty(dataset: str) -> None:
+    ds_upload_bytes(dataset, "marker", b"", MANIFEST_DIRTY, overwrite=True)
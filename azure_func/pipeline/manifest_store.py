@@ -0,0 +1,226 @@
+# azure_func/pipeline/manifest_store.py
+"""
+The row-count manifest for the HTTP handlers, parsed once per worker:
+
+    manifests/index.json    what BuildManifestTimer writes (authoritative; its ETag is the data version)
+    manifests/index.arrow   compact companion written right after it: Arrow IPC file,
+                            one row per (year, airport) with columns
+                            year int16, airport dictionary<int32, string>, q1..q4 int64;
+                            schema metadata holds generated_at and {year: total_rows}
+
+load() keeps the parsed ManifestIndex in memory and revalidates it with a
+conditional GET (If-None-Match on the ETag it was read at), at most once per
+REVALIDATE_S. An unchanged blob costs one 304 and no parsing. The compact
+form is preferred; index.json is only parsed when there is no companion
+yet (manifests built before it existed).
+
+load_cube() does the same for the per-year metric cubes /api/summary reads
+(metric_cube.py); at most CUBE_CACHE_YEARS of them stay parsed per worker.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+
+from . import metric_cube
+
+logger = logging.getLogger("bts.manifest_store")
+
+MANIFEST_BLOB = "manifests/index.json"
+COMPACT_BLOB = "manifests/index.arrow"
+COMPACT_CONTENT_TYPE = "application/vnd.apache.arrow.file"
+
+# seconds a worker serves its copy before asking storage again
+REVALIDATE_S = float(os.getenv("MANIFEST_REVALIDATE_S", "5"))
+# year cubes kept parsed per worker (least recently used ones are dropped)
+CUBE_CACHE_YEARS = int(os.getenv("CUBE_CACHE_YEARS", "40"))
+
+QUARTERS = ("1", "2", "3", "4")
+
+
+class ManifestIndex:
+    """A manifest as arrays: row i counts `airports[airport_id[i]]` in `year[i]`, per quarter in counts[i]."""
+
+    def __init__(self, year: np.ndarray, airport_id: np.ndarray, airports: List[str],
+                 counts: np.ndarray, year_totals: Dict[int, int], generated_at: str = ""):
+        self.year = year
+        self.airport_id = airport_id
+        self.airports = airports
+        self.counts = counts
+        self.year_totals = year_totals
+        self.generated_at = generated_at
+        self._ids = {a: i for i, a in enumerate(airports)}
+
+    # ---------- queries ----------
+
+    def years(self) -> List[int]:
+        return sorted(self.year_totals)
+
+    def origins(self) -> List[str]:
+        """Airport codes with at least one row."""
+        present = np.unique(self.airport_id[self.counts.sum(axis=1) > 0])
+        return sorted(self.airports[i] for i in present.tolist())
+
+    def rows(self, years: Iterable[int], airports: Optional[Iterable[str]] = None,
+             quarters: Optional[Iterable[str]] = None) -> Tuple[int, Dict[int, int]]:
+        """
+        (total, {year: rows}) for the manifest's years among `years`, limited
+        to `airports` and `quarters` if given. Without either filter a year
+        counts its total_rows.
+        """
+        wanted = sorted({int(y) for y in years} & set(self.year_totals))
+        airports = [a.upper() for a in airports] if airports else None
+        quarters = [q for q in quarters if q in QUARTERS] if quarters else None
+        if not airports and not quarters:
+            per_year = {y: self.year_totals[y] for y in wanted}
+            return sum(per_year.values()), per_year
+
+        mask = np.isin(self.year, wanted)
+        if airports:
+            mask &= np.isin(self.airport_id, [self._ids[a] for a in airports if a in self._ids])
+        cols = [QUARTERS.index(q) for q in quarters] if quarters else list(range(4))
+        sums = self.counts[mask][:, cols].sum(axis=1)
+        years_hit = self.year[mask]
+        per_year = {y: int(sums[years_hit == y].sum()) for y in wanted}
+        return sum(per_year.values()), per_year
+
+    # ---------- conversions ----------
+
+    @classmethod
+    def from_manifest(cls, manifest: dict) -> "ManifestIndex":
+        """From the index.json document."""
+        ids: Dict[str, int] = {}
+        year, airport_id, counts, totals = [], [], [], {}
+        for entry in manifest.get("years", []):
+            y = int(entry["year"])
+            totals[y] = int(entry.get("total_rows", 0))
+            for airport, vals in entry.get("airports", {}).items():
+                year.append(y)
+                airport_id.append(ids.setdefault(airport, len(ids)))
+                q = vals.get("quarters", {})
+                counts.append([int(q.get(k, 0)) for k in QUARTERS])
+        return cls(np.asarray(year, dtype=np.int32), np.asarray(airport_id, dtype=np.int32), list(ids),
+                   np.asarray(counts, dtype=np.int64).reshape(-1, 4), totals,
+                   manifest.get("generated_at", ""))
+
+    def to_arrow_bytes(self) -> bytes:
+        table = pa.table({
+            "year": pa.array(self.year, pa.int16()),
+            "airport": pa.DictionaryArray.from_arrays(pa.array(self.airport_id, pa.int32()),
+                                                      pa.array(self.airports, pa.string())),
+            **{f"q{q}": pa.array(self.counts[:, i]) for i, q in enumerate(QUARTERS)},
+        }).replace_schema_metadata({
+            "generated_at": self.generated_at,
+            "year_totals": json.dumps({str(y): n for y, n in self.year_totals.items()}),
+        })
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_file(sink, table.schema,
+                             options=pa.ipc.IpcWriteOptions(compression="zstd")) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    @classmethod
+    def from_arrow_bytes(cls, data: bytes) -> "ManifestIndex":
+        table = pa.ipc.open_file(pa.BufferReader(data)).read_all()
+        meta = table.schema.metadata or {}
+        airport = table.column("airport").combine_chunks()
+        if not pa.types.is_dictionary(airport.type):
+            airport = airport.dictionary_encode()
+        counts = np.column_stack([table.column(f"q{q}").to_numpy() for q in QUARTERS]) if table.num_rows \
+            else np.zeros((0, 4), dtype=np.int64)
+        totals = {int(y): int(n) for y, n in json.loads(meta.get(b"year_totals", b"{}")).items()}
+        return cls(table.column("year").to_numpy().astype(np.int32),
+                   airport.indices.to_numpy(zero_copy_only=False).astype(np.int32),
+                   airport.dictionary.to_pylist(), counts.astype(np.int64), totals,
+                   meta.get(b"generated_at", b"").decode("utf-8"))
+
+
+def compact_bytes(manifest: dict) -> bytes:
+    """index.arrow contents for the index.json document `manifest`."""
+    return ManifestIndex.from_manifest(manifest).to_arrow_bytes()
+
+# ------------------------------- Worker cache -------------------------------
+
+@dataclass
+class _Entry:
+    blob: str
+    etag: str
+    value: Any
+    checked: float
+
+_CACHE: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+
+def _parse(blob: str, data: bytes) -> ManifestIndex:
+    if blob == COMPACT_BLOB:
+        return ManifestIndex.from_arrow_bytes(data)
+    return ManifestIndex.from_manifest(json.loads(data.decode("utf-8")))
+
+async def _get_if_changed(cc, blob: str, etag: Optional[str]) -> Optional[Tuple[bytes, str]]:
+    """(body, etag) of `blob`, or None if it still has `etag`."""
+    kw = {"etag": etag, "match_condition": MatchConditions.IfModified} if etag else {}
+    try:
+        downloader = await cc.get_blob_client(blob).download_blob(**kw)
+    except HttpResponseError as e:
+        # the SDK surfaces 304 Not Modified as a plain HttpResponseError
+        if e.status_code == 304:
+            return None
+        raise
+    return await downloader.readall(), downloader.properties.etag
+
+async def _cached(cc, key: str, blobs: Tuple[str, ...], parse: Callable[[str, bytes], Any]) -> Optional[Any]:
+    """
+    parse(blob, body) of the first of `blobs` that exists, kept under `key`
+    and revalidated as described in the module docstring; None if none exists.
+    """
+    key = (cc.container_name, key)
+    entry = _CACHE.get(key)
+    now = time.monotonic()
+    if entry is not None:
+        _CACHE.move_to_end(key)
+        if now - entry.checked < REVALIDATE_S:
+            return entry.value
+
+    for blob in blobs:
+        etag = entry.etag if entry is not None and entry.blob == blob else None
+        try:
+            got = await _get_if_changed(cc, blob, etag)
+        except ResourceNotFoundError:
+            continue
+        if got is None:
+            entry.checked = now
+            return entry.value
+        data, etag = got
+        t0 = time.perf_counter()
+        value = await asyncio.to_thread(parse, blob, data)
+        logger.info("[manifest_store] loaded %s/%s (%d bytes) in %.1f ms",
+                    key[0], blob, len(data), (time.perf_counter() - t0) * 1e3)
+        _CACHE[key] = _Entry(blob, etag, value, now)
+        return value
+
+    _CACHE.pop(key, None)
+    return None
+
+async def load(cc) -> Optional[ManifestIndex]:
+    """
+    The manifest of the azure.storage.blob.aio ContainerClient `cc`, from
+    worker memory while storage says it is unchanged; None if none exists.
+    """
+    return await _cached(cc, "manifest", (COMPACT_BLOB, MANIFEST_BLOB), _parse)
+
+async def load_cube(cc, year: int) -> Optional[pa.Table]:
+    """The metric cube of `year` (metric_cube.year_blob_name), cached like load(); None if not built."""
+    table = await _cached(cc, f"cube:{year}", (metric_cube.year_blob_name(year),),
+                          lambda _blob, data: metric_cube.from_bytes(data))
+    cubes = [k for k in _CACHE if k[1].startswith("cube:")]
+    for k in cubes[:max(0, len(cubes) - CUBE_CACHE_YEARS)]:
+        del _CACHE[k]
+    return table
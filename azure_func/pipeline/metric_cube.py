@@ -0,0 +1,195 @@
+# azure_func/pipeline/metric_cube.py
+"""
+Rollup of the T-100 measures by YEAR x QUARTER x ORIGIN x DEST x CARRIER:
+
+    {curated}.csv.cube.arrow   per curated CSV, written by the ingest (CubeBuilder is a
+                               BatchHook) or backfilled by the manifest job; metadata "etag"
+                               is the ETag of the curated blob it was built from
+    cube/YEAR={year}.arrow     per year, merged from the file cubes by BuildManifestTimer;
+                               metadata "sources" fingerprints the curated CSVs it covers
+
+Both are Arrow IPC files (zstd, dictionary-encoded codes) with the KEYS, one
+SUM column per MEASURES entry and ROWS (source row count). Measures parse
+like the ASM/RPM transform does: blanks and junk count as 0. /api/summary
+answers filtered group-bys from the year cubes (query()) without touching
+the data files.
+"""
+import hashlib
+import logging
+import os
+from typing import BinaryIO, Dict, Iterable, List, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from azure.core.exceptions import ResourceNotFoundError
+
+from .blob_clients import etag_key
+from .columnar import BatchHook, col_index, iter_batches, parse_numeric, read_header
+
+logger = logging.getLogger("bts.metric_cube")
+
+# CURATED_METRIC_CUBE=0: no file cubes from the ingest and no year cubes from the manifest job
+ENABLED = os.getenv("CURATED_METRIC_CUBE", "1").lower() not in {"0", "false", "no"}
+
+KEYS = ("YEAR", "QUARTER", "ORIGIN", "DEST", "CARRIER")
+MEASURES = ("PASSENGERS", "SEATS", "ASM", "RPM", "DEPARTURES_PERFORMED", "FREIGHT")
+ROWS = "ROWS"
+
+SUFFIX = ".cube.arrow"
+PREFIX = "cube"
+CONTENT_TYPE = "application/vnd.apache.arrow.file"
+
+_INT_KEYS = {"YEAR": pa.int16(), "QUARTER": pa.int8()}
+SCHEMA = pa.schema([(k, _INT_KEYS.get(k, pa.string())) for k in KEYS]
+                   + [(m, pa.float64()) for m in MEASURES] + [(ROWS, pa.int64())])
+
+# partial aggregates a CubeBuilder holds before folding them together
+_FOLD_EVERY = 16
+
+
+def sidecar_blob_name(curated_blob: str) -> str:
+    return curated_blob + SUFFIX
+
+def year_blob_name(year: int) -> str:
+    return f"{PREFIX}/YEAR={year}.arrow"
+
+def sources_fingerprint(versions: Dict[str, str]) -> str:
+    """Stable id of a set of {blob name: etag}; a year cube is rebuilt when it changes."""
+    text = "\n".join(f"{n}:{versions[n]}" for n in sorted(versions))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+# ------------------------------- Aggregation -------------------------------
+
+def empty() -> pa.Table:
+    return SCHEMA.empty_table()
+
+def _group(table: pa.Table, counted: bool) -> pa.Table:
+    """SUM every measure by KEYS; ROWS is counted (`counted`=False) or summed."""
+    aggs = [(m, "sum") for m in MEASURES] + ([(ROWS, "sum")] if counted else [([], "count_all")])
+    out = table.group_by(list(KEYS)).aggregate(aggs)
+    names = [ROWS if c == "count_all" else c.removesuffix("_sum") for c in out.column_names]
+    return out.rename_columns(names).select(SCHEMA.names).cast(SCHEMA)
+
+def combine(tables: Iterable[pa.Table]) -> pa.Table:
+    """One cube from several (e.g. the files of a year): rows with equal KEYS are summed."""
+    tables = [t for t in tables if t.num_rows]
+    if not tables:
+        return empty()
+    if len(tables) == 1:
+        return tables[0]
+    return _group(pa.concat_tables([t.cast(SCHEMA) for t in tables]), counted=True)
+
+def _batch_cube(columns: List[str], arrays: List[pa.Array], idx: Dict[str, Optional[int]]) -> pa.Table:
+    n = len(arrays[0])
+    data = {}
+    for k in KEYS:
+        i = idx[k]
+        if i is None:
+            data[k] = pa.nulls(n, SCHEMA.field(k).type)
+        elif k in _INT_KEYS:
+            data[k] = pc.cast(parse_numeric(arrays[i], fill=None), _INT_KEYS[k])
+        else:
+            data[k] = arrays[i]
+    for m in MEASURES:
+        i = idx[m]
+        data[m] = parse_numeric(arrays[i]) if i is not None else pa.nulls(n, pa.float64()).fill_null(0.0)
+    return _group(pa.table(data), counted=False)
+
+
+class CubeBuilder:
+    """
+    BatchHook that rolls every batch it sees up into the cube, then passes
+    the batch on to `then`. Partial cubes are folded together every few
+    batches, so memory follows the number of distinct keys, not rows.
+    """
+
+    def __init__(self, then: Optional[BatchHook] = None):
+        self._then = then
+        self._idx = None
+        self._parts: List[pa.Table] = []
+
+    def __call__(self, columns: List[str], arrays: List[pa.Array]) -> None:
+        if self._idx is None:
+            self._idx = {c: col_index(columns, c) for c in KEYS + MEASURES}
+        if arrays and len(arrays[0]):
+            self._parts.append(_batch_cube(columns, arrays, self._idx))
+            if len(self._parts) >= _FOLD_EVERY:
+                self._parts = [combine(self._parts)]
+        if self._then is not None:
+            self._then(columns, arrays)
+
+    def table(self) -> pa.Table:
+        return combine(self._parts)
+
+
+def cube_csv(source: BinaryIO) -> pa.Table:
+    """Cube of a curated CSV stream; only the key and measure columns are converted."""
+    columns = read_header(source)
+    wanted = [c for c in KEYS + MEASURES if col_index(columns, c) is not None]
+    positions = [col_index(columns, c) for c in wanted]
+    builder = CubeBuilder()
+    for batch in iter_batches(source, columns, positions=positions):
+        builder(wanted, list(batch.columns))
+    return builder.table()
+
+# ------------------------------- Files -------------------------------
+
+def to_bytes(table: pa.Table, **metadata: str) -> bytes:
+    codes = {k: pc.dictionary_encode(table.column(k)) for k in KEYS if k not in _INT_KEYS}
+    out = pa.table({name: codes.get(name, table.column(name)) for name in table.column_names})
+    out = out.replace_schema_metadata({k: str(v) for k, v in metadata.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, out.schema, options=pa.ipc.IpcWriteOptions(compression="zstd")) as writer:
+        writer.write_table(out)
+    return sink.getvalue().to_pybytes()
+
+def from_bytes(data: bytes) -> pa.Table:
+    """The cube in a cube file, codes decoded to plain strings."""
+    table = pa.ipc.open_file(pa.BufferReader(data)).read_all()
+    return table.replace_schema_metadata(None).cast(SCHEMA)
+
+def metadata(data: bytes) -> dict:
+    meta = pa.ipc.open_file(pa.BufferReader(data)).schema.metadata or {}
+    return {k.decode(): v.decode() for k, v in meta.items()}
+
+def load_sidecar(cc, curated_blob: str, etag: str) -> Optional[pa.Table]:
+    """File cube of `curated_blob` (now at `etag`), or None if missing/unreadable/stale."""
+    try:
+        data = cc.get_blob_client(sidecar_blob_name(curated_blob)).download_blob().readall()
+        built_from = metadata(data).get("etag")
+    except ResourceNotFoundError:
+        return None
+    except (pa.ArrowInvalid, ValueError):
+        logger.warning("[metric_cube] unreadable cube for %s", curated_blob)
+        return None
+    if not built_from or built_from != etag_key(etag):
+        logger.info("[metric_cube] stale cube for %s (built for %s, blob is %s)",
+                    curated_blob, built_from, etag_key(etag))
+        return None
+    return from_bytes(data)
+
+# ------------------------------- Queries -------------------------------
+
+def query(table: pa.Table, *, filters: Optional[Dict[str, Sequence]] = None,
+          group_by: Sequence[str] = (), measures: Sequence[str] = MEASURES) -> List[dict]:
+    """
+    SUM(measures) and ROWS over the rows matching every filters[key] (values
+    in KEYS columns), grouped by `group_by` (KEYS; empty = one total row).
+    Rows come back sorted by the group keys.
+    """
+    mask = None
+    for key, values in (filters or {}).items():
+        if values:
+            cond = pc.is_in(table.column(key), value_set=pa.array(list(values), SCHEMA.field(key).type))
+            mask = cond if mask is None else pc.and_(mask, cond)
+    if mask is not None:
+        table = table.filter(mask)
+    aggs = [(m, "sum") for m in measures] + [(ROWS, "sum")]
+    out = table.group_by(list(group_by)).aggregate(aggs)
+    out = out.rename_columns([c.removesuffix("_sum") for c in out.column_names])
+    if group_by:
+        out = out.sort_by([(k, "ascending") for k in group_by])
+    names = list(group_by) + list(measures) + [ROWS]
+    # SUM over no rows is null
+    return [{n: (0 if v is None and n not in group_by else v) for n, v in row.items()}
+            for row in out.select(names).to_pylist()]
@@ -0,0 +1,161 @@
+# azure_func/pipeline/parquet_tier.py
+"""
+Typed Parquet copy of the curated CSVs, partitioned by YEAR/QUARTER:
+
+    parquet/YEAR={year}/QUARTER={q}/{stem}__{tag}.parquet
+
+Written batch by batch from the columnar transform (on_batch hook), so it
+costs no extra pass over the data. Numeric columns are parsed (blank -> null),
+airport/carrier codes and names are dictionary-encoded.
+"""
+import logging
+import os
+from pathlib import Path
+from typing import Callable, ContextManager, Dict, List, Optional, BinaryIO
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .columnar import parse_numeric
+from .datasets import ds_open_writer, ds_upload
+
+logger = logging.getLogger("bts.parquet")
+
+ENABLED = os.getenv("CURATED_PARQUET", "1").lower() not in {"0", "false", "no"}
+ROW_GROUP_ROWS = int(os.getenv("PARQUET_ROW_GROUP_ROWS", "250000"))
+COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+
+PREFIX = "parquet"
+PARTITION_COL = "QUARTER"
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# ------------------------------- Naming ---------------------------------------
+
+def parquet_prefix(year, quarter=None) -> str:
+    """parquet/YEAR=2024/ or parquet/YEAR=2024/QUARTER=1/"""
+    p = f"{PREFIX}/YEAR={int(year)}/"
+    if quarter is not None:
+        p += f"{PARTITION_COL}={quarter}/"
+    return p
+
+def parquet_blob_name(year, quarter, filename: str) -> str:
+    return parquet_prefix(year, quarter if quarter is not None else NULL_PARTITION) + filename
+
+# ------------------------------- Typing ---------------------------------------
+
+def typed_column(values: pa.Array, typ: pa.DataType) -> pa.Array:
+    """Text column -> `typ`, parsed the way the Parquet tier stores it (blanks and junk become null)."""
+    if pa.types.is_floating(typ) or pa.types.is_integer(typ):
+        nums = parse_numeric(values, fill=None)
+        if pa.types.is_integer(typ):
+            nums = pc.cast(pc.round(nums), typ)
+        return pc.cast(nums, typ)
+    # text: blank -> null
+    values = pc.if_else(pc.equal(values, ""), pa.scalar(None, pa.string()), values)
+    if pa.types.is_dictionary(typ):
+        return pc.dictionary_encode(values)
+    return values
+
+def typed_table(columns: List[str], arrays: List[pa.Array], types: Dict[str, pa.DataType]) -> pa.Table:
+    """Text batch -> typed table. Blank-named columns (BTS's trailing comma) are dropped."""
+    names, cols = [], []
+    for name, arr in zip(columns, arrays):
+        if not name or name in names:
+            continue
+        names.append(name)
+        cols.append(typed_column(arr, types.get(name, pa.string())))
+    return pa.Table.from_arrays(cols, names=names)
+
+# ------------------------------- Writer ---------------------------------------
+
+class PartitionedParquetWriter:
+    """
+    BatchHook that splits each curated batch by QUARTER and appends it to one
+    Parquet file per quarter. `open_sink(quarter)` returns a writable binary
+    file (used as a context manager); rows are buffered up to ROW_GROUP_ROWS
+    per quarter before a row group is written.
+    """
+
+    def __init__(self, open_sink: Callable[[Optional[int]], ContextManager[BinaryIO]],
+                 types: Dict[str, pa.DataType]):
+        self._open_sink = open_sink
+        self._types = types
+        self._sinks: dict = {}
+        self._writers: Dict[Optional[int], pq.ParquetWriter] = {}
+        self._pending: Dict[Optional[int], List[pa.Table]] = {}
+        self.rows: Dict[Optional[int], int] = {}
+
+    def __call__(self, columns: List[str], arrays: List[pa.Array]) -> None:
+        table = typed_table(columns, arrays, self._types)
+        if PARTITION_COL not in table.column_names:
+            raise ValueError(f"Cannot partition Parquet tier: no {PARTITION_COL} column")
+        qcol = table.column(PARTITION_COL)
+        for q in pc.unique(qcol).to_pylist():
+            mask = pc.is_null(qcol) if q is None else pc.equal(qcol, q)
+            part = table.filter(mask)
+            self._pending.setdefault(q, []).append(part)
+            self.rows[q] = self.rows.get(q, 0) + part.num_rows
+            if sum(t.num_rows for t in self._pending[q]) >= ROW_GROUP_ROWS:
+                self._flush(q)
+
+    def _flush(self, q) -> None:
+        pending = self._pending.pop(q, [])
+        if not pending:
+            return
+        table = pa.concat_tables(pending)
+        if q not in self._writers:
+            sink = self._open_sink(q)
+            self._sinks[q] = sink
+            self._writers[q] = pq.ParquetWriter(sink.__enter__(), table.schema, compression=COMPRESSION)
+        self._writers[q].write_table(table)
+
+    def close(self) -> Dict[Optional[int], int]:
+        """Flush and close every partition file. Returns {quarter: rows}."""
+        for q in list(self._pending):
+            self._flush(q)
+        for q, w in self._writers.items():
+            w.close()
+            self._sinks[q].__exit__(None, None, None)
+        return dict(self.rows)
+
+    def abort(self, exc_type=None, exc=None, tb=None) -> None:
+        """Drop buffered rows and abort every sink (blob writers commit nothing)."""
+        self._pending.clear()
+        for q, sink in self._sinks.items():
+            try:
+                sink.__exit__(exc_type or RuntimeError, exc, tb)
+            except Exception:
+                logger.exception("[parquet] failed to abort partition %s", q)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort(exc_type, exc, tb)
+        return False
+
+# ------------------------------- Sinks ----------------------------------------
+
+def _local_part(root: Path, quarter, filename: str) -> Path:
+    d = root / f"{PARTITION_COL}={quarter if quarter is not None else NULL_PARTITION}"
+    d.mkdir(parents=True, exist_ok=True)
+    return d / filename
+
+def local_writer(root: Path, filename: str, types: Dict[str, pa.DataType]) -> PartitionedParquetWriter:
+    """Partition files under root/QUARTER=q/filename (upload with upload_local_parts)."""
+    return PartitionedParquetWriter(lambda q: _local_part(root, q, filename).open("wb"), types)
+
+def upload_local_parts(dataset: str, year, root: Path, filename: str,
+                       parts: Dict[Optional[int], int], **kw) -> None:
+    for q in sorted(parts, key=lambda v: (v is None, v)):
+        ds_upload(dataset, "parquet", str(_local_part(root, q, filename)),
+                  parquet_blob_name(year, q, filename), **kw)
+
+def blob_writer(dataset: str, year, filename: str, types: Dict[str, pa.DataType], **kw) -> PartitionedParquetWriter:
+    """Partition files streamed straight into staged block blobs."""
+    return PartitionedParquetWriter(
+        lambda q: ds_open_writer(dataset, "parquet", parquet_blob_name(year, q, filename), **kw), types)
@@ -0,0 +1,167 @@
+# azure_func/pipeline/range_index.py
+"""
+Byte-range sidecar for curated CSVs written sorted by ORIGIN/QUARTER:
+
+    {curated}.csv.idx.json
+    {"version": 2, "keys": ["ORIGIN", "QUARTER"], "etag": <curated ETag>, "bytes": <curated size>,
+     "rows": N, "header": [0, len], "ranges": {"ATL": {"1": [offset, length, rows], ...}}}
+
+Readers fetch the header plus the ranges they need with ranged
+download_blob(offset, length) instead of the whole file. The index is only
+trusted while "etag" is the curated blob's ETag (written after the blob is
+committed), and the ranged reads are conditional on it, so a blob replaced
+in between makes the reader fall back instead of returning wrong bytes.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Iterable, List, Optional, Tuple
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceModifiedError, ResourceNotFoundError
+
+from .blob_clients import etag_key
+
+logger = logging.getLogger("bts.range_index")
+
+# CURATED_RANGE_INDEX=0: curated CSVs keep BTS row order and get no sidecar
+ENABLED = os.getenv("CURATED_RANGE_INDEX", "1").lower() not in {"0", "false", "no"}
+
+SUFFIX = ".idx.json"
+SORT_KEYS = ("ORIGIN", "QUARTER")
+
+# ranges closer than this are fetched as one request
+_MERGE_GAP = 64 << 10
+
+
+def index_blob_name(curated_blob: str) -> str:
+    return curated_blob + SUFFIX
+
+def build(ranges: dict, *, total_bytes: int, rows: int, etag: Optional[str], keys=SORT_KEYS) -> dict:
+    """Index document for `ranges` as filled by add_product_columns(sort_by=..., index=...),
+    for the curated blob as committed with `etag`."""
+    # sorted output: the first group starts right after the header
+    offsets = [r[0] for qs in ranges.values() for r in qs.values()]
+    header_len = min(offsets) if offsets else int(total_bytes)
+    return {"version": 2, "keys": list(keys), "etag": etag_key(etag), "bytes": int(total_bytes),
+            "rows": int(rows), "header": [0, header_len], "ranges": ranges}
+
+def to_bytes(index: dict) -> bytes:
+    return json.dumps(index, separators=(",", ":")).encode("utf-8")
+
+def _checked(curated_blob: str, index: dict, etag: str) -> Optional[dict]:
+    if not index.get("etag") or index["etag"] != etag_key(etag):
+        logger.info("[range_index] stale index for %s (built for %s, blob is %s)",
+                    curated_blob, index.get("etag"), etag_key(etag))
+        return None
+    return index
+
+def _if_match(index: dict) -> dict:
+    return {"etag": f'"{index["etag"]}"', "match_condition": MatchConditions.IfNotModified}
+
+def load(cc, curated_blob: str, etag: Optional[str] = None) -> Optional[dict]:
+    """Index for `curated_blob`, or None if missing/unreadable/stale. `etag`
+    (e.g. from a listing) saves a properties call."""
+    try:
+        index = json.loads(cc.get_blob_client(index_blob_name(curated_blob)).download_blob().readall())
+        if etag is None:
+            etag = cc.get_blob_client(curated_blob).get_blob_properties().etag
+    except ResourceNotFoundError:
+        return None
+    except ValueError:
+        logger.warning("[range_index] unreadable index for %s", curated_blob)
+        return None
+    return _checked(curated_blob, index, etag)
+
+def plan(index: dict, origins: Optional[Iterable[str]],
+         quarters: Optional[Iterable[str]]) -> List[Tuple[int, int, List[Tuple[int, int]]]]:
+    """
+    Sorted (offset, length, spans) requests covering the wanted origins x
+    quarters; `spans` are the exact (start, end) pieces inside each request.
+    """
+    ranges = index["ranges"]
+    wanted_o = [o.upper() for o in origins] if origins else list(ranges)
+    wanted_q = {str(q) for q in quarters} if quarters else None
+    spans = sorted((r[0], r[0] + r[1])
+                   for o in wanted_o for q, r in ranges.get(o, {}).items()
+                   if wanted_q is None or q in wanted_q)
+    requests: List[Tuple[int, int, List[Tuple[int, int]]]] = []
+    for lo, hi in spans:
+        # a small gap costs less than another round trip; read() drops it again
+        if requests and lo - (requests[-1][0] + requests[-1][1]) <= _MERGE_GAP:
+            start, _, pieces = requests[-1]
+            requests[-1] = (start, max(hi - start, requests[-1][1]), pieces + [(lo, hi)])
+        else:
+            requests.append((lo, hi - lo, [(lo, hi)]))
+    return requests
+
+def read(cc, curated_blob: str, index: dict, ranges) -> bytes:
+    """Header + the planned ranges of `curated_blob` as one CSV byte string.
+    Raises ResourceModifiedError if the blob is no longer the indexed one."""
+    bc = cc.get_blob_client(curated_blob)
+    cond = _if_match(index)
+    h0, hlen = index["header"]
+    parts = [bc.download_blob(offset=h0, length=hlen, **cond).readall()]
+    for offset, length, spans in ranges:
+        data = bc.download_blob(offset=offset, length=length, **cond).readall()
+        parts.extend(data[lo - offset:hi - offset] for lo, hi in spans)
+    return b"".join(parts)
+
+def fetch(cc, curated_blob: str, origins: Optional[Iterable[str]], quarters: Optional[Iterable[str]],
+          etag: Optional[str] = None) -> Optional[bytes]:
+    """Header + only the wanted (origin, quarter) rows of a sorted curated CSV,
+    or None when it has no usable index (caller falls back to a full read)."""
+    index = load(cc, curated_blob, etag)
+    if index is None:
+        return None
+    ranges = plan(index, origins, quarters)
+    logger.debug("[range_index] %s: %d request(s), %d of %d bytes", curated_blob, len(ranges),
+                 sum(r[1] for r in ranges), index["bytes"])
+    try:
+        return read(cc, curated_blob, index, ranges)
+    except ResourceModifiedError:
+        logger.info("[range_index] %s replaced while reading; falling back", curated_blob)
+        return None
+
+# ------------------------------- asyncio (aio ContainerClient) -------------------------------
+
+async def load_async(cc, curated_blob: str, etag: Optional[str] = None) -> Optional[dict]:
+    try:
+        downloader = await cc.get_blob_client(index_blob_name(curated_blob)).download_blob()
+        index = json.loads(await downloader.readall())
+        if etag is None:
+            etag = (await cc.get_blob_client(curated_blob).get_blob_properties()).etag
+    except ResourceNotFoundError:
+        return None
+    except ValueError:
+        logger.warning("[range_index] unreadable index for %s", curated_blob)
+        return None
+    return _checked(curated_blob, index, etag)
+
+async def read_async(cc, curated_blob: str, index: dict, ranges) -> bytes:
+    bc = cc.get_blob_client(curated_blob)
+    cond = _if_match(index)
+
+    async def get(offset, length):
+        return await (await bc.download_blob(offset=offset, length=length, **cond)).readall()
+
+    h0, hlen = index["header"]
+    # the requests are independent; let them overlap
+    bodies = await asyncio.gather(get(h0, hlen), *(get(o, n) for o, n, _ in ranges))
+    parts = [bodies[0]]
+    for (offset, _, spans), data in zip(ranges, bodies[1:]):
+        parts.extend(data[lo - offset:hi - offset] for lo, hi in spans)
+    return b"".join(parts)
+
+async def fetch_async(cc, curated_blob: str, origins: Optional[Iterable[str]],
+                      quarters: Optional[Iterable[str]], etag: Optional[str] = None) -> Optional[bytes]:
+    """fetch() on an azure.storage.blob.aio ContainerClient."""
+    index = await load_async(cc, curated_blob, etag)
+    if index is None:
+        return None
+    try:
+        return await read_async(cc, curated_blob, index, plan(index, origins, quarters))
+    except ResourceModifiedError:
+        logger.info("[range_index] %s replaced while reading; falling back", curated_blob)
+        return None
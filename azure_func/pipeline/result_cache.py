@@ -0,0 +1,171 @@
+# azure_func/pipeline/result_cache.py
+"""
+Cache of composed /api/download results:
+
+    prebuilt/{sha256(canonical query)[:32]}.csv
+    metadata: query=<canonical JSON>, data_version=<manifest ETag>, rows=N,
+              created=<epoch s>, accessed=<epoch s>
+
+The manifest is only rewritten when curated data changed, so its ETag is
+the data version: an entry is served while it matches and is younger than
+TTL_S. gc() deletes expired/stale entries, evicts least recently used ones
+until the prefix fits in MAX_BYTES, and purges old tmp-downloads/ blobs.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from azure.core.exceptions import ResourceNotFoundError
+
+logger = logging.getLogger("bts.result_cache")
+
+PREFIX = "prebuilt"
+TMP_PREFIX = "tmp-downloads"    # per-request copies from before the cache; nothing writes here now
+
+TTL_S = int(os.getenv("RESULT_CACHE_TTL_S", str(7 * 24 * 3600)))
+MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(20 << 30)))
+TMP_MAX_AGE_S = int(os.getenv("RESULT_CACHE_TMP_MAX_AGE_S", str(24 * 3600)))
+
+_STATS = Counter()
+_STATS_LOCK = threading.Lock()
+
+
+def _count(event: str) -> None:
+    with _STATS_LOCK:
+        _STATS[event] += 1
+
+def stats() -> dict:
+    """This process's lookups so far: hit / miss / stale / expired."""
+    with _STATS_LOCK:
+        return dict(_STATS)
+
+# ------------------------------- Keys -------------------------------
+
+def canonical_query(**params) -> str:
+    """Order-independent JSON for a query: keys sorted, iterables as sorted string lists."""
+    norm = {}
+    for k, v in params.items():
+        if isinstance(v, (set, frozenset, list, tuple)):
+            v = sorted(str(x) for x in v)
+        norm[k] = v
+    return json.dumps(norm, sort_keys=True, separators=(",", ":"))
+
+def blob_name(query: str, ext: str = ".csv") -> str:
+    return f"{PREFIX}/{hashlib.sha256(query.encode('utf-8')).hexdigest()[:32]}{ext}"
+
+def data_version(cc, manifest_blob: str) -> str:
+    """ETag of the manifest ('' if there is none yet)."""
+    try:
+        return cc.get_blob_client(manifest_blob).get_blob_properties().etag.strip('"')
+    except ResourceNotFoundError:
+        return ""
+
+def entry_metadata(query: str, version: str, rows: int) -> dict:
+    now = str(int(time.time()))
+    return {"query": query, "data_version": version, "rows": str(rows),
+            "created": now, "accessed": now}
+
+# ------------------------------- Lookup -------------------------------
+
+def _expired(meta: dict, now: float) -> bool:
+    try:
+        return now - int(meta.get("created", "0")) > TTL_S
+    except ValueError:
+        return True
+
+def _servable(name: str, meta: dict, version: str) -> bool:
+    if meta.get("data_version") != version:
+        _count("stale")
+        logger.info("[result_cache] stale %s (data %s -> %s)", name, meta.get("data_version"), version)
+        return False
+    if _expired(meta, time.time()):
+        _count("expired")
+        logger.info("[result_cache] expired %s", name)
+        return False
+    _count("hit")
+    meta["accessed"] = str(int(time.time()))
+    return True
+
+def lookup(cc, name: str, version: str) -> Optional[dict]:
+    """Metadata of a servable entry (and mark it used), or None on a miss."""
+    blob = cc.get_blob_client(name)
+    try:
+        meta = dict(blob.get_blob_properties().metadata or {})
+    except ResourceNotFoundError:
+        _count("miss")
+        return None
+    if not _servable(name, meta, version):
+        return None
+    try:
+        blob.set_blob_metadata(meta)
+    except Exception as e:
+        # recency only steers eviction; serving the hit matters more
+        logger.warning("[result_cache] could not touch %s: %s", name, e)
+    return meta
+
+async def data_version_async(cc, manifest_blob: str) -> str:
+    """data_version() on an azure.storage.blob.aio ContainerClient."""
+    try:
+        return (await cc.get_blob_client(manifest_blob).get_blob_properties()).etag.strip('"')
+    except ResourceNotFoundError:
+        return ""
+
+async def lookup_async(cc, name: str, version: str) -> Optional[dict]:
+    """lookup() on an azure.storage.blob.aio ContainerClient."""
+    blob = cc.get_blob_client(name)
+    try:
+        meta = dict((await blob.get_blob_properties()).metadata or {})
+    except ResourceNotFoundError:
+        _count("miss")
+        return None
+    if not _servable(name, meta, version):
+        return None
+    try:
+        await blob.set_blob_metadata(meta)
+    except Exception as e:
+        logger.warning("[result_cache] could not touch %s: %s", name, e)
+    return meta
+
+# ------------------------------- GC -------------------------------
+
+def gc(cc, version: str, *, now: Optional[float] = None) -> dict:
+    """
+    Delete entries that are expired or built from another data version,
+    then least recently accessed ones until the rest fit in MAX_BYTES;
+    also purge tmp-downloads/ blobs older than TMP_MAX_AGE_S.
+    """
+    now = time.time() if now is None else now
+    keep, doomed = [], []
+    for b in cc.list_blobs(name_starts_with=f"{PREFIX}/", include=["metadata"]):
+        meta = b.metadata or {}
+        if meta.get("data_version") != version or _expired(meta, now):
+            doomed.append(b.name)
+        else:
+            keep.append((int(meta.get("accessed", "0") or 0), b.size, b.name))
+
+    total = sum(size for _, size, _ in keep)
+    evicted = 0
+    for _, size, name in sorted(keep):
+        if total <= MAX_BYTES:
+            break
+        doomed.append(name)
+        total -= size
+        evicted += 1
+
+    tmp = [b.name for b in cc.list_blobs(name_starts_with=f"{TMP_PREFIX}/")
+           if now - b.last_modified.timestamp() > TMP_MAX_AGE_S]
+
+    for name in doomed + tmp:
+        try:
+            cc.delete_blob(name)
+        except ResourceNotFoundError:
+            pass
+    summary = {"removed": len(doomed) - evicted, "evicted": evicted, "tmp_purged": len(tmp),
+               "entries": len(keep) - evicted, "bytes": total}
+    logger.info("[result_cache] gc %s; lookups this process %s", summary, stats())
+    return summary
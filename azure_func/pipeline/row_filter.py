@@ -0,0 +1,139 @@
+# azure_func/pipeline/row_filter.py
+"""
+QUARTER/ORIGIN row filtering for the download endpoints, in Arrow batches.
+
+Blob chunks feed pyarrow's streaming CSV reader directly (every column as
+text, so values pass through untouched), the filters are vectorized masks,
+and matching batches are serialized straight to CSV bytes.
+"""
+import csv, io, logging
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Set, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .columnar import BLOCK_BYTES, batch_to_csv_bytes, iter_batches, read_header
+
+logger = logging.getLogger("bts.row_filter")
+
+# (column names, same-length string arrays)
+TextBatch = Tuple[List[str], List[pa.Array]]
+
+# read even when not selected: the filters need them
+FILTER_COLUMNS = ("QUARTER", "Quarter", "ORIGIN", "Origin")
+
+
+class ChunkReader(io.RawIOBase):
+    """Readable file over an iterable of byte chunks (e.g. StorageStreamDownloader.chunks())."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        super().__init__()
+        self._it = iter(chunks)
+        self._cur = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not len(self._cur):
+            chunk = next(self._it, None)
+            if chunk is None:
+                return 0
+            self._cur = memoryview(chunk)
+        n = min(len(b), len(self._cur))
+        b[:n] = self._cur[:n]
+        self._cur = self._cur[n:]
+        return n
+
+
+def _pick(columns: List[str], *names: str) -> Optional[int]:
+    # same column lookup the dict version did: first spelling present wins
+    for name in names:
+        if name in columns:
+            return len(columns) - 1 - columns[::-1].index(name)
+    return None
+
+def _mask(columns: List[str], arrays: List[pa.Array],
+          quarters: Optional[Set[str]], origin: str) -> Optional[pa.Array]:
+    mask = None
+    qi = _pick(columns, "QUARTER", "Quarter")
+    if quarters is not None and qi is not None:
+        mask = pc.is_in(pc.utf8_trim_whitespace(arrays[qi]), value_set=pa.array(sorted(quarters)))
+    oi = _pick(columns, "ORIGIN", "Origin")
+    if origin != "ALL" and oi is not None:
+        m = pc.equal(pc.utf8_upper(arrays[oi]), origin)
+        mask = m if mask is None else pc.and_(mask, m)
+    return mask
+
+def _projection(header: List[str], keep: Optional[List[str]]) -> Optional[List[int]]:
+    if keep is None:
+        return None
+    wanted = set(keep).union(FILTER_COLUMNS)
+    # one position per name, the last one, as a dict row would have kept
+    last = {name: i for i, name in enumerate(header) if name in wanted}
+    return sorted(last.values())
+
+def filter_csv_batches(source: BinaryIO, *, quarters: Optional[Set[str]], origin: str = "ALL",
+                       columns: Optional[List[str]] = None,
+                       block_bytes: int = BLOCK_BYTES) -> Iterator[TextBatch]:
+    """Batches of the CSV in `source` whose QUARTER (trimmed) is in `quarters`
+    and whose ORIGIN (upper-cased) equals `origin` ("ALL" = no origin filter).
+    With `columns`, only those (plus the filter columns) are converted."""
+    header = read_header(source)
+    if not header:
+        return
+    positions = _projection(header, columns)
+    columns = header if positions is None else [header[i] for i in positions]
+    for batch in iter_batches(source, header, block_bytes=block_bytes, skip_invalid=True,
+                              positions=positions):
+        arrays = list(batch.columns)
+        mask = _mask(columns, arrays, quarters, origin)
+        if mask is not None:
+            arrays = [pc.filter(a, mask) for a in arrays]
+        if len(arrays[0]):
+            yield columns, arrays
+
+def parquet_columns(data: bytes, keep: Optional[List[str]]) -> Optional[List[str]]:
+    """Columns to read from a Parquet file for projection `keep` (those it has, plus the
+    filter columns); None reads everything."""
+    if keep is None:
+        return None
+    wanted = set(keep).union(FILTER_COLUMNS)
+    return [c for c in pq.read_schema(pa.BufferReader(data)).names if c in wanted]
+
+
+class CsvBatchWriter:
+    """
+    Writes text batches as one CSV. `columns`, or else the first batch, fixes
+    the header; batches are matched to it by name (missing columns empty,
+    extras dropped), the way DictWriter(extrasaction="ignore") treated dict rows.
+    """
+
+    def __init__(self, out: BinaryIO, eol: str = "\n", columns: Optional[List[str]] = None):
+        self._out = out
+        self._eol = eol
+        # given columns fix the header up front (projection)
+        self.columns: Optional[List[str]] = None
+        self._fixed = list(columns) if columns else None
+        self.rows = 0
+
+    def write(self, columns: List[str], arrays: List[pa.Array]) -> None:
+        # a dict row kept the first position and last value of a repeated header
+        by_name = dict(zip(columns, arrays))
+        if self.columns is None:
+            self.columns = self._fixed or list(by_name)
+            hdr = io.StringIO()
+            csv.writer(hdr, lineterminator=self._eol).writerow(self.columns)
+            self._out.write(hdr.getvalue().encode("utf-8"))
+        n = len(arrays[0])
+        blank = None
+        ordered = []
+        for name in self.columns:
+            a = by_name.get(name)
+            if a is None:
+                blank = blank if blank is not None else pa.array([""] * n, pa.string())
+                a = blank
+            ordered.append(a)
+        self._out.write(batch_to_csv_bytes(ordered, eol=self._eol))
+        self.rows += n
@@ -1,40 +1,51 @@
 # azure_func/pipeline/storage_helper.py
+import base64
+import io
 import logging
 import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterable, Optional
-from azure.storage.blob import BlobServiceClient, ContentSettings
+from typing import Callable, Iterable, List, Optional, Tuple
+from azure.storage.blob import BlobBlock, ContentSettings
 from azure.core.exceptions import ResourceExistsError 
+from . import blob_clients
 import logging
 logger = logging.getLogger("db1b.storage")
 logger.setLevel(logging.DEBUG)
 
-def _get_conn_str() -> str:
-    try:
-        return os.environ["AZURE_STORAGE_CONNECTION_STRING"]
-    except KeyError as e:
-        raise RuntimeError(
-            "AZURE_STORAGE_CONNECTION_STRING is not set. "
-            "Export it locally or add it to your Function App settings."
-        ) from e
-
-_SVC: Optional[BlobServiceClient] = None
-def _service() -> BlobServiceClient:
-    global _SVC
-    if _SVC is None:
-        _SVC = BlobServiceClient.from_connection_string(_get_conn_str())
-    return _SVC
+# block size for upload_blob() and the streaming writers (Azure max is 4000 MiB, 50k blocks per blob)
+BLOCK_SIZE = blob_clients.BLOCK_SIZE
+# parallel block uploads per blob
+UPLOAD_CONCURRENCY = int(os.getenv("BLOB_UPLOAD_CONCURRENCY", "4"))
+# blobs in flight in an UploadQueue (x UPLOAD_CONCURRENCY connections each)
+UPLOAD_WORKERS = int(os.getenv("BLOB_UPLOAD_WORKERS", "4"))
+
+_READY_CONTAINERS: set = set()
+_READY_LOCK = threading.Lock()
 
 def get_container_client(container: str):
-    """Return a ContainerClient, creating the container if it doesn't exist."""
-    cc = _service().get_container_client(container)
-    try:
-        cc.create_container()
-    except Exception:
-        # already exists or can't create due to perms; safe to ignore here
-        pass
+    """Return a ContainerClient, creating the container (once per process) if it doesn't exist."""
+    cc = blob_clients.container(container)
+    if container in _READY_CONTAINERS:
+        return cc
+    with _READY_LOCK:
+        if container not in _READY_CONTAINERS:
+            try:
+                cc.create_container()
+            except Exception:
+                # already exists or can't create due to perms; safe to ignore here
+                pass
+            _READY_CONTAINERS.add(container)
     return cc
 
+def _log_rate(tag: str, container: str, blob_path: str, nbytes: int, started: float) -> None:
+    elapsed = max(time.perf_counter() - started, 1e-6)
+    logger.info("[%s] %s/%s %.1f MB in %.2fs (%.1f MB/s)", tag, container, blob_path,
+                nbytes / 1e6, elapsed, nbytes / 1e6 / elapsed)
+
 def _content_settings_for(name: str, explicit: Optional[str]) -> Optional[ContentSettings]:
     if explicit:
         return ContentSettings(content_type=explicit)
@@ -52,9 +63,10 @@ def _content_settings_for(name: str, explicit: Optional[str]) -> Optional[Conten
 # --- public API ---------------------------------------------------------------
 
 def upload_file(local_path: str, *, container: str, blob_path: str,
-                overwrite: bool = False, content_type: Optional[str] = None) -> None:
-    """Upload a local file to `container` at `blob_path`.
-       If overwrite=False and blob exists, we log and skip (idempotent)."""
+                overwrite: bool = False, content_type: Optional[str] = None,
+                max_concurrency: int = UPLOAD_CONCURRENCY) -> Optional[str]:
+    """Upload a local file to `container` at `blob_path`; returns the new blob's ETag.
+       If overwrite=False and blob exists, we log and skip (idempotent) and return None."""
     cc = get_container_client(container)
 
     # Build content settings (no kwargs)
@@ -65,9 +77,13 @@ def upload_file(local_path: str, *, container: str, blob_path: str,
 
     with open(local_path, "rb") as f:
         try:
-            cc.upload_blob(name=blob_path, data=f, overwrite=overwrite, **extra)
+            started = time.perf_counter()
+            resp = cc.get_blob_client(blob_path).upload_blob(f, overwrite=overwrite,
+                                                             max_concurrency=max_concurrency, **extra)
             logger.info("[upload_file] ✅ uploaded %s/%s overwrite=%s",
                         container, blob_path, overwrite)
+            _log_rate("upload_file", container, blob_path, f.tell(), started)
+            return resp.get("etag")
         except ResourceExistsError:
             if overwrite:
                 logger.exception("[upload_file] overwrite=True but got BlobAlreadyExists for %s/%s",
@@ -75,9 +91,12 @@ def upload_file(local_path: str, *, container: str, blob_path: str,
                 raise
             logger.info("[upload_file] ⏭️ exists, skipping (overwrite=False): %s/%s",
                         container, blob_path)
-            
+            return None
+
 def upload_bytes(content: bytes, *, container: str, blob_path: str,
-                 overwrite: bool = False, content_type: Optional[str] = None) -> None:
+                 overwrite: bool = False, content_type: Optional[str] = None,
+                 max_concurrency: int = UPLOAD_CONCURRENCY) -> Optional[str]:
+    """upload_file() for in-memory content; returns the new blob's ETag (None if skipped)."""
     cc = get_container_client(container)
 
     cs = _content_settings_for(blob_path, content_type)
@@ -86,9 +105,13 @@ def upload_bytes(content: bytes, *, container: str, blob_path: str,
         extra["content_settings"] = cs
 
     try:
-        cc.upload_blob(name=blob_path, data=content, overwrite=overwrite, **extra)
+        started = time.perf_counter()
+        resp = cc.get_blob_client(blob_path).upload_blob(content, overwrite=overwrite,
+                                                         max_concurrency=max_concurrency, **extra)
         logger.info("[upload_bytes] ✅ uploaded %s/%s overwrite=%s (bytes=%d)",
                     container, blob_path, overwrite, len(content))
+        _log_rate("upload_bytes", container, blob_path, len(content), started)
+        return resp.get("etag")
     except ResourceExistsError:
         if overwrite:
             logger.exception("[upload_bytes] overwrite=True but got BlobAlreadyExists for %s/%s",
@@ -96,6 +119,7 @@ def upload_bytes(content: bytes, *, container: str, blob_path: str,
             raise
         logger.info("[upload_bytes] ⏭️ exists, skipping (overwrite=False): %s/%s",
                     container, blob_path)
+        return None
 
 def download_blob(blob_path: str, *, container: str) -> bytes:
     """Download a blob and return its bytes."""
@@ -107,3 +131,163 @@ def list_blob_names(prefix: str = "", *, container: str) -> Iterable[str]:
     cc = get_container_client(container)
     for b in cc.list_blobs(name_starts_with=prefix):
         yield b.name
+
+
+class UploadQueue:
+    """
+    Background uploads. submit() any upload call (upload_file, ds_upload, ...)
+    and keep working; wait() blocks until everything queued has finished and
+    raises if any upload failed. As a context manager, wait() runs on exit.
+    """
+
+    def __init__(self, max_workers: int = UPLOAD_WORKERS):
+        self._ex = ThreadPoolExecutor(max_workers=blob_clients.pool_workers(max_workers),
+                                      thread_name_prefix="blob-upload")
+        self._futures: List[Tuple[str, Future]] = []
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        label = kwargs.get("blob_path") or next(
+            (a for a in reversed(args) if isinstance(a, str)), getattr(fn, "__name__", "upload"))
+        fut = self._ex.submit(fn, *args, **kwargs)
+        self._futures.append((label, fut))
+        return fut
+
+    def upload_file(self, local_path: str, **kwargs) -> Future:
+        return self.submit(upload_file, local_path, **kwargs)
+
+    def upload_bytes(self, content: bytes, **kwargs) -> Future:
+        return self.submit(upload_bytes, content, **kwargs)
+
+    def wait(self) -> None:
+        failed = []
+        for label, fut in self._futures:
+            try:
+                fut.result()
+            except Exception:
+                logger.exception("[upload_queue] ❌ upload failed: %s", label)
+                failed.append(label)
+        self._futures.clear()
+        if failed:
+            raise RuntimeError(f"{len(failed)} upload(s) failed: {failed}")
+
+    def close(self, cancel: bool = False) -> None:
+        self._ex.shutdown(wait=True, cancel_futures=cancel)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.wait()
+        finally:
+            self.close(cancel=exc_type is not None)
+        return False
+
+
+class BlockBlobWriter(io.RawIOBase):
+    """
+    Write-only file object over a block blob. Data is staged with stage_block()
+    every `block_size` bytes and made visible by commit_block_list() on close(),
+    so memory stays at one block no matter how much is written. If the `with`
+    body raises, nothing is committed and the old blob (if any) is untouched.
+    """
+
+    def __init__(self, blob_client, *, block_size: int = BLOCK_SIZE,
+                 content_settings: Optional[ContentSettings] = None, discard: bool = False,
+                 metadata: Optional[dict] = None):
+        super().__init__()
+        self._blob = blob_client
+        self._block_size = block_size
+        self._cs = content_settings
+        self._discard = discard          # blob exists and overwrite=False
+        # committed with the block list; may be filled in while writing (e.g. row counts)
+        self.metadata = dict(metadata or {})
+        self._buf = bytearray()
+        self._blocks: list[BlobBlock] = []
+        # uncommitted blocks are shared by everyone writing this blob name; a per-writer
+        # prefix keeps concurrent writers from overwriting each other's staged blocks
+        self._tag = uuid.uuid4().hex[:8]
+        self._aborted = False
+        self._started = time.perf_counter()
+        self.bytes_written = 0
+        # ETag of the committed blob (None until then, or if discarded/aborted)
+        self.etag: Optional[str] = None
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        # pyarrow's Parquet writer tracks offsets through tell(); we only append
+        return self.bytes_written
+
+    def write(self, b) -> int:
+        n = len(b)
+        self.bytes_written += n
+        if self._discard:
+            return n
+        self._buf += b
+        while len(self._buf) >= self._block_size:
+            self._stage(self._buf[:self._block_size])
+            del self._buf[:self._block_size]
+        return n
+
+    def _stage(self, data) -> None:
+        block_id = base64.b64encode(f"{self._tag}{len(self._blocks):08d}".encode()).decode()
+        self._blob.stage_block(block_id=block_id, data=bytes(data))
+        self._blocks.append(BlobBlock(block_id=block_id))
+
+    def abort(self) -> None:
+        self._aborted = True
+        self._buf.clear()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if not self._aborted and not self._discard:
+                if self._buf:
+                    self._stage(self._buf)
+                    self._buf.clear()
+                extra = {"content_settings": self._cs} if self._cs else {}
+                if self.metadata:
+                    extra["metadata"] = self.metadata
+                resp = self._blob.commit_block_list(self._blocks, **extra)
+                self.etag = (resp or {}).get("etag")
+                logger.info("[blob_writer] ✅ committed %s/%s blocks=%d bytes=%d",
+                            self._blob.container_name, self._blob.blob_name,
+                            len(self._blocks), self.bytes_written)
+                _log_rate("blob_writer", self._blob.container_name, self._blob.blob_name,
+                          self.bytes_written, self._started)
+        finally:
+            super().close()
+
+    def __del__(self):
+        # never commit a half-written blob just because the writer was collected
+        if not self.closed:
+            self.abort()
+        super().__del__()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            logger.warning("[blob_writer] aborting %s/%s after %s; nothing committed",
+                           self._blob.container_name, self._blob.blob_name, exc_type.__name__)
+            self.abort()
+        self.close()
+        return False
+
+def open_blob_writer(*, container: str, blob_path: str, overwrite: bool = False,
+                     content_type: Optional[str] = None,
+                     block_size: int = BLOCK_SIZE,
+                     metadata: Optional[dict] = None) -> BlockBlobWriter:
+    """Streaming counterpart of upload_bytes(). Use as a context manager.
+       If overwrite=False and the blob exists, writes are accepted and dropped."""
+    bc = get_container_client(container).get_blob_client(blob_path)
+    discard = False
+    if not overwrite and bc.exists():
+        logger.info("[open_blob_writer] ⏭️ exists, skipping (overwrite=False): %s/%s",
+                    container, blob_path)
+        discard = True
+    return BlockBlobWriter(bc, block_size=block_size,
+                           content_settings=_content_settings_for(blob_path, content_type),
+                           discard=discard, metadata=metadata)
@@ -0,0 +1,169 @@
+# azure_func/pipeline/stream_ingest.py
+"""
+Zero-disk ingest: BTS ZIP body -> raw + curated block blobs.
+
+The HTTP body is unzipped as it arrives (zipstream), every CSV member is teed
+into a staged upload of the raw file while the columnar transform reads it and
+writes the curated file into a second staged upload. Peak memory is roughly
+one HTTP chunk + one Arrow batch + one block per writer; nothing touches /tmp.
+
+With an `unchanged` check the raw file is hashed before anything else: it is
+staged, and only committed and transformed (read back from the raw blob) if
+the check says it differs from the last ingest, so an unchanged re-download
+costs neither the transform nor any blob rewrite.
+"""
+import hashlib
+import io
+import logging
+from contextlib import nullcontext
+from pathlib import PurePosixPath
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import file_stats, metric_cube, parquet_tier, range_index
+from .blob_clients import etag_key
+from .datasets import DATASETS, ds_open_writer, ds_upload_bytes
+from .row_filter import ChunkReader
+from .storage_helper import get_container_client
+from .zipstream import iter_zip_members
+
+logger = logging.getLogger("bts.stream_ingest")
+
+# read-ahead between the unzipper and the CSV parser
+READ_BUFFER = 1 << 20
+
+
+class TeeReader(io.RawIOBase):
+    """Readable that copies everything it hands out into `sink` (and `digest`, if given)."""
+
+    def __init__(self, source: BinaryIO, sink: BinaryIO, digest=None):
+        super().__init__()
+        self._source = source
+        self._sink = sink
+        self._digest = digest
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = self._source.readinto(b)
+        if n:
+            view = memoryview(b)[:n]
+            self._sink.write(view)
+            if self._digest is not None:
+                self._digest.update(view)
+        return n
+
+
+def curated_sidecars(curated_blob: str, etag: Optional[str], *, size: int, rows: int,
+                     ranges: Optional[dict] = None,
+                     stats: Optional[file_stats.StatsCounter] = None,
+                     cube: Optional[metric_cube.CubeBuilder] = None) -> List[Tuple[str, bytes, str]]:
+    """
+    (blob, content, content type) of the sidecars of `curated_blob` (`size`
+    bytes, `rows` rows) as committed with `etag`, for whichever of the range
+    index, stats counter and cube builder the transform filled.
+    """
+    out = []
+    if ranges is not None:
+        doc = range_index.build(ranges, total_bytes=size, rows=rows, etag=etag)
+        out.append((range_index.index_blob_name(curated_blob), range_index.to_bytes(doc), "application/json"))
+    if stats is not None:
+        out.append((file_stats.stats_blob_name(curated_blob), file_stats.to_bytes(stats.document(size, etag)),
+                    "application/json"))
+    if cube is not None:
+        out.append((metric_cube.sidecar_blob_name(curated_blob),
+                    metric_cube.to_bytes(cube.table(), etag=etag_key(etag)), metric_cube.CONTENT_TYPE))
+    return out
+
+
+def ingest_zip_stream(chunks: Iterable[bytes], *, dataset: str, prefix: str, tag: str,
+                      transform: Callable[..., int],
+                      raw_kw: Optional[dict] = None,
+                      curated_kw: Optional[dict] = None,
+                      year=None, parquet_types: Optional[dict] = None,
+                      digests: Optional[Dict[str, str]] = None,
+                      with_range_index: bool = False,
+                      with_stats: bool = False,
+                      with_cube: bool = False,
+                      unchanged: Optional[Callable[[str, str, str], bool]] = None) -> list[tuple[str, int]]:
+    """
+    For every CSV member in the ZIP byte stream `chunks`, write
+      {prefix}/raw/{stem}__{tag}.csv                    (bytes as downloaded)
+      {prefix}/curated/{stem}__{tag}__with_metrics.csv  (transform(raw) output)
+      parquet/YEAR={year}/QUARTER={q}/{stem}__{tag}.parquet  (if parquet_types)
+    to the dataset container, the same names handle_year uses for local files.
+    Returns [(curated_blob, rows), ...]. On any error no blob is committed.
+    If `digests` is given it is filled with {raw file name: sha256 of the CSV}.
+    With `with_range_index` the transform is asked for sorted output plus its
+    byte-range index, uploaded next to the curated blob (range_index.py). The
+    sort buffers the whole file's lines, so memory is no longer bounded.
+    With `with_stats` the transform's batches are also counted per ORIGIN x
+    QUARTER into a sidecar next to the curated blob (file_stats.py).
+    With `with_cube` they are rolled up into the file's metric cube, likewise
+    uploaded next to the curated blob (metric_cube.py).
+    With `unchanged(raw file name, sha256, curated_blob)`, members it returns
+    True for are hashed and dropped: nothing is committed and they are left
+    out of the result (their digest is still reported). Needs raw_kw
+    overwrite=True, since changed members are transformed from the raw blob,
+    which is therefore committed before the transform runs.
+    """
+    if unchanged is not None and not (raw_kw or {}).get("overwrite"):
+        raise ValueError("unchanged= needs raw_kw overwrite=True")
+    raw_kw = {"content_type": "text/csv", **(raw_kw or {})}
+    curated_kw = {"content_type": "text/csv", **(curated_kw or {})}
+    written = []
+    for member in iter_zip_members(chunks):
+        p = PurePosixPath(member.name)
+        if p.suffix.lower() != ".csv":
+            logger.debug("[ingest_zip_stream] skipping non-CSV member %s", member.name)
+            continue
+        raw_blob = f"{prefix}/raw/{p.stem}__{tag}.csv"
+        curated_blob = f"{prefix}/curated/{p.stem}__{tag}__with_metrics.csv"
+        raw_name = PurePosixPath(raw_blob).name
+
+        source = None
+        if unchanged is not None:
+            h = hashlib.sha256()
+            with ds_open_writer(dataset, "raw", raw_blob, **raw_kw) as raw_w:
+                for chunk in iter(lambda: member.read(READ_BUFFER), b""):
+                    raw_w.write(chunk)
+                    h.update(chunk)
+                skip = unchanged(raw_name, h.hexdigest(), curated_blob)
+                if skip:
+                    raw_w.abort()
+            if digests is not None:
+                digests[raw_name] = h.hexdigest()
+            if skip:
+                logger.info("[ingest_zip_stream] ⏭️ %s unchanged since the last ingest", raw_blob)
+                continue
+            raw = get_container_client(DATASETS[dataset]).get_blob_client(raw_blob)
+            source = io.BufferedReader(ChunkReader(raw.download_blob().chunks()), buffer_size=READ_BUFFER)
+
+        pq_kw = {k: v for k, v in curated_kw.items() if k != "content_type"}
+        pq_writer = (parquet_tier.blob_writer(dataset, year, f"{p.stem}__{tag}.parquet", parquet_types, **pq_kw)
+                     if parquet_types else nullcontext())
+
+        raw_writer = ds_open_writer(dataset, "raw", raw_blob, **raw_kw) if source is None else nullcontext()
+        with raw_writer as raw_w, \
+             ds_open_writer(dataset, "curated", curated_blob, **curated_kw) as cur_w, \
+             pq_writer as pq_w:
+            h = hashlib.sha256() if digests is not None and source is None else None
+            src = source or io.BufferedReader(TeeReader(member, raw_w, h), buffer_size=READ_BUFFER)
+            ranges = {} if with_range_index else None
+            extra = {"index": ranges} if ranges is not None else {}
+            cube = metric_cube.CubeBuilder(then=pq_w) if with_cube else None
+            stats = file_stats.StatsCounter(then=cube or pq_w) if with_stats else None
+            rows = transform(src, cur_w, on_batch=stats or cube or pq_w, **extra)
+            while src.read(READ_BUFFER):    # anything after the last parsed row still goes to raw
+                pass
+
+        # after the commit: the sidecars record the curated blob's ETag
+        for blob, content, content_type in curated_sidecars(curated_blob, cur_w.etag, size=cur_w.bytes_written,
+                                                            rows=rows, ranges=ranges, stats=stats, cube=cube):
+            ds_upload_bytes(dataset, "curated", content, blob, content_type=content_type,
+                            overwrite=curated_kw.get("overwrite", False))
+        if h is not None:
+            digests[raw_name] = h.hexdigest()
+        logger.info("[ingest_zip_stream] ✅ %s rows=%d raw_bytes=%d", curated_blob, rows, member.size)
+        written.append((curated_blob, rows))
+    return written
@@ -1,16 +1,35 @@
-import io, re, zipfile, argparse, requests, tempfile, os
-from bs4 import BeautifulSoup
+import io, re, zipfile, argparse, requests, tempfile, os, logging, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path 
 from datetime import datetime
 from ..paths import dataset_out
-from ..storage_helper import upload_file
-from .transform_helper import add_columns
+from ..storage_helper import UploadQueue, upload_file
+from .transform_helper import add_columns, transform_stream, METRICS, PARQUET_TYPES
 from datetime import date
-from typing import Optional
-from ..datasets import ds_upload
+from typing import Callable, Optional
+from ..datasets import ds_upload, ds_upload_bytes
+from ..stream_ingest import curated_sidecars, ingest_zip_stream
+from .. import file_stats, ingest_state, metric_cube, parquet_tier, range_index
+from ..aspnet_form import FormRejected, get_form_state, post_with_form_state
 
 DATASET = "t100"
 
+# BTS_STREAM_INGEST=1: unzip/transform/upload straight from the POST body, no local files
+STREAM_INGEST = os.getenv("BTS_STREAM_INGEST", "0").lower() not in {"0", "false", "no"}
+CHUNK_SIZE = int(os.getenv("BTS_STREAM_CHUNK_SIZE", "65536"))
+# BTS_STREAM_RANGE_INDEX=1: sorted curated output + range index in streaming mode too. Sorting
+# holds every serialized line of the file in memory, which gives up streaming's bounded memory;
+# off by default (those years are read whole by the download endpoints)
+STREAM_RANGE_INDEX = os.getenv("BTS_STREAM_RANGE_INDEX", "0").lower() not in {"0", "false", "no"}
+
+# Backfill scheduler: years in flight at once, and a polite cap on simultaneous BTS downloads.
+# With IN_FLIGHT > MAX_CONCURRENT, one year's transform/upload overlaps the next year's download.
+BACKFILL_IN_FLIGHT = int(os.getenv("BTS_BACKFILL_IN_FLIGHT", "3"))
+BTS_MAX_CONCURRENT = int(os.getenv("BTS_MAX_CONCURRENT_REQUESTS", "2"))
+_BTS_SLOTS = threading.BoundedSemaphore(max(1, BTS_MAX_CONCURRENT))
+
+logger = logging.getLogger("t100.fetch")
+
 PAGE = "https://www.transtats.bts.gov/DL_SelectFields.aspx?gnoyr_VQ=FMG&QO_fu146_anzr=Nv4+Pn44vr45"
 #PARAMS = {"gnoyr_VQ": "FMG", "QO_fu146_anzr": "Nv4 Pn44vr45"} 
 
@@ -38,7 +57,21 @@ FIELDS = [
     "YEAR","QUARTER","MONTH","DISTANCE_GROUP","CLASS","DATA_SOURCE"
 ]
 
-def get_tokens(session: requests.Session) -> dict:
+# what the export/download endpoints can project to: the BTS fields plus the derived metrics
+SELECTABLE_COLUMNS = FIELDS + list(METRICS)
+
+def parse_columns(spec: Optional[str]) -> Optional[list]:
+    """`columns=` query value -> column names in request order (None = all columns).
+    Raises ValueError naming any column that isn't in SELECTABLE_COLUMNS."""
+    if not spec or spec.strip().upper() == "ALL":
+        return None
+    cols = list(dict.fromkeys(c.strip().upper() for c in spec.split(",") if c.strip()))
+    unknown = [c for c in cols if c not in SELECTABLE_COLUMNS]
+    if unknown:
+        raise ValueError(f"unknown column(s): {', '.join(unknown)}")
+    return cols or None
+
+def _fetch_form_page(session: requests.Session) -> str:
     session.get("https://www.transtats.bts.gov/", timeout=30)
     r = session.get(PAGE, timeout=30)  
     print("History:", [ (h.status_code, h.headers.get("Location")) for h in r.history ])
@@ -49,39 +82,48 @@ def get_tokens(session: requests.Session) -> dict:
     if "__viewstate" not in txt or "__eventvalidation" not in txt:
         Path("page_debug.html").write_text(r.text, encoding="utf-8")
         raise RuntimeError("Did not receive ASP.NET form. Saved to page_debug.html")
+    return r.text
 
-    soup = BeautifulSoup(r.text, "html.parser")
-    def val(name):
-        tag = soup.find("input", {"name": name})
-        if not tag:
-            raise KeyError(f"Missing hidden field: {name}")
-        return tag["value"]
-    return {
-        "__VIEWSTATE": val("__VIEWSTATE"),
-        "__VIEWSTATEGENERATOR": val("__VIEWSTATEGENERATOR"),
-        "__EVENTVALIDATION": val("__EVENTVALIDATION"),
+def get_tokens(session: requests.Session) -> dict:
+    # shared per-process cache (BTS_FORM_CACHE_TTL_S); only GETs the page on a miss
+    return dict(get_form_state(PAGE, session, _fetch_form_page).tokens)
+
+def _post_form(session: requests.Session, year, geography, period, **kw) -> requests.Response:
+    """POST the download form with cached tokens; refetch them once if BTS rejects the POST."""
+    def post(state):
+        dr = session.post(PAGE, headers=HEADERS, data=_payload(state.tokens, year, geography, period),
+                          timeout=300, **kw)
+        print("POST", dr.status_code, "bytes:", dr.headers.get("Content-Length"))
+        try:
+            dr.raise_for_status()
+            ct = (dr.headers.get("Content-Type") or "").lower()
+            if ("zip" not in ct) and ("application/octet-stream" not in ct):
+                raise FormRejected(f"Expected ZIP, got Content-Type={ct}")
+        except Exception:
+            dr.close()
+            raise
+        return dr
+    return post_with_form_state(PAGE, session, _fetch_form_page, post)
+
+def _payload(tokens: dict, year, geography, period) -> dict:
+    payload = {
+        **tokens,
+        "__EVENTTARGET":"", "__EVENTARGUMENT":"", "__LASTFOCUS":"",
+        "cboGeography": geography,
+        "cboYear": str(year),
+        "cboPeriod": "All" if str(period).lower()=="all" else str(int(period)),
+        "chkAllVars":"on",
+        "btnDownload":"Download",
     }
+    for f in FIELDS:
+        payload[f] = "on"
+    return payload
 
 def run(year="2025", geography="All", period="All") -> Path:
     outdir = dataset_out("t100", f"year={year}")
     with requests.Session() as s:
         s.headers.update(HEADERS)
-        tokens = get_tokens(s)
-        payload = {
-            **tokens,
-            "__EVENTTARGET":"", "__EVENTARGUMENT":"", "__LASTFOCUS":"",
-            "cboGeography": geography,
-            "cboYear": str(year),
-            "cboPeriod": "All" if str(period).lower()=="all" else str(int(period)),
-            "chkAllVars":"on",
-            "btnDownload":"Download",
-        }
-        for f in FIELDS:
-            payload[f] = "on"
-
-        dr = s.post(PAGE, headers=HEADERS, data=payload, timeout=300)
-        print("POST", dr.status_code, "bytes:", dr.headers.get("Content-Length"))
-        dr.raise_for_status()
+        dr = _post_form(s, year, geography, period)
 
         disp = dr.headers.get("Content-Disposition","")
         m = re.search(r'filename="?([^";]+)"?', disp)
@@ -96,32 +138,170 @@ def run(year="2025", geography="All", period="All") -> Path:
         print(f"Extracted CSVs to {outdir.resolve()}")
         return outdir
 
-def handle_year(year: str, geography: str = "All", period: str = "All") -> None:
-    outdir = run(year=year, geography=geography, period=period)
+def run_streaming(year="2025", geography="All", period="All",
+                  digests: Optional[dict] = None,
+                  unchanged: Optional[Callable[[str, str, str], bool]] = None) -> list[tuple[str, int]]:
+    """
+    Same result as run() + the upload loop in handle_year, without local files:
+    the ZIP is decoded off the socket and raw/curated CSVs go straight into
+    staged block blobs. Returns [(curated_blob, rows), ...]; fills `digests`
+    with {raw file name: sha256} if given. Files `unchanged` accepts are
+    hashed only (see ingest_zip_stream) and not in the result.
+    """
+    with requests.Session() as s:
+        s.headers.update(HEADERS)
+        with _post_form(s, year, geography, period, stream=True) as dr:
+            written = ingest_zip_stream(
+                dr.iter_content(CHUNK_SIZE),
+                dataset=DATASET,
+                prefix=str(year),
+                tag=str(year),
+                transform=transform_stream,
+                raw_kw={"overwrite": True},
+                curated_kw={"overwrite": True},
+                year=year,
+                parquet_types=PARQUET_TYPES if parquet_tier.ENABLED else None,
+                digests=digests,
+                with_range_index=range_index.ENABLED and STREAM_RANGE_INDEX,
+                with_stats=file_stats.ENABLED,
+                with_cube=metric_cube.ENABLED,
+                unchanged=unchanged,
+            )
+    print(f"Streamed {len(written)} CSV(s) for {year} to blob")
+    return written
+
+def _curated_name(raw_name: str) -> str:
+    return raw_name.replace(".csv", "__with_metrics.csv")
+
+def _upload_curated(local_path: str, curated_blob: str, **sidecar_kw) -> None:
+    """Upload a curated CSV, then its sidecars (curated_sidecars), which record the ETag it got."""
+    etag = ds_upload(DATASET, "curated", local_path, curated_blob, content_type="text/csv", overwrite=True)
+    for blob, content, content_type in curated_sidecars(curated_blob, etag, **sidecar_kw):
+        ds_upload_bytes(DATASET, "curated", content, blob, content_type=content_type, overwrite=True)
+
+def handle_year(year: str, geography: str = "All", period: str = "All",
+                streaming: Optional[bool] = None) -> bool:
+    """
+    Download, transform and upload one year. Returns False if the download
+    hashed the same as the last ingest (state/{year}.json), in which case the
+    transform and uploads are skipped and the manifest is not flagged.
+    """
+    if STREAM_INGEST if streaming is None else streaming:
+        # download and transform are interleaved here, so the whole ingest holds the slot;
+        # each file is hashed before its transform, which only runs if it changed
+        digests: dict = {}
+        state = ingest_state.load_state(DATASET, year)
+        with _BTS_SLOTS:
+            written = run_streaming(year=year, geography=geography, period=period, digests=digests,
+                                    unchanged=ingest_state.file_check(DATASET, state))
+        if not written and ingest_state.is_unchanged(
+                DATASET, year, digests, [f"{year}/curated/{_curated_name(n)}" for n in digests]):
+            logger.info("[handle_year] ⏭️ %s: content unchanged since last ingest; nothing rewritten", year)
+            return False
+        # files skipped as unchanged keep their recorded row counts
+        rows = {n: v.get("rows") for n, v in (state or {}).get("files", {}).items() if n in digests}
+        rows.update({Path(b).name.replace("__with_metrics.csv", ".csv"): n for b, n in written})
+        ingest_state.record(DATASET, year, digests, rows)
+        return True
+
+    # only the token GET + POST count against the BTS cap; transform/upload run outside it
+    with _BTS_SLOTS:
+        outdir = run(year=year, geography=geography, period=period)
+    csv_files = sorted(outdir.glob("*.csv"))
+    digests = {p.name: ingest_state.file_sha256(p) for p in csv_files}
+    if ingest_state.is_unchanged(DATASET, year, digests,
+                                 [f"{year}/curated/{_curated_name(p.name)}" for p in csv_files]):
+        logger.info("[handle_year] ⏭️ %s: content unchanged since last ingest; skipping transform/upload", year)
+        return False
+
     outdir_updated = dataset_out(DATASET, f"year={year}", "updated")
-    for initial_file in sorted(outdir.glob("*.csv")):
-        # Add ASM & RPM columns
-        updated_file = outdir_updated / initial_file.name.replace(".csv", "__with_metrics.csv")
-        add_columns(initial_file, updated_file)
-
-        # Upload both raw and with-metrics versions
-        # If your storage_helper now requires container=, add it here.
-        ds_upload(DATASET, "raw",
-                  str(initial_file),
-                  f"{year}/raw/{initial_file.name}",
-                  content_type="text/csv")
-
-        ds_upload(DATASET, "curated",
-                  str(updated_file),
-                  f"{year}/curated/{updated_file.name}",
-                  content_type="text/csv")
+    outdir_parquet = dataset_out(DATASET, f"year={year}", "parquet")
+    rows = {}
+    # uploads run in the background while the next transform works; the content
+    # changed, so each one replaces what's there
+    with UploadQueue() as uploads:
+        for initial_file in csv_files:
+            uploads.submit(ds_upload, DATASET, "raw",
+                           str(initial_file),
+                           f"{year}/raw/{initial_file.name}",
+                           content_type="text/csv", overwrite=True)
+
+            # Add ASM & RPM columns (and the typed Parquet copy from the same batches)
+            # (sorted by ORIGIN/QUARTER with a byte-range sidecar, see range_index.py)
+            updated_file = outdir_updated / _curated_name(initial_file.name)
+            curated_blob = f"{year}/curated/{updated_file.name}"
+            pq_name = f"{initial_file.stem}.parquet"
+            ranges = {} if range_index.ENABLED else None
+            # airport x quarter counts for the manifest and the metric cube come from
+            # the same batches (file_stats.py, metric_cube.py)
+            def hooks(pq_writer=None):
+                cube = metric_cube.CubeBuilder(then=pq_writer) if metric_cube.ENABLED else None
+                stats = file_stats.StatsCounter(then=cube or pq_writer) if file_stats.ENABLED else None
+                return stats, cube, stats or cube or pq_writer
+            if parquet_tier.ENABLED:
+                with parquet_tier.local_writer(outdir_parquet, pq_name, PARQUET_TYPES) as pq_writer:
+                    stats, cube, on_batch = hooks(pq_writer)
+                    rows[initial_file.name] = add_columns(initial_file, updated_file,
+                                                          on_batch=on_batch, index=ranges)
+                pq_parts = pq_writer.rows
+            else:
+                stats, cube, on_batch = hooks()
+                rows[initial_file.name] = add_columns(initial_file, updated_file, on_batch=on_batch, index=ranges)
+                pq_parts = {}
+
+            uploads.submit(_upload_curated, str(updated_file), curated_blob,
+                           size=updated_file.stat().st_size, rows=rows[initial_file.name],
+                           ranges=ranges, stats=stats, cube=cube)
+            uploads.submit(parquet_tier.upload_local_parts,
+                           DATASET, year, outdir_parquet, pq_name, pq_parts, overwrite=True)
+
+    ingest_state.record(DATASET, year, digests, rows)
+    return True
 
 def run_all_years(start: int = 1990, end: Optional[int] = None,
-                  geo: str = "All", period: str = "All") -> None:
+                  geo: str = "All", period: str = "All", *,
+                  max_in_flight: Optional[int] = None,
+                  skip: Optional[Callable[[int], bool]] = None) -> list[int]:
+    """
+    Backfill [start, end] with up to `max_in_flight` years in progress at once
+    (default BTS_BACKFILL_IN_FLIGHT). BTS downloads are additionally capped by
+    BTS_MAX_CONCURRENT_REQUESTS, so extra in-flight years spend their time in
+    transform/upload while the next year downloads. Years for which
+    `skip(year)` is true (e.g. curated blob already exists) are not started.
+    Returns the years processed; raises after all years finish if any failed.
+    """
     if end is None:
         end = date.today().year
+    if max_in_flight is None:
+        max_in_flight = BACKFILL_IN_FLIGHT
+
+    todo = []
     for y in range(start, end + 1):
-        handle_year(str(y), geography=geo, period=period)
+        if skip is not None and skip(y):
+            logger.info("[run_all_years] ⏭️ %s: already uploaded — skipping", y)
+            continue
+        todo.append(y)
+    if not todo:
+        return []
+
+    logger.info("[run_all_years] %d year(s) to process, in_flight=%d bts_cap=%d",
+                len(todo), max_in_flight, BTS_MAX_CONCURRENT)
+    failed = []
+    # years are submitted oldest first and the pool is FIFO, so downloads go in order
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight), thread_name_prefix="t100-year") as ex:
+        futures = {ex.submit(handle_year, str(y), geo, period): y for y in todo}
+        for fut in as_completed(futures):
+            y = futures[fut]
+            try:
+                fut.result()
+                logger.info("[run_all_years] ✅ %s done", y)
+            except Exception:
+                logger.exception("[run_all_years] ❌ %s failed", y)
+                failed.append(y)
+
+    if failed:
+        raise RuntimeError(f"T-100 backfill failed for year(s): {sorted(failed)}")
+    return todo
 
 
 if __name__ == "__main__":
@@ -129,5 +309,7 @@ if __name__ == "__main__":
     ap.add_argument("--year", default="2025")
     ap.add_argument("--geo",  default="All")
     ap.add_argument("--period", default="All", help='All or 1..12')
+    ap.add_argument("--stream", action="store_true", help="zero-disk streaming ingest")
     args = ap.parse_args()
-    handle_year(year=args.year, geography=args.geo, period=args.period)
\ No newline at end of file
+    handle_year(year=args.year, geography=args.geo, period=args.period,
+                streaming=True if args.stream else None)
\ No newline at end of file
@@ -1,36 +1,50 @@
-import csv
 from pathlib import Path
+from typing import BinaryIO, Optional
 
-def add_columns(source_path: Path, new_path: Path) -> None:
-    new_path.parent.mkdir(parents=True, exist_ok=True)
-    with source_path.open("r", newline='', encoding="utf-8") as source_file, \
-        new_path.open("w", newline= '', encoding="utf-8") as new_file:
-        reader = csv.DictReader(source_file)
-        existing_columns = list(reader.fieldnames or [])
-        for newcol in ("ASM", "RPM"):
-            if newcol not in existing_columns:
-                existing_columns.append(newcol)
-        writer = csv.DictWriter(new_file, fieldnames=existing_columns)
-        writer.writeheader()
+import pyarrow as pa
+
+from ..columnar import BatchHook, RangeIndex, add_product_columns
+from ..range_index import SORT_KEYS
 
-        for row in reader:
-            # robust parse: handles "0.00", "1,234", blanks
-            def num(s):
-                if s is None: return 0.0
-                s = s.strip().replace(",", "")
-                if s == "": return 0.0
-                try:
-                    return float(s)
-                except ValueError:
-                    return 0.0
+# new column -> (factor, factor)
+METRICS = {
+    "ASM": ("SEATS", "DISTANCE"),
+    "RPM": ("PASSENGERS", "DISTANCE"),
+}
 
-            seats = num(row.get("SEATS"))
-            pax   = num(row.get("PASSENGERS"))
-            dist  = num(row.get("DISTANCE"))
+# Parquet tier column types; anything not listed stays a plain string
+_CODE = pa.dictionary(pa.int32(), pa.string())
+PARQUET_TYPES = {
+    **{c: pa.float64() for c in (
+        "DEPARTURES_SCHEDULED", "DEPARTURES_PERFORMED", "PAYLOAD", "SEATS", "PASSENGERS",
+        "FREIGHT", "MAIL", "DISTANCE", "RAMP_TO_RAMP", "AIR_TIME")},
+    **{c: pa.int32() for c in (
+        "AIRLINE_ID", "CARRIER_GROUP", "CARRIER_GROUP_NEW",
+        "ORIGIN_AIRPORT_ID", "ORIGIN_AIRPORT_SEQ_ID", "ORIGIN_CITY_MARKET_ID", "ORIGIN_STATE_FIPS", "ORIGIN_WAC",
+        "DEST_AIRPORT_ID", "DEST_AIRPORT_SEQ_ID", "DEST_CITY_MARKET_ID", "DEST_STATE_FIPS", "DEST_WAC",
+        "AIRCRAFT_GROUP", "AIRCRAFT_TYPE", "AIRCRAFT_CONFIG",
+        "YEAR", "QUARTER", "MONTH", "DISTANCE_GROUP")},
+    **{c: _CODE for c in (
+        "UNIQUE_CARRIER", "UNIQUE_CARRIER_NAME", "UNIQUE_CARRIER_ENTITY", "REGION", "CARRIER", "CARRIER_NAME",
+        "ORIGIN", "ORIGIN_CITY_NAME", "ORIGIN_STATE_ABR", "ORIGIN_STATE_NM", "ORIGIN_COUNTRY", "ORIGIN_COUNTRY_NAME",
+        "DEST", "DEST_CITY_NAME", "DEST_STATE_ABR", "DEST_STATE_NM", "DEST_COUNTRY", "DEST_COUNTRY_NAME",
+        "CLASS", "DATA_SOURCE")},
+    "ASM": pa.int64(),
+    "RPM": pa.int64(),
+}
 
-            asm = seats * dist
-            rpm = pax * dist
-            row["ASM"] = str(int(round(asm)))
-            row["RPM"] = str(int(round(rpm)))
 
-            writer.writerow(row)
\ No newline at end of file
+def transform_stream(source: BinaryIO, dest: BinaryIO, on_batch: Optional[BatchHook] = None,
+                     index: Optional[RangeIndex] = None) -> int:
+    """Columnar ASM/RPM transform between two binary CSV streams. Returns row count.
+    With `index`, rows are written sorted by ORIGIN/QUARTER and `index` gets the
+    byte range of each (origin, quarter) group (see pipeline/range_index.py)."""
+    return add_product_columns(source, dest, METRICS, on_batch=on_batch,
+                               sort_by=SORT_KEYS if index is not None else None, index=index)
+
+def add_columns(source_path: Path, new_path: Path, on_batch: Optional[BatchHook] = None,
+                index: Optional[RangeIndex] = None) -> int:
+    """Write `new_path` = `source_path` plus ASM and RPM columns. Returns row count."""
+    new_path.parent.mkdir(parents=True, exist_ok=True)
+    with source_path.open("rb") as source_file, new_path.open("wb") as new_file:
+        return transform_stream(source_file, new_file, on_batch=on_batch, index=index)
@@ -0,0 +1,96 @@
+# azure_func/pipeline/zip_members.py
+"""
+ZIP archives whose members are compressed independently.
+
+Each MemberWriter emits a complete, self-delimiting member (local header,
+raw deflate stream, zip64 data descriptor) into its own output, so members
+can be produced in parallel, e.g. as separate runs of staged blocks in one
+blob. central_directory() then closes the archive once the members' order
+and lengths are known. Readers see an ordinary zip64 archive.
+"""
+import struct
+import time
+import zlib
+from typing import List
+
+_ZIP64_VERSION = 45
+_FLAGS = 0x08 | 0x800          # sizes in the data descriptor, UTF-8 names
+_DEFLATED = 8
+_MAX32 = 0xFFFFFFFF
+_MAX16 = 0xFFFF
+
+
+def _dos_datetime(ts: float):
+    t = time.localtime(ts)
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 4) | t.tm_mday)
+
+
+class MemberWriter:
+    """
+    One deflated member written to `out` (anything with write(bytes)).
+    Write the member's bytes, then close(); `length` is the member's size
+    in the archive, including header and descriptor.
+    """
+
+    def __init__(self, name: str, out, level: int = 6):
+        self.name = name
+        self._out = out
+        self._z = zlib.compressobj(level, zlib.DEFLATED, -15)
+        self.dostime, self.dosdate = _dos_datetime(time.time())
+        self.crc = 0
+        self.file_size = 0
+        self.compress_size = 0
+        self.length = 0
+        self.closed = False
+        raw = name.encode("utf-8")
+        extra = struct.pack("<HHQQ", 1, 16, 0, 0)
+        self._emit(struct.pack("<LHHHHHLLLHH", 0x04034B50, _ZIP64_VERSION, _FLAGS, _DEFLATED,
+                               self.dostime, self.dosdate, 0, _MAX32, _MAX32, len(raw), len(extra))
+                   + raw + extra)
+
+    def _emit(self, data: bytes) -> None:
+        if data:
+            self._out.write(data)
+            self.length += len(data)
+
+    def write(self, data) -> int:
+        self.crc = zlib.crc32(data, self.crc)
+        self.file_size += len(data)
+        packed = self._z.compress(data)
+        self.compress_size += len(packed)
+        self._emit(packed)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        tail = self._z.flush()
+        self.compress_size += len(tail)
+        self._emit(tail)
+        self._emit(struct.pack("<LLQQ", 0x08074B50, self.crc, self.compress_size, self.file_size))
+        self.closed = True
+
+
+def central_directory(members: List[MemberWriter], start: int = 0) -> bytes:
+    """Central directory + zip64 end records for closed `members`, laid out back to back from `start`."""
+    entries, offset = [], start
+    for m in members:
+        raw = m.name.encode("utf-8")
+        extra = struct.pack("<HHQQQ", 1, 24, m.file_size, m.compress_size, offset)
+        entries.append(struct.pack("<LHHHHHHLLLHHHHHLL", 0x02014B50, _ZIP64_VERSION, _ZIP64_VERSION,
+                                   _FLAGS, _DEFLATED, m.dostime, m.dosdate, m.crc, _MAX32, _MAX32,
+                                   len(raw), len(extra), 0, 0, 0, 0o644 << 16, _MAX32)
+                       + raw + extra)
+        offset += m.length
+    cd = b"".join(entries)
+    n = len(members)
+    eocd64 = struct.pack("<LQHHLLQQQQ", 0x06064B50, 44, _ZIP64_VERSION, _ZIP64_VERSION, 0, 0,
+                         n, n, len(cd), offset)
+    locator = struct.pack("<LLQL", 0x07064B50, 0, offset + len(cd), 1)
+    eocd = struct.pack("<LHHHHLLH", 0x06054B50, 0, 0, min(n, _MAX16), min(n, _MAX16),
+                       min(len(cd), _MAX32), min(offset, _MAX32), 0)
+    return cd + eocd64 + locator + eocd
@@ -0,0 +1,180 @@
+# azure_func/pipeline/zipstream.py
+"""
+Read ZIP members straight off an HTTP body without buffering or seeking.
+
+zipfile.ZipFile needs the central directory at the end of the archive, so it
+can't start until the whole download is in memory or on disk. BTS archives are
+plain deflate members with local headers, which is enough to decode them in
+order as the bytes arrive.
+"""
+import io, struct, zlib
+from typing import Iterable, Iterator, Optional, Tuple
+
+_LOCAL_SIG = 0x04034B50
+_DESCRIPTOR_SIG = 0x08074B50
+_CENTRAL_SIG = 0x02014B50
+_END_SIG = 0x06054B50
+
+_FLAG_DESCRIPTOR = 0x08
+_STORED, _DEFLATED = 0, 8
+
+
+class _ChunkSource:
+    """Pull-based byte reader over an iterator of chunks, with push-back."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._it = iter(chunks)
+        self._buf = b""
+        self.eof = False
+
+    def _fill(self) -> bool:
+        for chunk in self._it:
+            if chunk:
+                self._buf += chunk
+                return True
+        self.eof = True
+        return False
+
+    def read_exact(self, n: int) -> bytes:
+        while len(self._buf) < n:
+            if not self._fill():
+                raise EOFError(f"ZIP stream ended early (wanted {n} bytes, have {len(self._buf)})")
+        out, self._buf = self._buf[:n], self._buf[n:]
+        return out
+
+    def read_some(self, limit: int) -> bytes:
+        if not self._buf and not self._fill():
+            return b""
+        out, self._buf = self._buf[:limit], self._buf[limit:]
+        return out
+
+    def unread(self, data: bytes) -> None:
+        self._buf = data + self._buf
+
+
+class ZipMemberReader(io.RawIOBase):
+    """Decompressed bytes of the current member. Must be read to EOF before the
+    next member can be reached; CRC is checked when the member ends."""
+
+    def __init__(self, src: _ChunkSource, name: str, flags: int, method: int,
+                 crc: int, csize: Optional[int], zip64: bool):
+        self.name = name
+        self._src = src
+        self._flags = flags
+        self._method = method
+        self._crc_expected = crc
+        self._remaining = csize          # compressed bytes left (None = unknown)
+        self._zip64 = zip64
+        self._zlib = zlib.decompressobj(-15) if method == _DEFLATED else None
+        self._pending = b""
+        self._pos = 0                    # read offset into _pending
+        self._crc = 0
+        self.size = 0
+        self.done = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _next_compressed(self) -> bytes:
+        want = 1 << 16
+        if self._remaining is not None:
+            want = min(want, self._remaining)
+            if want == 0:
+                raise EOFError(f"ZIP member {self.name} is truncated")
+        data = self._src.read_some(want)
+        if not data:
+            raise EOFError(f"ZIP stream ended inside member {self.name}")
+        if self._remaining is not None:
+            self._remaining -= len(data)
+        return data
+
+    def _produce(self) -> bytes:
+        if self._method == _STORED:
+            if self._remaining == 0:
+                self._finish()
+                return b""
+            return self._next_compressed()
+
+        while True:
+            if self._zlib.eof:
+                self._src.unread(self._zlib.unused_data)
+                self._finish()
+                return b""
+            out = self._zlib.decompress(self._next_compressed())
+            if out:
+                return out
+
+    def _finish(self) -> None:
+        if self._flags & _FLAG_DESCRIPTOR:
+            head = self._src.read_exact(4)
+            if struct.unpack("<I", head)[0] != _DESCRIPTOR_SIG:
+                self._src.unread(head)      # signature is optional
+            crc = struct.unpack("<I", self._src.read_exact(4))[0]
+            self._src.read_exact(16 if self._zip64 else 8)
+            self._crc_expected = crc
+        if self._crc & 0xFFFFFFFF != self._crc_expected:
+            raise zlib.error(f"CRC mismatch in ZIP member {self.name}")
+        self.done = True
+
+    def readinto(self, b) -> int:
+        while self._pos >= len(self._pending) and not self.done:
+            self._pending, self._pos = self._produce(), 0
+            self._crc = zlib.crc32(self._pending, self._crc)
+            self.size += len(self._pending)
+        n = min(len(b), len(self._pending) - self._pos)
+        if n <= 0:
+            return 0
+        b[:n] = memoryview(self._pending)[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def drain(self) -> None:
+        while self.read(1 << 20):
+            pass
+
+
+def _parse_zip64_extra(extra: bytes) -> Tuple[bool, Optional[int]]:
+    i = 0
+    while i + 4 <= len(extra):
+        hid, ln = struct.unpack("<HH", extra[i:i + 4])
+        if hid == 0x0001:
+            body = extra[i + 4:i + 4 + ln]
+            csize = struct.unpack("<Q", body[8:16])[0] if len(body) >= 16 else None
+            return True, csize
+        i += 4 + ln
+    return False, None
+
+
+def iter_zip_members(chunks: Iterable[bytes]) -> Iterator[ZipMemberReader]:
+    """
+    Yield a ZipMemberReader per file in the archive, in archive order.
+    Each reader is drained automatically if the caller moves on early.
+    """
+    src = _ChunkSource(chunks)
+    while True:
+        try:
+            sig = struct.unpack("<I", src.read_exact(4))[0]
+        except EOFError:
+            return
+        if sig in (_CENTRAL_SIG, _END_SIG):
+            return
+        if sig != _LOCAL_SIG:
+            raise zlib.error(f"Not a ZIP local header (signature {sig:#x})")
+
+        (_ver, flags, method, _t, _d, crc, csize, _usize,
+         nlen, xlen) = struct.unpack("<HHHHHIIIHH", src.read_exact(26))
+        name = src.read_exact(nlen).decode("cp437" if not flags & 0x800 else "utf-8")
+        zip64, csize64 = _parse_zip64_extra(src.read_exact(xlen))
+        if csize == 0xFFFFFFFF:
+            csize = csize64
+
+        if method not in (_STORED, _DEFLATED):
+            raise NotImplementedError(f"ZIP compression method {method} in {name}")
+        if method == _STORED and flags & _FLAG_DESCRIPTOR:
+            raise NotImplementedError(f"Stored member {name} with data descriptor can't be streamed")
+
+        known = None if flags & _FLAG_DESCRIPTOR else csize
+        member = ZipMemberReader(src, name, flags, method, crc, known, zip64)
+        yield member
+        if not member.done:
+            member.drain()
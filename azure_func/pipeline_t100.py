@@ -4,16 +4,13 @@ import os
 import logging
 from datetime import date
 import azure.functions as func
-from .pipeline.t100.fetch import handle_year
-from azure.storage.blob import BlobServiceClient
+from .pipeline.t100.fetch import handle_year, run_all_years
 from .function_app import app
+from .pipeline import blob_clients
 
 
 def _get_blob_service():
-    conn = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-    if not conn:
-        raise RuntimeError("AZURE_STORAGE_CONNECTION_STRING is not set")
-    return BlobServiceClient.from_connection_string(conn)
+    return blob_clients.service()
 
 def _ensure_container(container: str):
     bsc = _get_blob_service()
@@ -23,8 +20,7 @@ def _ensure_container(container: str):
         pass  # already exists
 
 def _blob_exists(container: str, name: str) -> bool:
-    bsc = _get_blob_service()
-    bc = bsc.get_container_client(container)
+    bc = blob_clients.container(container)
     try:
         bc.get_blob_client(name).get_blob_properties()
         return True
@@ -33,8 +29,7 @@ def _blob_exists(container: str, name: str) -> bool:
 
 def _touch_blob(container: str, name: str):
     _ensure_container(container)
-    bsc = _get_blob_service()
-    bc = bsc.get_container_client(container)
+    bc = blob_clients.container(container)
     bc.upload_blob(name, b"", overwrite=True)
 
 @app.function_name(name="BtsPipelineTimer")
@@ -61,24 +56,23 @@ def BtsPipelineTimer(myTimer: func.TimerRequest):
         if not _blob_exists(container, marker_blob):
             logging.info("Starting one-time BTS backfill for all years (resume-safe)...")
             _ensure_container(container)
-            bsc = _get_blob_service()
-            bc = bsc.get_container_client(container)
+            bc = blob_clients.container(container)
 
             start_year = 1990
             end_year = date.today().year
 
-            for y in range(start_year, end_year + 1):
+            def curated_exists(y: int) -> bool:
                 # what the pipeline uploads for curated file
                 blob_name = f"{y}/curated/T_T100_SEGMENT_ALL_CARRIER__{y}__with_metrics.csv"
                 try:
                     bc.get_blob_client(blob_name).get_blob_properties()
-                    logging.info(f"✅ {y}: already uploaded — skipping")
-                    continue
+                    return True
                 except Exception:
                     logging.info(f"🚀 {y}: not found — running handle_year")
+                    return False
 
-                # run only the missing year
-                handle_year(str(y), geography=geo, period=period)
+            # run only the missing years, several in flight (BTS_BACKFILL_IN_FLIGHT)
+            run_all_years(start_year, end_year, geo=geo, period=period, skip=curated_exists)
 
             _touch_blob(container, marker_blob)
             logging.info("Backfill complete; marker written. Future runs will skip backfill.")
@@ -89,6 +83,6 @@ def BtsPipelineTimer(myTimer: func.TimerRequest):
     # Always process the current year incrementally (BTS updates through the year)
     cy = str(date.today().year)
     logging.info(f"Running monthly incremental for current year {cy}...")
-    handle_year(cy, geography=geo, period=period)
+    changed = handle_year(cy, geography=geo, period=period)
     _touch_blob(container, month_marker)
-    logging.info("Monthly incremental complete.")
+    logging.info("Monthly incremental complete%s.", "" if changed else " (no new BTS data; nothing reprocessed)")
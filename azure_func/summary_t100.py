@@ -0,0 +1,81 @@
+# summary_t100.py
+import asyncio, json, os, time
+from datetime import date
+import azure.functions as func
+import pyarrow as pa
+from .function_app import app
+from .pipeline import aio_blobs, blob_clients, manifest_store, metric_cube
+
+CONTAINER = os.getenv("BTS_CONTAINER", "bts-t100")
+# first year the manifest job covers; bounds the range when there is no manifest yet
+START_YEAR = int(os.getenv("BTS_START_YEAR", "1990"))
+
+
+def _abc():
+    return blob_clients.aio_container(CONTAINER)
+
+def _parse_list(value, allowed=None) -> list:
+    """Comma list -> upper-cased values ([] for missing/ALL); ValueError naming any not in `allowed`."""
+    items = [v.strip().upper() for v in (value or "").split(",") if v.strip()]
+    if not items or "ALL" in items:
+        return []
+    if allowed is not None:
+        unknown = [v for v in items if v not in allowed]
+        if unknown:
+            raise ValueError(f"unknown {', '.join(unknown)} (choose from {', '.join(allowed)})")
+    return list(dict.fromkeys(items))
+
+# ---------- HTTP function ----------
+@app.function_name(name="SummaryT100")
+@app.route(route="summary", auth_level=func.AuthLevel.FUNCTION)
+async def summary(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    SUMs of the T-100 measures from the year metric cubes (metric_cube.py), e.g.
+      ?year_from=2019&year_to=2023&origin=DFW&group_by=YEAR,CARRIER&measures=PASSENGERS,SEATS
+    origin/dest/carrier/quarters take comma lists (default ALL), group_by any of
+    metric_cube.KEYS (default none = one total row), measures any of MEASURES.
+    """
+    t0 = time.perf_counter()
+    try:
+        yf = int(req.params.get("year_from"))
+        yt = int(req.params.get("year_to"))
+    except Exception:
+        return func.HttpResponse("Provide ?year_from=&year_to=", status_code=400)
+    if yt < yf:
+        return func.HttpResponse("year_to must not be before year_from", status_code=400)
+    try:
+        filters = {
+            "QUARTER": [int(q) for q in _parse_list(req.params.get("quarters"), ("1", "2", "3", "4"))],
+            "ORIGIN": _parse_list(req.params.get("origin")),
+            "DEST": _parse_list(req.params.get("dest")),
+            "CARRIER": _parse_list(req.params.get("carrier")),
+        }
+        group_by = _parse_list(req.params.get("group_by"), metric_cube.KEYS)
+        measures = _parse_list(req.params.get("measures"), metric_cube.MEASURES) or list(metric_cube.MEASURES)
+    except ValueError as e:
+        return func.HttpResponse(str(e), status_code=400)
+
+    # only years that can have a cube: the manifest's, or the ingested span if there is none yet
+    abc = _abc()
+    manifest = await manifest_store.load(abc)
+    known = manifest.years() if manifest is not None else range(START_YEAR, date.today().year + 1)
+    years = [y for y in known if yf <= y <= yt]
+    # one cube per year, kept in worker memory and revalidated by ETag
+    cubes = await aio_blobs.gather_bounded(lambda y: manifest_store.load_cube(abc, y), years)
+    found = [(y, c) for y, c in zip(years, cubes) if c is not None]
+    if not found:
+        return func.HttpResponse("No metric cube for these years yet", status_code=503)
+
+    # years are disjoint, so the cubes just stack
+    table = pa.concat_tables([c for _, c in found])
+    rows = await asyncio.to_thread(metric_cube.query, table, filters=filters,
+                                   group_by=group_by, measures=measures)
+    payload = {
+        "years": [y for y, _ in found],
+        "filters": {k.lower(): v or "ALL" for k, v in filters.items()},
+        "group_by": group_by,
+        "measures": measures,
+        "rows": rows,
+        "elapsed_ms": round((time.perf_counter() - t0) * 1e3, 1),
+    }
+    return func.HttpResponse(json.dumps(payload), mimetype="application/json", status_code=200)
@@ -0,0 +1,5 @@
+# tests import the package the way the function host does: azure_func/ on sys.path
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
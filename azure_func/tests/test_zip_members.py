@@ -0,0 +1,83 @@
+"""Split-ZIP layout: members staged concurrently into segments of one block blob."""
+import asyncio
+import io
+import random
+import zipfile
+
+from pipeline import zip_members
+from pipeline.aio_blobs import AsyncBlockBlobWriter
+
+
+class _FakeBlob:
+    """In-memory stand-in for the aio BlobClient calls AsyncBlockBlobWriter makes."""
+
+    container_name = "test"
+    blob_name = "export.zip"
+
+    def __init__(self):
+        self.staged = {}
+        self.order = []            # block ids in staging order
+        self.committed = []        # block ids in blob order
+        self.data = None
+
+    async def stage_block(self, block_id, data):
+        await asyncio.sleep(0)     # let other segments run in between
+        self.staged[block_id] = bytes(data)
+        self.order.append(block_id)
+
+    async def commit_block_list(self, blocks, **kw):
+        self.committed = [b.id for b in blocks]
+        self.data = b"".join(self.staged[i] for i in self.committed)
+
+
+def _member_data(seed: int, rows: int) -> bytes:
+    rnd = random.Random(seed)
+    lines = [f"{2000 + seed},{rnd.randint(1, 4)},ATL,{rnd.randint(0, 9999)}.00\n" for _ in range(rows)]
+    return ("YEAR,QUARTER,ORIGIN,SEATS\n" + "".join(lines)).encode() + rnd.randbytes(rows)
+
+
+def _build(contents: dict, block_size: int) -> _FakeBlob:
+    blob = _FakeBlob()
+
+    async def main():
+        async with AsyncBlockBlobWriter(blob, block_size=block_size,
+                                        content_type="application/zip") as sink:
+            segments = [await sink.segment() for _ in contents]
+
+            async def member(name, data, seg):
+                zm = zip_members.MemberWriter(name, seg)
+                for i in range(0, len(data), 1000):
+                    zm.write(data[i:i + 1000])
+                    await seg.drain()
+                zm.close()
+                await seg.close()
+                return zm
+
+            # later members are given less data, so they finish (and stage) first
+            done = await asyncio.gather(*(member(n, d, s) for (n, d), s in zip(contents.items(), segments)))
+            sink.write(zip_members.central_directory(list(done)))
+
+    asyncio.run(main())
+    return blob
+
+
+def test_segments_form_a_valid_archive():
+    contents = {f"t100_ALL_ALL_{2000 + i}.csv": _member_data(i, 4000 // (i + 1)) for i in range(3)}
+    blob = _build(contents, block_size=4096)
+
+    # blocks were staged out of archive order, yet commit puts them back in place
+    assert sorted(blob.order) == sorted(blob.committed)
+    assert blob.order != blob.committed
+    with zipfile.ZipFile(io.BytesIO(blob.data)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == list(contents)
+        for name, data in contents.items():
+            assert zf.read(name) == data
+
+
+def test_empty_member():
+    contents = {"empty.csv": b"", "one.csv": b"YEAR\n2024\n"}
+    blob = _build(contents, block_size=64)
+    with zipfile.ZipFile(io.BytesIO(blob.data)) as zf:
+        assert zf.testzip() is None
+        assert {n: zf.read(n) for n in zf.namelist()} == contents
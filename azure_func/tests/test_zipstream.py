@@ -0,0 +1,112 @@
+"""iter_zip_members against archives written by zipfile, fed in small chunks."""
+import io
+import random
+import struct
+import zipfile
+
+import pytest
+
+from pipeline.zipstream import iter_zip_members
+
+# odd size so headers, data and descriptors straddle chunk boundaries
+CHUNK = 777
+
+
+class _Unseekable(io.RawIOBase):
+    """Write-only sink; zipfile falls back to data descriptors for it."""
+
+    def __init__(self):
+        super().__init__()
+        self.data = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.data += b
+        return len(b)
+
+
+def _payload(seed: int, size: int = 50_000) -> bytes:
+    rnd = random.Random(seed)
+    text = "".join(f"{rnd.randint(1990, 2025)},{rnd.randint(1, 4)},ATL,{rnd.random():.2f}\n"
+                   for _ in range(size // 20)).encode()
+    return text + rnd.randbytes(size // 10)     # some incompressible bytes too
+
+
+def _archive(members: dict, *, seekable: bool, compression=zipfile.ZIP_DEFLATED,
+             force_zip64: bool = False) -> bytes:
+    out = io.BytesIO() if seekable else _Unseekable()
+    with zipfile.ZipFile(out, "w", compression=compression) as zf:
+        for name, data in members.items():
+            info = zipfile.ZipInfo(name)
+            info.compress_type = compression
+            with zf.open(info, "w", force_zip64=force_zip64) as f:
+                f.write(data)
+    return out.getvalue() if seekable else bytes(out.data)
+
+
+def _chunks(data: bytes):
+    for i in range(0, len(data), CHUNK):
+        yield data[i:i + CHUNK]
+
+
+def _read_all(data: bytes) -> dict:
+    return {m.name: m.read() for m in iter_zip_members(_chunks(data))}
+
+
+def _local_extra(data: bytes) -> bytes:
+    """Extra field of the first member's local header."""
+    nlen, xlen = struct.unpack("<HH", data[26:30])
+    return data[30 + nlen:30 + nlen + xlen]
+
+
+def _has_descriptor(data: bytes) -> bool:
+    return all(info.flag_bits & 0x08 for info in zipfile.ZipFile(io.BytesIO(data)).infolist())
+
+
+@pytest.mark.parametrize("seekable", [True, False], ids=["sizes-in-header", "data-descriptor"])
+def test_deflated_member(seekable):
+    members = {"T_T100_SEGMENT_ALL_CARRIER.csv": _payload(1)}
+    data = _archive(members, seekable=seekable)
+    assert _has_descriptor(data) is not seekable
+    assert _read_all(data) == members
+
+
+@pytest.mark.parametrize("seekable", [True, False], ids=["sizes-in-header", "data-descriptor"])
+def test_zip64_member(seekable):
+    members = {"big.csv": _payload(2)}
+    data = _archive(members, seekable=seekable, force_zip64=True)
+    assert _local_extra(data)[:2] == b"\x01\x00"      # zip64 extended information
+    assert _read_all(data) == members
+
+
+def test_multiple_members_in_order():
+    members = {f"part{i}.csv": _payload(10 + i, size=5_000 * (i + 1)) for i in range(4)}
+    members["empty.csv"] = b""
+    for seekable in (True, False):
+        data = _archive(members, seekable=seekable)
+        got = list(iter_zip_members(_chunks(data)))
+        assert [m.name for m in got] == list(members)
+        assert _read_all(data) == members
+
+
+def test_member_left_unread_is_skipped():
+    members = {"a.csv": _payload(20), "b.csv": _payload(21)}
+    it = iter_zip_members(_chunks(_archive(members, seekable=False)))
+    first = next(it)
+    first.read(100)
+    assert next(it).read() == members["b.csv"]
+
+
+def test_stored_member_with_data_descriptor_is_rejected():
+    data = _archive({"x.csv": b"a,b\n1,2\n"}, seekable=False, compression=zipfile.ZIP_STORED)
+    assert _has_descriptor(data)
+    with pytest.raises(NotImplementedError, match="data descriptor"):
+        next(iter_zip_members(_chunks(data)))
+
+
+def test_stored_member_with_sizes_in_header():
+    members = {"x.csv": b"a,b\n1,2\n" * 500}
+    data = _archive(members, seekable=True, compression=zipfile.ZIP_STORED)
+    assert _read_all(data) == members